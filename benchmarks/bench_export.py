@@ -0,0 +1,205 @@
+"""Time `pmx export` on synthetic collections, offline
+
+    python benchmarks/bench_export.py [--shape small --shape large] [-j 1 -j 4] [--stream]
+
+Each run happens in a fresh interpreter so peak RSS is its own. The fetch step
+is skipped: the generated collection is dropped straight into the workspace.
+"""
+
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import count_requests, generate_collection  # noqa: E402
+
+# depth, fanout, requests per folder, script lines, payload bytes
+SHAPES: Dict[str, Tuple[int, int, int, int, int]] = {
+    "small": (1, 2, 4, 16, 256),
+    "medium": (2, 3, 8, 16, 512),
+    "large": (3, 4, 10, 32, 1024),
+    "wide": (1, 40, 5, 16, 512),
+    "long-scripts": (1, 3, 8, 200, 512),
+    "big-payloads": (1, 3, 8, 16, 65536),
+}
+
+
+def tree_size(path: str, exclude: Tuple[str, ...] = ("collection.json",)) -> int:
+    total: int = 0
+    for root, _, files in os.walk(path):
+        for afile in files:
+            if afile not in exclude:
+                total += os.path.getsize(os.path.join(root, afile))
+    return total
+
+
+def run_once(
+    collection_path: str,
+    workspace: str,
+    jobs: int,
+    stream: bool,
+    batch_format: bool = False,
+) -> Dict[str, Any]:
+    """Export collection_path into workspace in this process and measure it"""
+    from pmx_ import main
+
+    main.prepare_workspace(workspace)
+    shutil.copyfile(collection_path, os.path.join(workspace, "collection.json"))
+
+    start: float = time.perf_counter()
+    cpu_start: float = time.process_time()
+    # no black cache, so every run is cold
+    main.export_collection(jobs, force=True, stream=stream, batch_format=batch_format)
+    wall: float = time.perf_counter() - start
+
+    # ru_maxrss is in KiB on linux
+    return {
+        "wall": wall,
+        "cpu": time.process_time() - cpu_start,
+        "peak_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "worker_peak_rss": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        * 1024,
+        "output_bytes": tree_size(workspace),
+    }
+
+
+def run_isolated(
+    collection_path: str,
+    workspace: str,
+    jobs: int,
+    stream: bool,
+    batch_format: bool = False,
+) -> Dict[str, Any]:
+    result_path: str = os.path.join(os.path.dirname(workspace), "result.json")
+    command: List[str] = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--single",
+        collection_path,
+        "--workspace",
+        workspace,
+        "--result",
+        result_path,
+        "-j",
+        str(jobs),
+    ]
+    if stream:
+        command.append("--stream")
+    if batch_format:
+        command.append("--batch-format")
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    with open(result_path, "r") as reader:
+        return json.load(reader)
+
+
+@click.command()
+@click.option(
+    "--shape",
+    "shapes",
+    multiple=True,
+    type=click.Choice(list(SHAPES)),
+    help="Collection shape(s) to run; defaults to small, medium and large",
+)
+@click.option("-j", "--jobs", "jobs_list", multiple=True, type=int, default=[1])
+@click.option("--stream", is_flag=True, help="Export with --stream")
+@click.option("--batch-format", is_flag=True, help="Export with --batch-format")
+@click.option("-r", "--repeat", default=1, help="Runs per case; the fastest is kept")
+@click.option("--report", type=str, help="Also write the results here as json")
+@click.option("--keep", type=str, help="Keep the last workspace of each case here")
+@click.option("--single", type=str, hidden=True)
+@click.option("--workspace", type=str, hidden=True)
+@click.option("--result", type=str, hidden=True)
+def main(
+    shapes: Tuple[str, ...],
+    jobs_list: Tuple[int, ...],
+    stream: bool,
+    batch_format: bool,
+    repeat: int,
+    report: Optional[str],
+    keep: Optional[str],
+    single: Optional[str],
+    workspace: Optional[str],
+    result: Optional[str],
+) -> None:
+    if single:
+        with open(result, "w") as writer:  # type: ignore
+            json.dump(
+                run_once(single, workspace, jobs_list[0], stream, batch_format),  # type: ignore
+                writer,
+            )
+        return
+
+    results: List[Dict[str, Any]] = []
+    print(
+        f"{'shape':<14}{'jobs':>5}{'requests':>10}{'wall s':>9}{'req/s':>9}"
+        f"{'rss MB':>9}{'worker MB':>11}{'out MB':>9}"
+    )
+    for shape in shapes or ("small", "medium", "large"):
+        depth, fanout, requests, script_lines, payload_size = SHAPES[shape]
+        collection: Dict[str, Any] = generate_collection(
+            depth, fanout, requests, script_lines, payload_size
+        )
+        n_requests: int = count_requests(collection)
+        with tempfile.TemporaryDirectory(prefix="pmx_bench_") as tmp:
+            collection_path: str = os.path.join(tmp, "collection.json")
+            with open(collection_path, "w") as writer:
+                json.dump(collection, writer, indent=2)
+            del collection
+
+            for jobs in jobs_list:
+                runs: List[Dict[str, Any]] = []
+                for i in range(repeat):
+                    case_dir: str = os.path.join(tmp, f"j{jobs}_{i}")
+                    os.makedirs(case_dir)
+                    runs.append(
+                        run_isolated(
+                            collection_path,
+                            os.path.join(case_dir, "scenes"),
+                            jobs,
+                            stream,
+                            batch_format,
+                        )
+                    )
+                best: Dict[str, Any] = min(runs, key=lambda r: r["wall"])
+                best.update(
+                    {
+                        "shape": shape,
+                        "jobs": jobs,
+                        "stream": stream,
+                        "batch_format": batch_format,
+                        "requests": n_requests,
+                        "collection_bytes": os.path.getsize(collection_path),
+                        "requests_per_sec": n_requests / best["wall"],
+                    }
+                )
+                results.append(best)
+                print(
+                    f"{shape:<14}{jobs:>5}{n_requests:>10}{best['wall']:>9.2f}"
+                    f"{best['requests_per_sec']:>9.1f}"
+                    f"{best['peak_rss'] / 2**20:>9.1f}"
+                    f"{best['worker_peak_rss'] / 2**20:>11.1f}"
+                    f"{best['output_bytes'] / 2**20:>9.2f}"
+                )
+                if keep:
+                    shutil.copytree(
+                        os.path.join(case_dir, "scenes"),
+                        os.path.join(keep, f"{shape}_j{jobs}"),
+                        dirs_exist_ok=True,
+                    )
+
+    if report:
+        with open(report, "w") as writer:
+            json.dump(results, writer, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Compare pmx_.pm.translate against the old line-by-line translation
+
+    python benchmarks/bench_translate.py [path/to/collection.json] [-r 20]
+
+Without a collection the scripts come from a small built-in corpus. Outputs of
+both implementations are checked for equality before anything is timed.
+"""
+
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import click
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.legacy_translate import (  # noqa: E402
+    extract_collection_event_vars,
+    extract_request_event_vars,
+)
+from pmx_.pm import translate  # noqa: E402
+
+TEST_SCRIPT: List[str] = [
+    'pm.test("Status code is 201", function () {',
+    "    pm.response.to.have.status(201);",
+    "});",
+    "var jsonData = pm.response.json();",
+    'pm.environment.set("quote_id", jsonData.data.id);',
+    'pm.environment.set("policy_id", jsonData.id);',
+    'pm.environment.set("pni_relation_id", jsonData.included);',
+    'pm.environment.set("status", jsonData.data.attributes.status);',
+    '    pm.expect(jsonData.data.attributes.status).to.eql("quoted");',
+    "pm.expect(jsonData.data.attributes.status_reasons).to.eql([]);",
+    "pm.expect(jsonData.data).to.have.lengthOf(3);",
+    'pm.environment.set("coverage_id", jsonData.included.find(',
+    '    c => c.type == "coverage" && c.attributes.name == "x"',
+    ")).id;",
+    "setTimeout(function(){}, 1500);",
+]
+PRE_SCRIPT: List[str] = [
+    "let ts = moment().unix()",
+    'pm.environment.set("ts", ts);',
+    'var effective = moment().add(1, "days");',
+    'pm.environment.set("effective", effective.format("YYYY-MM-DD"));',
+    'var quote = pm.environment.get("quote_id");',
+    'let policy = pm.variables.get("policy_id");',
+]
+FOLDER_SCRIPT: List[str] = [
+    'pm.variables.set("boost_user", "{{user}}");',
+    'pm.variables.set("product", "cyber");',
+]
+
+
+def collect_scripts(
+    path: Optional[str],
+) -> Tuple[List[Sequence[str]], List[Sequence[str]]]:
+    if not path:
+        return [TEST_SCRIPT, PRE_SCRIPT] * 200, [FOLDER_SCRIPT] * 50
+
+    request_scripts: List[Sequence[str]] = []
+    folder_scripts: List[Sequence[str]] = []
+
+    def _walk(item: Dict[str, Any]) -> None:
+        is_folder: bool = "item" in item
+        for event in item.get("event", []):
+            lines: List[str] = event.get("script", {}).get("exec", [])
+            if is_folder:
+                folder_scripts.append(lines)
+            else:
+                request_scripts.append(lines)
+        for child in item.get("item", []):
+            _walk(child)
+
+    with open(path, "r") as reader:
+        for root in json.load(reader).get("collection", {}).get("item", []):
+            _walk(root)
+    return request_scripts, folder_scripts
+
+
+def time_it(fn: Callable[[Sequence[str]], Any], scripts, repeat: int) -> float:
+    start: float = time.perf_counter()
+    for _ in range(repeat):
+        for script in scripts:
+            fn(script)
+    return time.perf_counter() - start
+
+
+def _legacy_or_none(fn, script) -> Optional[List[str]]:
+    try:
+        return fn(script)
+    except Exception:
+        # the old translator crashes on some scripts the new one warns about
+        return None
+
+
+@click.command()
+@click.argument("collection", required=False)
+@click.option("-r", "--repeat", default=20, help="Passes over the script corpus")
+def main(collection: Optional[str], repeat: int) -> None:
+    request_scripts, folder_scripts = collect_scripts(collection)
+
+    mismatches: int = 0
+    for scripts, old, new in (
+        (
+            request_scripts,
+            extract_request_event_vars,
+            translate.translate_request_script,
+        ),
+        (
+            folder_scripts,
+            extract_collection_event_vars,
+            translate.translate_collection_script,
+        ),
+    ):
+        for script in scripts:
+            expected: Optional[List[str]] = _legacy_or_none(old, script)
+            if expected is not None and expected != new(script):
+                mismatches += 1
+                print(f"MISMATCH: {script}")
+    print(
+        f"{len(request_scripts)} request scripts, {len(folder_scripts)} folder scripts, "
+        f"{len(set(map(tuple, request_scripts)))} distinct, {mismatches} mismatches"
+    )
+
+    def _cold(fn):
+        def _run(script):
+            translate.clear_cache()
+            return fn(script)
+
+        return _run
+
+    legacy: float = time_it(extract_request_event_vars, request_scripts, repeat)
+    cold: float = time_it(
+        _cold(translate.translate_request_script), request_scripts, repeat
+    )
+    translate.clear_cache()
+    warm: float = time_it(translate.translate_request_script, request_scripts, repeat)
+
+    print(f"legacy:          {legacy:.3f}s")
+    print(f"translate, cold: {cold:.3f}s ({legacy / cold:.1f}x)")
+    print(f"translate, warm: {warm:.3f}s ({legacy / warm:.1f}x)")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""Generate postman v2.1 collections of a given shape for benchmarking the exporter
+
+    python benchmarks/synthetic.py -o big.json --depth 3 --fanout 4 --requests 12
+
+Scripts are built only from constructs pmx_.pm.translate understands, so the
+generated collections exercise the same code paths as the real ones.
+"""
+
+import json
+import os
+import random
+import sys
+from typing import Any, Dict, List, Optional
+
+import click
+
+SCHEMA: str = "https://schema.getpostman.com/json/collection/v2.1.0/collection.json"
+METHODS: List[str] = ["POST", "GET", "PATCH", "GET", "PUT", "DELETE"]
+RESOURCES: List[str] = ["quotes", "policies", "endorsements", "applications"]
+
+# {n} is replaced with something unique to the request when scripts aren't shared
+TEST_LINES: List[str] = [
+    'pm.test("Status code is 200", function () {',
+    "    pm.response.to.have.status(200);",
+    "});",
+    "var jsonData = pm.response.json();",
+    'pm.environment.set("quote_id_{n}", jsonData.data.id);',
+    'pm.environment.set("policy_id_{n}", jsonData.id);',
+    'pm.environment.set("pni_relation_id_{n}", jsonData.included);',
+    'pm.environment.set("additional_insured_{n}", jsonData.included);',
+    'pm.environment.set("status_{n}", jsonData.data.attributes.status);',
+    '    pm.expect(jsonData.data.attributes.status).to.eql("quoted");',
+    "pm.expect(jsonData.data.attributes.status_reasons).to.eql([]);",
+    "pm.expect(jsonData.data).to.have.lengthOf(1);",
+    'pm.environment.set("coverage_id_{n}", jsonData.included.find(',
+    '    c => c.type == "coverage" && c.attributes.name == "cyber_{n}"',
+    ")).id;",
+    "setTimeout(function(){}, 10);",
+]
+PRE_LINES: List[str] = [
+    "let ts_{n} = moment().unix()",
+    'pm.environment.set("ts_{n}", ts_{n});',
+    'var effective_{n} = moment().add(1, "days");',
+    'pm.environment.set("effective_{n}", effective_{n}.format("YYYY-MM-DD"));',
+    'var quote_{n} = pm.environment.get("quote_id");',
+    'let policy_{n} = pm.variables.get("policy_id");',
+    'pm.variables.set("literal_{n}", "value");',
+]
+
+
+def script(lines: List[str], length: int, tag: str) -> List[str]:
+    """At least length lines, repeating lines whole so multi-line constructs stay intact"""
+    if length <= 0:
+        return []
+    repeats: int = -(-length // len(lines))
+    return [line.replace("{n}", f"{tag}_{i}") for i in range(repeats) for line in lines]
+
+
+def payload(size: int, rng: random.Random) -> str:
+    body: Dict[str, Any] = {
+        "data": {
+            "type": "quote",
+            "attributes": {"quote_id": "{{quote_id}}", "notes": str()},
+        }
+    }
+    padding: int = max(size - len(json.dumps(body)), 0)
+    body["data"]["attributes"]["notes"] = "".join(
+        rng.choices("abcdefghijklmnopqrstuvwxyz ", k=padding)
+    )
+    return json.dumps(body, indent=2)
+
+
+def request(
+    name: str,
+    index: int,
+    rng: random.Random,
+    script_lines: int,
+    payload_size: int,
+    tag: str,
+) -> Dict[str, Any]:
+    method: str = METHODS[index % len(METHODS)]
+    resource: str = RESOURCES[index % len(RESOURCES)]
+    item: Dict[str, Any] = {
+        "name": name,
+        "request": {
+            "method": method,
+            "header": [
+                {"key": "Content-Type", "value": "application/json"},
+                {"key": "BOOST-USER", "value": "{{boost_user}}"},
+            ],
+            "url": {
+                "raw": f"{{{{BOOST_URL}}}}/api/{resource}/{{{{quote_id}}}}",
+                "host": ["{{BOOST_URL}}"],
+                "path": ["api", resource, "{{quote_id}}"],
+            },
+        },
+        "event": [
+            {
+                "listen": "test",
+                "script": {
+                    "exec": script(TEST_LINES, script_lines, tag),
+                    "type": "text/javascript",
+                },
+            }
+        ],
+        "response": [],
+    }
+    if method != "GET":
+        item["request"]["body"] = {
+            "mode": "raw",
+            "raw": payload(payload_size, rng),
+            "options": {"raw": {"language": "json"}},
+        }
+    if index % 2 == 0:
+        item["event"].insert(
+            0,
+            {
+                "listen": "prerequest",
+                "script": {
+                    "exec": script(PRE_LINES, max(script_lines // 2, 1), tag),
+                    "type": "text/javascript",
+                },
+            },
+        )
+    return item
+
+
+def token_request() -> Dict[str, Any]:
+    return {
+        "name": "Get token",
+        "request": {
+            "method": "POST",
+            "header": [],
+            "body": {
+                "mode": "urlencoded",
+                "urlencoded": [
+                    {"key": "client_id", "value": "{{client_id}}"},
+                    {"key": "client_secret", "value": "{{client_secret}}"},
+                    {"key": "grant_type", "value": "client_credentials"},
+                ],
+            },
+            "url": {"raw": "{{BOOST_URL}}/auth/oauth2/token"},
+        },
+        "response": [],
+    }
+
+
+def generate_collection(
+    depth: int = 2,
+    fanout: int = 3,
+    requests: int = 8,
+    script_lines: int = 16,
+    payload_size: int = 512,
+    roots: int = 2,
+    shared_scripts: bool = True,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """A collection of roots trees, each depth folders deep with fanout sub folders
+
+    Every folder holds a token request and `requests` others. With shared_scripts
+    every request reuses the same test script, as hand-built collections tend to.
+    """
+    rng: random.Random = random.Random(seed)
+    counter: List[int] = [0]
+
+    def folder(name: str, level: int) -> Dict[str, Any]:
+        items: List[Dict[str, Any]] = [token_request()]
+        for i in range(requests):
+            counter[0] += 1
+            tag: str = "x" if shared_scripts else str(counter[0])
+            items.append(
+                request(
+                    f"{name} {RESOURCES[i % len(RESOURCES)]} step {i}",
+                    i,
+                    rng,
+                    script_lines,
+                    payload_size,
+                    tag,
+                )
+            )
+        if level < depth:
+            for j in range(fanout):
+                items.append(folder(f"{name} Sub {j}", level + 1))
+        return {
+            "name": name,
+            "item": items,
+            "event": [
+                {
+                    "listen": "prerequest",
+                    "script": {
+                        "exec": [
+                            'pm.variables.set("boost_user", "{{boost_user}}");',
+                            f'pm.variables.set("folder", "{name}");',
+                        ],
+                        "type": "text/javascript",
+                    },
+                }
+            ],
+        }
+
+    return {
+        "collection": {
+            "info": {
+                "_postman_id": "00000000-0000-0000-0000-000000000000",
+                "name": "pmx synthetic",
+                "schema": SCHEMA,
+            },
+            "item": [folder(f"Root {k}", 0) for k in range(roots)],
+            "variable": [
+                {"key": "BOOST_URL", "value": "http://localhost:8000"},
+                {"key": "client_id", "value": "client"},
+                {"key": "client_secret", "value": "secret"},
+            ],
+        }
+    }
+
+
+def count_requests(collection: Dict[str, Any]) -> int:
+    """Requests the exporter turns into code, i.e. minus the token requests"""
+
+    def _exported(item: Dict[str, Any]) -> bool:
+        raw: str = item.get("request", {}).get("url", {}).get("raw", str())
+        return "request" in item and "auth/oauth2/token" not in raw
+
+    def _count(items: List[Dict[str, Any]]) -> int:
+        return sum(_count(i["item"]) if "item" in i else _exported(i) for i in items)
+
+    return _count(collection["collection"]["item"])
+
+
+@click.command()
+@click.option("-o", "--output", type=str, help="Write here instead of stdout")
+@click.option("--depth", default=2, help="Folder nesting below each root")
+@click.option("--fanout", default=3, help="Sub folders per folder")
+@click.option("--requests", default=8, help="Requests per folder")
+@click.option("--script-lines", default=16, help="Lines per test script")
+@click.option("--payload-size", default=512, help="Bytes per request body")
+@click.option("--roots", default=2, help="Top level folders")
+@click.option("--unique-scripts", is_flag=True, help="Don't share scripts")
+@click.option("--seed", default=0)
+def main(
+    output: Optional[str],
+    depth: int,
+    fanout: int,
+    requests: int,
+    script_lines: int,
+    payload_size: int,
+    roots: int,
+    unique_scripts: bool,
+    seed: int,
+) -> None:
+    collection: Dict[str, Any] = generate_collection(
+        depth,
+        fanout,
+        requests,
+        script_lines,
+        payload_size,
+        roots,
+        not unique_scripts,
+        seed,
+    )
+    if output:
+        with open(output, "w") as writer:
+            json.dump(collection, writer, indent=2)
+        print(
+            f"{count_requests(collection)} requests, "
+            f"{os.path.getsize(output)} bytes written to {output}",
+            file=sys.stderr,
+        )
+    else:
+        json.dump(collection, sys.stdout, indent=2)
+
+
+if __name__ == "__main__":
+    main()
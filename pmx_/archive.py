@@ -0,0 +1,260 @@
+import functools
+import os
+import struct
+import threading
+import time
+import zipfile
+import zlib
+from collections import deque
+from concurrent import futures
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+COMPRESSION_METHODS: Dict[str, int] = {
+    "stored": zipfile.ZIP_STORED,
+    "deflated": zipfile.ZIP_DEFLATED,
+    "bzip2": zipfile.ZIP_BZIP2,
+    "lzma": zipfile.ZIP_LZMA,
+}
+# flag bits zipfile sets or reads from a member's header
+DATA_DESCRIPTOR: int = 0x08
+LZMA_EOS: int = 0x02
+# zipfile internals write_raw needs, see raw_members()
+ZIP_INTERNALS: Tuple[str, ...] = (
+    "_lock",
+    "_writecheck",
+    "_didModify",
+    "fp",
+    "start_dir",
+)
+
+
+def walk_export(
+    export_dir: str,
+    dir_excludes: Sequence[str] = (),
+    file_excludes: Sequence[str] = (),
+) -> Iterator[Tuple[str, str]]:
+    """(path, arcname) of each file to archive, skipping excluded dirs entirely"""
+    parent: str = os.path.dirname(os.path.abspath(export_dir))
+    for root, dirs, files in os.walk(export_dir):
+        # pruning in place keeps os.walk out of them
+        dirs[:] = sorted(i for i in dirs if i not in dir_excludes)
+        for afile in sorted(files):
+            if afile not in file_excludes:
+                path: str = os.path.join(root, afile)
+                yield path, os.path.relpath(path, parent)
+
+
+def raw_members(zf: zipfile.ZipFile) -> bool:
+    """Whether this zipfile has the internals to take pre-compressed members"""
+    return hasattr(zipfile, "_get_compressor") and all(
+        hasattr(zf, i) for i in ZIP_INTERNALS
+    )
+
+
+def compress(
+    zinfo: zipfile.ZipInfo, data: bytes, level: Optional[int], raw: bool = True
+) -> Tuple[zipfile.ZipInfo, bytes]:
+    """Fill in zinfo for data and compress it the way ZipFile.writestr would
+
+    Without raw, data is handed back as is for ZipFile.writestr to compress.
+    """
+    zinfo.file_size = len(data)
+    zinfo.CRC = zlib.crc32(data)
+    zinfo.flag_bits = LZMA_EOS if zinfo.compress_type == zipfile.ZIP_LZMA else 0
+    if raw and zinfo.compress_type != zipfile.ZIP_STORED:
+        # zipfile has no public way to hand it pre-compressed data, see write_raw
+        compressor = zipfile._get_compressor(zinfo.compress_type, level)  # type: ignore
+        data = compressor.compress(data) + compressor.flush()
+    zinfo.compress_size = len(data)
+    return zinfo, data
+
+
+def compress_file(
+    path: str, arcname: str, compression: int, level: Optional[int], raw: bool = True
+) -> Tuple[zipfile.ZipInfo, bytes]:
+    zinfo: zipfile.ZipInfo = zipfile.ZipInfo.from_file(path, arcname)
+    zinfo.compress_type = compression
+    with open(path, "rb") as reader:
+        return compress(zinfo, reader.read(), level, raw)
+
+
+def compress_bytes(
+    arcname: str, data: bytes, compression: int, level: Optional[int], raw: bool = True
+) -> Tuple[zipfile.ZipInfo, bytes]:
+    zinfo: zipfile.ZipInfo = zipfile.ZipInfo(
+        arcname, date_time=time.localtime(time.time())[:6]
+    )
+    zinfo.external_attr = 0o644 << 16
+    zinfo.compress_type = compression
+    return compress(zinfo, data, level, raw)
+
+
+def write_raw(zf: zipfile.ZipFile, zinfo: zipfile.ZipInfo, raw: bytes) -> None:
+    """Append an already compressed member, as ZipFile.open(zinfo, "w") would"""
+    zip64: bool = max(zinfo.file_size, zinfo.compress_size) > zipfile.ZIP64_LIMIT
+    with zf._lock:  # type: ignore
+        zf.fp.seek(zf.start_dir)  # type: ignore
+        zinfo.header_offset = zf.fp.tell()  # type: ignore
+        zf._writecheck(zinfo)  # type: ignore
+        zf._didModify = True  # type: ignore
+        zf.fp.write(zinfo.FileHeader(zip64))  # type: ignore
+        zf.fp.write(raw)  # type: ignore
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[zinfo.filename] = zinfo
+        zf.start_dir = zf.fp.tell()  # type: ignore
+
+
+def read_raw(reader, zinfo: zipfile.ZipInfo) -> bytes:
+    """A member's compressed bytes, straight from an open zip file"""
+    reader.seek(zinfo.header_offset)
+    header: Tuple = struct.unpack(
+        zipfile.structFileHeader, reader.read(zipfile.sizeFileHeader)  # type: ignore
+    )
+    # skip the name and extra field, whose lengths are the header's last two fields
+    reader.seek(header[-2] + header[-1], 1)
+    return reader.read(zinfo.compress_size)
+
+
+def dos_time(zinfo: zipfile.ZipInfo) -> Tuple[int, ...]:
+    # zip timestamps have two second resolution
+    return (*zinfo.date_time[:5], zinfo.date_time[5] // 2 * 2)
+
+
+class ArchiveBuilder:
+    """Builds a zip with members compressed across a thread pool
+
+    zlib, bz2 and lzma all release the GIL, so threads are enough to use every
+    core. With update, members of an existing zip whose size and mtime (or
+    failing that, CRC) still match are copied over without recompressing.
+    Where zipfile lacks the internals for that, members are compressed by
+    ZipFile.writestr one at a time instead.
+    """
+
+    def __init__(
+        self,
+        zip_path: str,
+        compression: int = zipfile.ZIP_DEFLATED,
+        level: Optional[int] = None,
+        jobs: int = 0,
+        update: bool = False,
+    ) -> None:
+        self.zip_path: str = zip_path
+        self.compression: int = compression
+        self.level: Optional[int] = level
+        self.jobs: int = jobs or os.cpu_count() or 1
+        self.previous: Dict[str, zipfile.ZipInfo] = {}
+        if update and os.path.isfile(zip_path):
+            try:
+                with zipfile.ZipFile(zip_path, "r") as old:
+                    self.previous = {i.filename: i for i in old.infolist()}
+            except zipfile.BadZipFile:
+                pass
+        self.reused: int = 0
+        self.compressed: int = 0
+        self._lock: threading.Lock = threading.Lock()
+
+    def _unchanged(
+        self, zinfo: zipfile.ZipInfo, path: Optional[str], data: Optional[bytes]
+    ) -> Optional[zipfile.ZipInfo]:
+        old: Optional[zipfile.ZipInfo] = self.previous.get(zinfo.filename)
+        if (
+            not old
+            or old.compress_type != self.compression
+            or old.file_size != zinfo.file_size
+            or old.flag_bits & 0x01  # encrypted
+            # its header would need its zip64 extra field rebuilt
+            or max(old.file_size, old.compress_size) > zipfile.ZIP64_LIMIT
+        ):
+            return None
+        if dos_time(old) == dos_time(zinfo):
+            return old
+        if data is None:
+            with open(path, "rb") as reader:  # type: ignore
+                data = reader.read()
+        return old if zlib.crc32(data) == old.CRC else None
+
+    def build(
+        self,
+        files: Iterator[Tuple[str, str]],
+        extras: Optional[Dict[str, bytes]] = None,
+    ) -> List[str]:
+        """Write files and in-memory extras to zip_path, returning the arcnames"""
+        members: List[Tuple[str, Optional[str], Optional[bytes]]] = [
+            (arcname, None, data) for arcname, data in (extras or {}).items()
+        ]
+        members.extend((arcname, path, None) for path, arcname in files)
+
+        # the old zip is read from while the new one is written
+        tmp_path: str = f"{self.zip_path}.{os.getpid()}.tmp"
+        old_reader = open(self.zip_path, "rb") if self.previous else None
+        try:
+            with zipfile.ZipFile(tmp_path, "w") as zf:
+                raw: bool = raw_members(zf)
+                write: Callable[[zipfile.ZipInfo, bytes], None] = (
+                    functools.partial(write_raw, zf)
+                    if raw
+                    else functools.partial(self._write_plain, zf)
+                )
+                with futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                    # written in submission order so the layout is deterministic,
+                    # with a bounded number of compressed members waiting
+                    pending: Deque[futures.Future] = deque()
+                    for arcname, path, data in members:
+                        pending.append(
+                            executor.submit(
+                                self._member,
+                                arcname,
+                                path,
+                                data,
+                                old_reader if raw else None,
+                                raw,
+                            )
+                        )
+                        if len(pending) >= self.jobs * 8:
+                            write(*pending.popleft().result())
+                    while pending:
+                        write(*pending.popleft().result())
+            os.replace(tmp_path, self.zip_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        finally:
+            if old_reader:
+                old_reader.close()
+        return [arcname for arcname, _, _ in members]
+
+    def _write_plain(
+        self, zf: zipfile.ZipFile, zinfo: zipfile.ZipInfo, data: bytes
+    ) -> None:
+        zf.writestr(zinfo, data, compresslevel=self.level)
+
+    def _member(
+        self,
+        arcname: str,
+        path: Optional[str],
+        data: Optional[bytes],
+        old_reader,
+        raw: bool = True,
+    ) -> Tuple[zipfile.ZipInfo, bytes]:
+        if self.previous and old_reader:
+            if path:
+                zinfo: zipfile.ZipInfo = zipfile.ZipInfo.from_file(path, arcname)
+            else:
+                zinfo = zipfile.ZipInfo(arcname)
+                zinfo.file_size = len(data)  # type: ignore
+            old: Optional[zipfile.ZipInfo] = self._unchanged(zinfo, path, data)
+            if old:
+                # the old member's bytes are still right, only its offset changes
+                with self._lock:
+                    old_data: bytes = read_raw(old_reader, old)
+                    self.reused += 1
+                old.flag_bits &= ~DATA_DESCRIPTOR
+                return old, old_data
+
+        with self._lock:
+            self.compressed += 1
+        if path:
+            return compress_file(path, arcname, self.compression, self.level, raw)
+        return compress_bytes(
+            arcname, data, self.compression, self.level, raw  # type: ignore
+        )
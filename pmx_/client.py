@@ -1,11 +1,28 @@
+import asyncio
+import contextvars
+import functools
+import http.cookiejar
 import json
 import logging
 import os
+import tempfile
 import threading
 import time
-from typing import Any, Dict, Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+
+import downloads
+import metrics
+import persist
+import throttle
+
+try:
+    import httpx
+except ImportError:
+    # AsyncBoostClient falls back to HttpPool on worker threads
+    httpx = None
 
 
 def init_logging():
@@ -26,6 +43,266 @@ def init_logging():
 logger = init_logging()
 
 
+def _accept_encoding() -> str:
+    encodings: str = "gzip, deflate"
+    try:
+        import brotli  # noqa: F401
+
+        encodings += ", br"
+    except ImportError:
+        pass
+    return encodings
+
+
+class HttpPool:
+    """Connections shared by every BoostClient in the process, kept alive between calls
+
+    requests.Session isn't thread-safe, so each thread gets its own session, but all
+    of them are mounted on the one adapter, whose urllib3 pools are. pool_size is
+    the number of connections kept per host, hosts the number of hosts pooled.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        hosts: int = 10,
+        keep_alive: bool = True,
+        compression: bool = True,
+    ) -> None:
+        self.pool_size: int = pool_size
+        self.keep_alive: bool = keep_alive
+        self.compression: bool = compression
+        self.adapter: HTTPAdapter = metrics.TimedAdapter(
+            pool_connections=hosts, pool_maxsize=pool_size
+        )
+        self._local: threading.local = threading.local()
+
+    @classmethod
+    def from_env(cls) -> "HttpPool":
+        return cls(
+            pool_size=int(os.environ.get("PMX_HTTP_POOL_SIZE", 10)),
+            hosts=int(os.environ.get("PMX_HTTP_POOL_HOSTS", 10)),
+            keep_alive=os.environ.get("PMX_HTTP_KEEP_ALIVE", "1") != "0",
+            compression=os.environ.get("PMX_HTTP_COMPRESSION", "1") != "0",
+        )
+
+    @property
+    def session(self) -> requests.Session:
+        session: Optional[requests.Session] = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", self.adapter)
+            session.mount("https://", self.adapter)
+            session.headers["Connection"] = "keep-alive" if self.keep_alive else "close"
+            session.headers["Accept-Encoding"] = (
+                _accept_encoding() if self.compression else "identity"
+            )
+            # calls used to share nothing but connections, cookies stay that way
+            session.cookies.set_policy(
+                http.cookiejar.DefaultCookiePolicy(allowed_domains=[])
+            )
+            self._local.session = session
+        return session
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        return self.session.request(method, url, **kwargs)
+
+    def close(self) -> None:
+        self.adapter.close()
+
+
+HTTP_POOL: HttpPool = HttpPool.from_env()
+
+
+def configure_pool(**kwargs) -> HttpPool:
+    """Replace the shared pool, e.g. configure_pool(pool_size=32) from run.py"""
+    global HTTP_POOL
+
+    HTTP_POOL.close()
+    HTTP_POOL = HttpPool(**kwargs)
+    return HTTP_POOL
+
+
+async def to_thread(fn: Callable, *args, **kwargs) -> Any:
+    """fn(*args, **kwargs) on the default executor, in a copy of this context
+
+    asyncio.to_thread, which python 3.8 doesn't have yet.
+    """
+    call: Callable = functools.partial(
+        contextvars.copy_context().run, fn, *args, **kwargs
+    )
+    return await asyncio.get_running_loop().run_in_executor(None, call)
+
+
+class AsyncHttpPool:
+    """HttpPool for coroutines: one httpx.AsyncClient, made in the loop that uses it
+
+    httpx limits connections overall rather than per host, so the limit is
+    pool_size per host times hosts. Without httpx, requests go through HttpPool
+    on the default executor's threads instead.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 10,
+        hosts: int = 10,
+        keep_alive: bool = True,
+        compression: bool = True,
+    ) -> None:
+        self.pool_size: int = pool_size
+        self.hosts: int = hosts
+        self.keep_alive: bool = keep_alive
+        self.compression: bool = compression
+        self.client: Optional[Any] = None
+
+    @classmethod
+    def from_env(cls) -> "AsyncHttpPool":
+        pool: HttpPool = HttpPool.from_env()
+        return cls(
+            pool_size=pool.pool_size,
+            hosts=int(os.environ.get("PMX_HTTP_POOL_HOSTS", 10)),
+            keep_alive=pool.keep_alive,
+            compression=pool.compression,
+        )
+
+    def _client(self) -> Any:
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.pool_size * self.hosts,
+                    max_keepalive_connections=self.pool_size if self.keep_alive else 0,
+                ),
+                headers={
+                    "Accept-Encoding": (
+                        _accept_encoding() if self.compression else "identity"
+                    )
+                },
+                # requests doesn't time out by default either
+                timeout=None,
+            )
+        return self.client
+
+    async def request(self, method: str, url: str, **kwargs) -> Any:
+        if httpx is None:
+            return await to_thread(
+                metrics.dequeued, HTTP_POOL.request, method, url, **kwargs
+            )
+        return await self._client().request(
+            method, url, extensions={"trace": metrics.trace}, **kwargs
+        )
+
+    async def aclose(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+ASYNC_POOL: AsyncHttpPool = AsyncHttpPool.from_env()
+
+
+async def drain() -> None:
+    """Wait for document downloads and close the async pool; run.py's last step"""
+    await to_thread(downloads.DOWNLOADS.join)
+    await ASYNC_POOL.aclose()
+    await to_thread(persist.RESPONSES.flush)
+
+
+class TokenCache:
+    """OAuth tokens shared by every BoostClient in the process, by (base_url, client_id)
+
+    A token is refetched once it's within refresh_margin seconds of expiring, by
+    one thread while any others wanting it wait. With a path, tokens are also
+    kept on disk between runs.
+    """
+
+    # used when the token response has no expires_in
+    DEFAULT_LIFETIME: float = 300.0
+
+    def __init__(self, path: str = str(), refresh_margin: float = 60.0) -> None:
+        self.path: str = path
+        self.refresh_margin: float = refresh_margin
+        self.tokens: Dict[str, Dict[str, Any]] = self._load()
+        self.fetched: int = 0
+        self._lock: threading.Lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+    @classmethod
+    def from_env(cls) -> "TokenCache":
+        return cls(
+            path=os.environ.get("PMX_TOKEN_CACHE", str()),
+            refresh_margin=float(os.environ.get("PMX_TOKEN_REFRESH_MARGIN", 60)),
+        )
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not self.path or not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as reader:
+                tokens: Dict[str, Dict[str, Any]] = json.load(reader)
+        except (OSError, ValueError):
+            return {}
+        return {k: v for k, v in tokens.items() if self._fresh(v)}
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        # mkstemp's file is only readable by us, which suits a token
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp"
+        )
+        with os.fdopen(fd, "w") as writer:
+            json.dump(self.tokens, writer, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def _fresh(self, entry: Optional[Dict[str, Any]], stale: str = str()) -> bool:
+        return bool(
+            entry
+            and entry["access_token"] != stale
+            and entry["expires_at"] - self.refresh_margin > time.time()
+        )
+
+    def cached(self, key: Tuple[str, str], stale: str = str()) -> Optional[str]:
+        """key's token if there's a fresh one other than stale, without fetching"""
+        entry: Optional[Dict[str, Any]] = self.tokens.get("|".join(key))
+        if self._fresh(entry, stale):
+            return entry["access_token"]  # type: ignore
+        return None
+
+    def get(
+        self,
+        key: Tuple[str, str],
+        fetch: Callable[[], Dict[str, Any]],
+        stale: str = str(),
+    ) -> str:
+        """key's token, from fetch() if there's no fresh one other than stale"""
+        token: Optional[str] = self.cached(key, stale)
+        if token:
+            return token
+
+        name: str = "|".join(key)
+        with self._lock:
+            lock: threading.Lock = self._key_locks.setdefault(name, threading.Lock())
+        with lock:
+            # whoever held the lock may have just fetched it
+            entry: Optional[Dict[str, Any]] = self.tokens.get(name)
+            if not self._fresh(entry, stale):
+                body: Dict[str, Any] = fetch()
+                entry = {
+                    "access_token": body["access_token"],
+                    "expires_at": time.time()
+                    + float(body.get("expires_in") or self.DEFAULT_LIFETIME),
+                }
+                with self._lock:
+                    self.tokens[name] = entry
+                    self.fetched += 1
+                    self._save()
+            return entry["access_token"]  # type: ignore
+
+
+TOKENS: TokenCache = TokenCache.from_env()
+
+
 class BoostClient:
     def __init__(self, **kwargs):
         self._namespace: str = "default"
@@ -33,6 +310,8 @@ class BoostClient:
         self.user: str = kwargs.get("BOOST_USER", str())
         self.client_id: str = kwargs.get("CLIENT_ID", str())
         self.client_secret: str = kwargs.get("CLIENT_SECRET", str())
+        # what its calls are tagged with in run metrics
+        self.metrics_namespace: str = kwargs.get("NAMESPACE", str())
         self.auth_token: Optional[str] = None
 
         self.save_responses: bool = kwargs.get("save_responses", True)
@@ -68,18 +347,44 @@ class BoostClient:
     def response_dir(self):
         return os.path.join(self.original_response_dir, self.namespace)
 
-    @classmethod
-    def sleep(cls, seconds=0.2):
-        time.sleep(seconds)
-        return
-
-    def authenticate(self) -> None:
-        self.sleep()
+    def _send(
+        self, method: str, url: str, greek: str = str(), **kwargs
+    ) -> requests.Response:
+        """Send through the shared pool, paced and backed off by the shared throttle
+
+        Each call's timings go to metrics.METRICS, tagged with greek, with status
+        0 if it got no response.
+        """
+        sample: metrics.Sample = metrics.Sample(self.metrics_namespace, greek, method)
+        response: Optional[requests.Response] = None
+        try:
+            response = throttle.THROTTLE.send(
+                lambda: sample.timed(HTTP_POOL.request, method, url, **kwargs), url
+            )
+            return response
+        finally:
+            metrics.METRICS.observe(sample.finish(response))
+
+    def _request(
+        self, method: str, url: str, greek: str = str(), **kwargs
+    ) -> requests.Response:
+        """_send with a current token, refreshing it once if the server rejects it"""
+        self._authorize()
+        sent_token: Optional[str] = self.auth_token
+        response: requests.Response = self._send(method, url, greek, **kwargs)
+        if response.status_code == 401:
+            self._authorize(stale=sent_token)
+            if self.auth_token != sent_token:
+                response = self._send(method, url, greek, **kwargs)
+        return response
 
-        if "boostinsurance.io" not in self.base_url:
-            self.auth_token = "placeholder-token-for-local-dev"
-            return
+    def _authorize(self, stale: str = str()) -> None:
+        self.authenticate(stale)
+        # updated in place, as the dicts may be in use by a request being retried
+        for headers in (self.read_headers, self.write_headers):
+            headers["Authorization"] = f"Bearer {self.auth_token}"
 
+    def _fetch_token(self) -> Dict[str, Any]:
         url = f"{self.base_url}/auth/oauth2/token"
         headers = {"Content-Type": "application/x-www-form-urlencoded"}
         data = {
@@ -87,104 +392,167 @@ class BoostClient:
             "client_secret": self.client_secret,
             "grant_type": "client_credentials",
         }
-        response = requests.post(url, data=data, headers=headers)
+        response = self._send("POST", url, data=data, headers=headers)
         assert response.status_code == 200, response.json()
-        self.auth_token = response.json()["access_token"]
+        return response.json()
+
+    def authenticate(self, stale: str = str()) -> None:
+        if "boostinsurance.io" not in self.base_url:
+            self.auth_token = "placeholder-token-for-local-dev"
+            return
+
+        self.auth_token = TOKENS.get(
+            (self.base_url, self.client_id), self._fetch_token, stale
+        )
 
     def post(self, endpoint, payload, greek: str = str()):
         print(f">>> POSTing endpoint: {endpoint} <<<")
-        self.sleep()
-        response = requests.post(endpoint, json=payload, headers=self.write_headers)
+        response = self._request(
+            "POST", endpoint, greek, json=payload, headers=self.write_headers
+        )
         self._save_response(response, greek)
 
         return response
 
     def put(self, endpoint, payload, greek: str = str()):
         print(f">>> PUTing endpoint: {endpoint} <<<")
-        self.sleep()
-        response = requests.put(endpoint, json=payload, headers=self.write_headers)
+        response = self._request(
+            "PUT", endpoint, greek, json=payload, headers=self.write_headers
+        )
 
         self._save_response(response, greek)
         return response
 
     def patch(self, endpoint, payload, greek: str = str()):
         print(f">>> PATCHing endpoint: {endpoint} <<<")
-        self.sleep()
-        response = requests.patch(endpoint, json=payload, headers=self.write_headers)
+        response = self._request(
+            "PATCH", endpoint, greek, json=payload, headers=self.write_headers
+        )
         self._save_response(response, greek)
 
         return response
 
     def get(self, endpoint, greek: str = str()):
         print(f">>> GETing endpoint: {endpoint} <<<")
-        self.sleep()
-        response = requests.get(endpoint, headers=self.read_headers)
+        response = self._request("GET", endpoint, greek, headers=self.read_headers)
         self._save_response(response, greek)
         if "/documents" in endpoint:
-            threading.Thread(
-                target=self.poll,
-                name=f"get_docs_{time.time()}",
-                args=(
-                    endpoint,
-                    greek,
-                ),
-            ).start()
+            downloads.DOWNLOADS.watch(self, endpoint, greek)
 
         return response
 
     def delete(self, endpoint, payload, greek: str = str()):
         print(f">>> DELETEing endpoint: {endpoint} <<<")
 
-        self.sleep()
         if payload:
-            response = requests.delete(
-                endpoint, json=payload, headers=self.write_headers
+            response = self._request(
+                "DELETE", endpoint, greek, json=payload, headers=self.write_headers
             )
         else:
-            response = requests.delete(endpoint, headers=self.read_headers)
+            response = self._request(
+                "DELETE", endpoint, greek, headers=self.read_headers
+            )
         self._save_response(response, greek)
 
         return response
 
-    def poll(self, endpoint, greek: str = str()):
-        attempt: int = 0
-        limit: int = 15
-        while attempt < limit:
-            time.sleep(2)
-            response = requests.get(endpoint, headers=self.read_headers)
-            data = response.json().get("data", [])
-            if len(data) > 0:
-                counter = 1000
-                for item in data:
-                    dl_dir = os.path.join(self.response_dir, "docs")
-                    os.makedirs(dl_dir, exist_ok=True)
-                    dl_path = os.path.join(dl_dir, f"{greek}-{counter}.pdf")
-                    dl_uri: str = item.get("attributes", {}).get("file_url", str())
-                    if dl_uri.startswith("https"):
-                        dl = requests.get(dl_uri)
-                        with open(dl_path, "wb") as writer:
-                            writer.write(dl.content)
-                    counter += 10
-                print(f"Completed downloads for endpoint: {endpoint}")
-                break
-            attempt += 1
-        return
-
     def _save_response(self, response: requests.Response, greek: str):
-
+        """Hand response to the background writer, see persist.ResponseWriter"""
         if self.save_responses and greek:
-            try:
-                pretty_json = json.loads(response.text)
-            except json.JSONDecodeError:
-                pretty_json = {}
-
-            response_filename = f"{greek}.json"
-            data: Dict[str, Any] = pretty_json.get("data", {})
-            type_hint: str = data.get("type", str()) if type(data) is dict else str()
-            if type_hint:
-                response_filename = f"{type_hint}-{response_filename}"
-
-            with open(
-                os.path.join(self.response_dir, response_filename), "w"
-            ) as writer:
-                writer.write(json.dumps(pretty_json, indent=4))
+            persist.RESPONSES.save(
+                self.response_dir, self.metrics_namespace, greek, response
+            )
+
+
+class AsyncBoostClient(BoostClient):
+    """BoostClient whose calls are coroutines, for projects exported with --async
+
+    It authenticates when it's made, like BoostClient, and shares its throttle
+    and token cache.
+    """
+
+    async def _asend(self, method: str, url: str, greek: str = str(), **kwargs) -> Any:
+        sample: metrics.Sample = metrics.Sample(self.metrics_namespace, greek, method)
+        response: Any = None
+        try:
+            response = await throttle.THROTTLE.asend(
+                lambda: sample.atimed(ASYNC_POOL.request, method, url, **kwargs), url
+            )
+            return response
+        finally:
+            metrics.METRICS.observe(sample.finish(response))
+
+    async def _arequest(
+        self, method: str, url: str, greek: str = str(), **kwargs
+    ) -> Any:
+        await self._aauthorize()
+        sent_token: Optional[str] = self.auth_token
+        response: Any = await self._asend(method, url, greek, **kwargs)
+        if response.status_code == 401:
+            await self._aauthorize(stale=sent_token)  # type: ignore
+            if self.auth_token != sent_token:
+                response = await self._asend(method, url, greek, **kwargs)
+        return response
+
+    async def _aauthorize(self, stale: str = str()) -> None:
+        if "boostinsurance.io" in self.base_url and not TOKENS.cached(
+            (self.base_url, self.client_id), stale
+        ):
+            # fetching blocks, as do other threads' fetches of the same token
+            await to_thread(self._authorize, stale)
+        else:
+            self._authorize(stale)
+
+    async def post(self, endpoint, payload, greek: str = str()):
+        print(f">>> POSTing endpoint: {endpoint} <<<")
+        response = await self._arequest(
+            "POST", endpoint, greek, json=payload, headers=self.write_headers
+        )
+        self._save_response(response, greek)
+
+        return response
+
+    async def put(self, endpoint, payload, greek: str = str()):
+        print(f">>> PUTing endpoint: {endpoint} <<<")
+        response = await self._arequest(
+            "PUT", endpoint, greek, json=payload, headers=self.write_headers
+        )
+
+        self._save_response(response, greek)
+        return response
+
+    async def patch(self, endpoint, payload, greek: str = str()):
+        print(f">>> PATCHing endpoint: {endpoint} <<<")
+        response = await self._arequest(
+            "PATCH", endpoint, greek, json=payload, headers=self.write_headers
+        )
+        self._save_response(response, greek)
+
+        return response
+
+    async def get(self, endpoint, greek: str = str()):
+        print(f">>> GETing endpoint: {endpoint} <<<")
+        response = await self._arequest(
+            "GET", endpoint, greek, headers=self.read_headers
+        )
+        self._save_response(response, greek)
+        if "/documents" in endpoint:
+            # polled and downloaded on the manager's threads, see drain()
+            downloads.DOWNLOADS.watch(self, endpoint, greek)
+
+        return response
+
+    async def delete(self, endpoint, payload, greek: str = str()):
+        print(f">>> DELETEing endpoint: {endpoint} <<<")
+
+        if payload:
+            response = await self._arequest(
+                "DELETE", endpoint, greek, json=payload, headers=self.write_headers
+            )
+        else:
+            response = await self._arequest(
+                "DELETE", endpoint, greek, headers=self.read_headers
+            )
+        self._save_response(response, greek)
+
+        return response
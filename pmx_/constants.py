@@ -38,5 +38,29 @@ GREEK_LETTERS: List[str] = [
 GREEK_LEN: int = len(GREEK_LETTERS)
 
 # export stuff
-EXPORT_DIR_EXCLUDES: Sequence[str] = ("__pycache__", "responses", ".git", ".mypy_cache")
-EXPORT_FILE_EXCLUDES: Sequence[str] = ("collection.json", "e2e.log", ".DS_Store")
+# copied next to the generated namespaces, alongside vars/
+RUNTIME_MODULES: Sequence[str] = (
+    "client.py",
+    "downloads.py",
+    "loadtest.py",
+    "metrics.py",
+    "persist.py",
+    "runner.py",
+    "scheduler.py",
+    "throttle.py",
+)
+CACHE_DIR_NAME: str = ".pmx_cache"
+EXPORT_DIR_EXCLUDES: Sequence[str] = (
+    "__pycache__",
+    "responses",
+    ".pmx_results",
+    ".git",
+    ".mypy_cache",
+    CACHE_DIR_NAME,
+)
+EXPORT_FILE_EXCLUDES: Sequence[str] = (
+    "collection.json",
+    "e2e.log",
+    ".DS_Store",
+    ".pmx_manifest.json",
+)
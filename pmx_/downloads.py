@@ -0,0 +1,227 @@
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+# bytes written at a time, so a document is never held in memory whole
+CHUNK_SIZE: int = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class DownloadManager:
+    """Polls document lists and downloads their files on a few shared threads
+
+    watch() polls a /documents endpoint, first after first_delay seconds, then
+    backing off exponentially up to max_delay, until it lists documents or
+    timeout seconds have passed. Each https file_url it lists is streamed to
+    {greek}-{n}.pdf under the client's response_dir/docs, once per run
+    however often it's listed, with up to retries more attempts on failure.
+
+    At most workers threads run at a time. They aren't daemons, and stop once
+    there's nothing left to do, so a process exits only after its downloads.
+    """
+
+    def __init__(
+        self,
+        workers: int = 4,
+        first_delay: float = 0.5,
+        max_delay: float = 8.0,
+        timeout: float = 30.0,
+        retries: int = 3,
+    ) -> None:
+        self.workers: int = max(workers, 1)
+        self.first_delay: float = first_delay
+        self.max_delay: float = max_delay
+        self.timeout: float = timeout
+        self.retries: int = retries
+        self._reset()
+        # a forked worker gets none of the threads, so it starts afresh
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._cond: threading.Condition = threading.Condition()
+        # (due, order, namespace, job) ordered by when they're due
+        self._jobs: List[Tuple[float, int, str, Callable[[], None]]] = []
+        self._order: Any = itertools.count()
+        self._alive: int = 0
+        self._pending: Dict[str, int] = {}
+        self._urls: Set[str] = set()
+        self.summaries: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def from_env(cls) -> "DownloadManager":
+        return cls(
+            workers=int(os.environ.get("PMX_DOWNLOAD_WORKERS", 4)),
+            timeout=float(os.environ.get("PMX_DOWNLOAD_TIMEOUT", 30)),
+            retries=int(os.environ.get("PMX_DOWNLOAD_RETRIES", 3)),
+        )
+
+    @staticmethod
+    def _empty() -> Dict[str, Any]:
+        return {
+            "polled": 0,
+            "timed_out": 0,
+            "downloaded": 0,
+            "deduped": 0,
+            "failed": 0,
+            "bytes": 0,
+            "errors": [],
+        }
+
+    def _summary(self, namespace: str) -> Dict[str, Any]:
+        if namespace not in self.summaries:
+            self.summaries[namespace] = self._empty()
+        return self.summaries[namespace]
+
+    def _add(self, namespace: str, delay: float, job: Callable[[], None]) -> None:
+        with self._cond:
+            heapq.heappush(
+                self._jobs,
+                (time.monotonic() + delay, next(self._order), namespace, job),
+            )
+            self._pending[namespace] = self._pending.get(namespace, 0) + 1
+            if self._alive < self.workers:
+                self._alive += 1
+                threading.Thread(target=self._work, name="pmx-downloads").start()
+            self._cond.notify()
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    if not self._jobs:
+                        self._alive -= 1
+                        return
+                    wait: float = self._jobs[0][0] - time.monotonic()
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                _, _, namespace, job = heapq.heappop(self._jobs)
+            try:
+                job()
+            except Exception as exc:
+                logger.warning("Download job failed: %r", exc)
+                with self._cond:
+                    self._summary(namespace)["errors"].append(repr(exc))
+            finally:
+                with self._cond:
+                    self._pending[namespace] -= 1
+                    self._cond.notify_all()
+
+    def watch(self, client: Any, endpoint: str, greek: str) -> None:
+        """Poll endpoint in the background and download what it lists"""
+        namespace: str = client.metrics_namespace
+        started: float = time.monotonic()
+
+        def poll(delay: float) -> None:
+            response: Any = client._request(
+                "GET", endpoint, greek, headers=client.read_headers
+            )
+            data: Any = response.json().get("data", [])
+            if not isinstance(data, list):
+                raise ValueError(f"{endpoint} didn't return a list of documents")
+            documents: List[Any] = [i for i in data if isinstance(i, dict)]
+            if not documents:
+                if time.monotonic() - started + delay > self.timeout:
+                    with self._cond:
+                        self._summary(namespace)["timed_out"] += 1
+                    return
+                following: float = min(delay * 2, self.max_delay)
+                self._add(namespace, delay, lambda: poll(following))
+                return
+            with self._cond:
+                self._summary(namespace)["polled"] += 1
+            docs_dir: str = os.path.join(client.response_dir, "docs")
+            for counter, item in enumerate(documents):
+                url: str = item.get("attributes", {}).get("file_url", str())
+                if url.startswith("https"):
+                    path: str = os.path.join(
+                        docs_dir, f"{greek}-{1000 + counter * 10}.pdf"
+                    )
+                    self._fetch(client, namespace, url, path, greek)
+            print(f"Queued downloads for endpoint: {endpoint}")
+
+        self._add(namespace, self.first_delay, lambda: poll(self.first_delay))
+
+    def _fetch(
+        self, client: Any, namespace: str, url: str, path: str, greek: str
+    ) -> None:
+        with self._cond:
+            if url in self._urls:
+                self._summary(namespace)["deduped"] += 1
+                return
+            self._urls.add(url)
+
+        def download(attempt: int) -> None:
+            try:
+                size: int = self._stream(client, url, path, greek)
+            except Exception as exc:
+                if attempt < self.retries:
+                    self._add(
+                        namespace,
+                        min(self.first_delay * 2**attempt, self.max_delay),
+                        lambda: download(attempt + 1),
+                    )
+                    return
+                with self._cond:
+                    summary: Dict[str, Any] = self._summary(namespace)
+                    summary["failed"] += 1
+                    summary["errors"].append(f"{url}: {exc!r}")
+                return
+            with self._cond:
+                summary = self._summary(namespace)
+                summary["downloaded"] += 1
+                summary["bytes"] += size
+
+        self._add(namespace, 0.0, lambda: download(0))
+
+    @staticmethod
+    def _stream(client: Any, url: str, path: str, greek: str) -> int:
+        """Write url's body to path a chunk at a time, returning its size"""
+        response: Any = client._send("GET", url, greek, stream=True)
+        try:
+            response.raise_for_status()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            size: int = 0
+            # renamed into place once whole, so path is never half a document
+            with open(f"{path}.part", "wb") as writer:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    writer.write(chunk)
+                    size += len(chunk)
+            os.replace(f"{path}.part", path)
+            return size
+        finally:
+            response.close()
+
+    def join(self, namespace: Optional[str] = None) -> Dict[str, Any]:
+        """Wait for namespace's polls and downloads, or everyone's, and sum them up"""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: not any(
+                    count
+                    for key, count in self._pending.items()
+                    if namespace is None or key == namespace
+                )
+            )
+            total: Dict[str, Any] = self._empty()
+            for key, summary in self.summaries.items():
+                if namespace is None or key == namespace:
+                    for name, value in summary.items():
+                        total[name] += value
+            return total
+
+
+DOWNLOADS: DownloadManager = DownloadManager.from_env()
+
+
+def configure_downloads(**kwargs) -> DownloadManager:
+    """Replace the shared manager, e.g. configure_downloads(workers=8)"""
+    global DOWNLOADS
+
+    DOWNLOADS.join()
+    DOWNLOADS = DownloadManager(**kwargs)
+    return DOWNLOADS
@@ -0,0 +1,166 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+from concurrent import futures
+from typing import Any, BinaryIO, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from pmx_.stream import JsonStream
+
+POSTMAN_API_URL: str = "https://api.getpostman.com"
+TIMEOUT: float = 60.0
+
+
+class FetchError(Exception):
+    pass
+
+
+def _write_atomic(path: str, content: bytes) -> None:
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as writer:
+        writer.write(content)
+    os.replace(tmp_path, path)
+
+
+class PostmanFetcher:
+    """Fetches postman api documents over one pooled session
+
+    Responses are kept in cache_dir with their ETag and Last-Modified, so later
+    fetches are conditional and a 304 costs no download. Offline, only the cache
+    is used.
+    """
+
+    def __init__(
+        self,
+        api_key: str = str(),
+        api_url: str = POSTMAN_API_URL,
+        cache_dir: Optional[str] = None,
+        offline: bool = False,
+        pool_size: int = 4,
+    ) -> None:
+        self.api_url: str = api_url.rstrip("/")
+        self.cache_dir: Optional[str] = cache_dir
+        self.offline: bool = offline
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.session: requests.Session = requests.Session()
+        adapter: HTTPAdapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=2
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key:
+            self.session.headers["X-Api-Key"] = api_key
+
+    def _cache_paths(self, url: str) -> Optional[List[str]]:
+        if not self.cache_dir:
+            return None
+        key: str = hashlib.sha256(url.encode()).hexdigest()[:32]
+        return [
+            os.path.join(self.cache_dir, f"{key}.body"),
+            os.path.join(self.cache_dir, f"{key}.meta.json"),
+        ]
+
+    def _read_cache(self, url: str) -> Optional[Dict[str, Any]]:
+        paths: Optional[List[str]] = self._cache_paths(url)
+        if not paths or not all(os.path.isfile(i) for i in paths):
+            return None
+        with open(paths[1], "r") as reader:
+            meta: Dict[str, Any] = json.load(reader)
+        meta["body_path"] = paths[0]
+        return meta
+
+    def _write_cache(self, url: str, response: requests.Response) -> None:
+        paths: Optional[List[str]] = self._cache_paths(url)
+        if not paths:
+            return
+        _write_atomic(paths[0], response.content)
+        meta: Dict[str, str] = {
+            "url": url,
+            "etag": response.headers.get("ETag", str()),
+            "last_modified": response.headers.get("Last-Modified", str()),
+        }
+        _write_atomic(paths[1], json.dumps(meta, indent=2).encode())
+
+    def get(self, path: str) -> bytes:
+        """The body of api_url/path, from the cache when the server says it's unchanged"""
+        url: str = f"{self.api_url}/{path.lstrip('/')}"
+        cached: Optional[Dict[str, Any]] = self._read_cache(url)
+        if self.offline:
+            if not cached:
+                raise FetchError(f"{url} isn't cached, can't fetch it offline")
+            with open(cached["body_path"], "rb") as reader:
+                return reader.read()
+
+        headers: Dict[str, str] = {}
+        if cached and cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached and cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+        try:
+            response: requests.Response = self.session.get(
+                url, headers=headers, timeout=TIMEOUT
+            )
+        except requests.RequestException as e:
+            raise FetchError(f"Couldn't fetch {url}: {e}") from e
+
+        if response.status_code == 304 and cached:
+            with open(cached["body_path"], "rb") as reader:
+                return reader.read()
+        if response.status_code != 200:
+            raise FetchError(
+                f"Couldn't fetch {url}: {response.status_code} {response.text[:200]}"
+            )
+        self._write_cache(url, response)
+        return response.content
+
+    def fetch_all(self, paths: Dict[str, str]) -> Dict[str, bytes]:
+        """get() every path concurrently, keyed like paths"""
+        with futures.ThreadPoolExecutor(max_workers=len(paths) or 1) as executor:
+            pending: Dict[str, futures.Future] = {
+                name: executor.submit(self.get, path) for name, path in paths.items()
+            }
+            return {name: future.result() for name, future in pending.items()}
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def environment_values(raw: bytes) -> List[Dict[str, Any]]:
+    """The variables of an environment, from the api or from a postman export"""
+    document: Dict[str, Any] = json.loads(raw)
+    values: List[Dict[str, Any]] = document.get("environment", document).get(
+        "values", []
+    )
+    return sorted(values, key=lambda i: i.get("key", str()))
+
+
+def write_environment(raw: bytes, path: str) -> None:
+    with open(path, "w") as writer:
+        json.dump(environment_values(raw), writer, indent=2)
+
+
+def write_collection(reader: BinaryIO, path: str) -> None:
+    """Write a collection in the api's {"collection": ...} form without parsing it all"""
+    start: int = reader.tell()
+    text: io.TextIOWrapper = io.TextIOWrapper(reader, encoding="utf-8")
+    first_key: str = next(JsonStream(text).iter_object(), str())
+    text.detach()
+    reader.seek(start)
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "wb") as writer:
+        # a file exported from the postman app has no api envelope
+        if first_key != "collection":
+            writer.write(b'{"collection": ')
+        shutil.copyfileobj(reader, writer)
+        if first_key != "collection":
+            writer.write(b"}")
+    os.replace(tmp_path, path)
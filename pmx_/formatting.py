@@ -0,0 +1,119 @@
+import hashlib
+import os
+import tempfile
+from concurrent import futures
+from typing import Dict, List, Optional
+
+import black
+
+from pmx_.profiling import PROFILER
+
+BLACK_MODE: black.FileMode = black.FileMode(
+    target_versions={black.mode.TargetVersion.PY310}, line_length=108
+)
+
+
+def format_source(content: str, mode: black.FileMode = BLACK_MODE) -> str:
+    """black.format_str, leaving content as is if black can't make sense of it"""
+    try:
+        return black.format_str(content, mode=mode)
+    except Exception:
+        return content
+
+
+class FormatCache:
+    """black output on disk, keyed by the unformatted source plus black's version and mode
+
+    Entries are written atomically, so several processes can share a directory.
+    """
+
+    def __init__(self, directory: str, mode: black.FileMode = BLACK_MODE) -> None:
+        self.directory: str = os.path.join(directory, "black")
+        self.mode: black.FileMode = mode
+        self.mode_key: bytes = f"{black.__version__}|{mode.get_cache_key()}".encode()
+        self.hits: int = 0
+        self.misses: int = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, content: str) -> str:
+        return hashlib.sha256(self.mode_key + content.encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.py")
+
+    def get(self, content: str) -> Optional[str]:
+        try:
+            with open(self._path(self.key(content)), "r") as reader:
+                self.hits += 1
+                return reader.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+    def put(self, content: str, formatted: str) -> None:
+        path: str = self._path(self.key(content))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w") as writer:
+            writer.write(formatted)
+        os.replace(tmp_path, path)
+
+    def format(self, content: str) -> str:
+        formatted: Optional[str] = self.get(content)
+        if formatted is None:
+            formatted = format_source(content, self.mode)
+            self.put(content, formatted)
+        return formatted
+
+
+# set per process by configure(); None formats without caching
+FORMAT_CACHE: Optional[FormatCache] = None
+
+
+def configure(cache_dir: Optional[str]) -> None:
+    global FORMAT_CACHE
+
+    FORMAT_CACHE = FormatCache(cache_dir) if cache_dir else None
+
+
+def format_cached(content: str, namespace: str = str()) -> str:
+    with PROFILER.stage("black", namespace):
+        if FORMAT_CACHE:
+            return FORMAT_CACHE.format(content)
+        return format_source(content)
+
+
+def format_many(sources: Dict[str, str], jobs: int = 0) -> Dict[str, str]:
+    """Format many modules at once, keyed by path, across up to jobs processes
+
+    Cache hits are resolved up front so only the misses cross into the pool.
+    """
+    result: Dict[str, str] = {}
+    misses: Dict[str, str] = {}
+    for path, content in sources.items():
+        cached: Optional[str] = FORMAT_CACHE.get(content) if FORMAT_CACHE else None
+        if cached is None:
+            misses[path] = content
+        else:
+            result[path] = cached
+
+    workers: int = min(jobs or os.cpu_count() or 1, len(misses))
+    paths: List[str] = list(misses)
+    with PROFILER.stage("black"):
+        if workers > 1:
+            with futures.ProcessPoolExecutor(max_workers=workers) as executor:
+                formatted: List[str] = list(
+                    executor.map(
+                        format_source,
+                        [misses[i] for i in paths],
+                        chunksize=max(len(paths) // (workers * 4), 1),
+                    )
+                )
+        else:
+            formatted = [format_source(misses[i]) for i in paths]
+
+    for path, content in zip(paths, formatted):
+        if FORMAT_CACHE:
+            FORMAT_CACHE.put(misses[path], content)
+        result[path] = content
+    return result
@@ -25,10 +25,21 @@ Run the e2e tests:
 (_venv) $ python run.py
 ```
 
+`python run.py --help` lists the options: `-w` namespaces at once, `-x process` to
+run them on processes, and `--shard 2/4` to run a quarter of the suite per machine.
+Each run writes its results to `.pmx_results/`; `python run.py merge` combines the
+shards' into one report, and `metrics-*.json` and `.prom` hold every request's
+timings. Namespaces start longest first and shards are balanced by
+time, going by the durations recorded in `.pmx_history.json`.
+
+`python run.py load -u 20 -d 300` runs the scenarios as 20 virtual users for five
+minutes and reports each request's throughput and p50/p95/p99 latency.
+
 ## Prior results
 
 The responses from the last run may be included in the arcive if re-running the tests isn't required.
-Check `responses` directories in this hierarchy.
+Check `responses` directories in this hierarchy, or the `.pmx_results/responses-*`
+stores if the run set `PMX_RESPONSE_STORE=jsonl` or `sqlite`.
 
 ```sh
 $ find . -type d -name responses
@@ -0,0 +1,296 @@
+import asyncio
+import contextlib
+import contextvars
+import importlib
+import math
+import os
+import sys
+import threading
+import time
+from collections import ChainMap
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import metrics
+import throttle
+
+# a virtual user's own views of every namespace's CLOSET_VARS, by id(ScopedVars)
+_SCOPES: contextvars.ContextVar[Optional[Dict[int, MutableMapping]]] = (
+    contextvars.ContextVar("pmx_scopes", default=None)
+)
+_RECORDER: contextvars.ContextVar[Optional["Recorder"]] = contextvars.ContextVar(
+    "pmx_recorder", default=None
+)
+PERCENTILES: Tuple[int, ...] = (50, 95, 99)
+
+
+class ScopedVars(MutableMapping):
+    """A namespace's CLOSET_VARS, copied on write by each virtual user
+
+    Outside a load test everything reads and writes base, as the plain dict it
+    replaces did. Inside one, each iteration of a virtual user writes to its own
+    map over base, shared with the threads and tasks the scenario starts.
+    """
+
+    def __init__(self, base: MutableMapping) -> None:
+        self.base: MutableMapping = base
+
+    @property
+    def data(self) -> MutableMapping:
+        scopes: Optional[Dict[int, MutableMapping]] = _SCOPES.get()
+        if scopes is None:
+            return self.base
+        data: Optional[MutableMapping] = scopes.get(id(self))
+        if data is None:
+            # setdefault so racing threads of one user agree on a single view
+            data = scopes.setdefault(id(self), ChainMap({}, self.base))
+        return data
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.data[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        del self.data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __repr__(self) -> str:
+        return f"ScopedVars({self.data!r})"
+
+
+@contextlib.contextmanager
+def isolated() -> Iterator[None]:
+    """Give the block fresh copies of every ScopedVars"""
+    token: contextvars.Token = _SCOPES.set({})
+    try:
+        yield
+    finally:
+        _SCOPES.reset(token)
+
+
+def recording() -> Optional["Recorder"]:
+    """The recorder of the load test this runs in, if any"""
+    return _RECORDER.get()
+
+
+def percentile(ordered: Sequence[float], q: float) -> float:
+    """Nearest rank percentile q of already sorted values"""
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(math.ceil(q / 100 * len(ordered)) - 1, 0))]
+
+
+class Recorder:
+    """Latencies of every call of each (namespace, request), from every user"""
+
+    def __init__(self) -> None:
+        self.samples: Dict[Tuple[str, str], List[float]] = {}
+        self.errors: Dict[Tuple[str, str], int] = {}
+        self.iterations: int = 0
+        self.failures: int = 0
+        self._lock: threading.Lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def timing(self, namespace: str, name: str) -> Iterator[None]:
+        """Time the block, less what its calls spent paced or backing off"""
+        start: float = time.perf_counter()
+        failed: bool = False
+        try:
+            with metrics.waits() as waits:
+                yield
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            elapsed: float = max(time.perf_counter() - start - sum(waits), 0.0)
+            with self._lock:
+                self.samples.setdefault((namespace, name), []).append(elapsed)
+                if failed:
+                    self.errors[(namespace, name)] = (
+                        self.errors.get((namespace, name), 0) + 1
+                    )
+
+    def finished(self, failed: bool) -> None:
+        with self._lock:
+            self.iterations += 1
+            self.failures += failed
+
+    def summary(self, elapsed: float) -> List[Dict[str, Any]]:
+        """One row per request, in seconds; throughput is calls a second"""
+        rows: List[Dict[str, Any]] = []
+        with self._lock:
+            items: List[Tuple[Tuple[str, str], List[float]]] = sorted(
+                (k, sorted(v)) for k, v in self.samples.items()
+            )
+        for (namespace, name), ordered in items:
+            row: Dict[str, Any] = {
+                "namespace": namespace,
+                "request": name,
+                "count": len(ordered),
+                "errors": self.errors.get((namespace, name), 0),
+                "throughput": len(ordered) / elapsed if elapsed else 0.0,
+                "mean": sum(ordered) / len(ordered),
+                "max": ordered[-1],
+            }
+            for q in PERCENTILES:
+                row[f"p{q}"] = percentile(ordered, q)
+            rows.append(row)
+        return rows
+
+
+class LoadTest:
+    """Runs namespaces' scenarios as users virtual users for duration seconds
+
+    Users start evenly spread over ramp_up seconds, and each runs the namespaces'
+    tous() one after another, starting from the next user's one, until time is
+    up; runs in flight are left to finish. A rate above 0 caps scenario runs a
+    second across all users.
+    """
+
+    def __init__(
+        self,
+        namespaces: Sequence[str],
+        users: int = 10,
+        duration: float = 60.0,
+        ramp_up: float = 0.0,
+        rate: float = 0.0,
+    ) -> None:
+        self.namespaces: Sequence[str] = namespaces
+        self.users: int = max(users, 1)
+        self.duration: float = duration
+        self.ramp_up: float = ramp_up
+        self.bucket: throttle.TokenBucket = throttle.TokenBucket(rate, 1)
+        self.recorder: Recorder = Recorder()
+        self.modules: List[Any] = []
+        self.started: float = 0.0
+        self.deadline: float = 0.0
+
+    def prepare(self) -> None:
+        if "PMX_THROTTLE" not in os.environ:
+            # host pacing would cap the load and count as latency; rate does the
+            # pacing here, while a server's Retry-After is still honoured
+            throttle.THROTTLE = throttle.Throttle.from_env(enabled=False)
+        for namespace in self.namespaces:
+            module: Any = importlib.import_module(f"{namespace}.scenarios")
+            # every user would overwrite the same files
+            module.CLIENT.save_responses = False
+            self.modules.append(module)
+        self.started = time.monotonic()
+        self.deadline = self.started + self.duration
+
+    def _start_delay(self, user: int) -> float:
+        return self.ramp_up * user / self.users
+
+    def _user(self, user: int) -> None:
+        _RECORDER.set(self.recorder)
+        time.sleep(self._start_delay(user))
+        turn: int = user
+        while True:
+            wait: float = self.bucket.reserve()
+            if time.monotonic() + wait >= self.deadline:
+                break
+            time.sleep(wait)
+            module: Any = self.modules[turn % len(self.modules)]
+            failed: bool = False
+            try:
+                with isolated():
+                    module.tous()
+            except Exception:
+                failed = True
+            self.recorder.finished(failed)
+            turn += 1
+
+    async def _auser(self, user: int) -> None:
+        _RECORDER.set(self.recorder)
+        await asyncio.sleep(self._start_delay(user))
+        turn: int = user
+        while True:
+            wait: float = self.bucket.reserve()
+            if time.monotonic() + wait >= self.deadline:
+                break
+            await asyncio.sleep(wait)
+            module: Any = self.modules[turn % len(self.modules)]
+            failed: bool = False
+            try:
+                with isolated():
+                    await module.tous()
+            except Exception:
+                failed = True
+            self.recorder.finished(failed)
+            turn += 1
+
+    def _report_progress(self, stop: threading.Event, every: float = 10.0) -> None:
+        while not stop.wait(every):
+            print(
+                f"{time.monotonic() - self.started:.0f}s: "
+                f"{self.recorder.iterations} runs, {self.recorder.failures} failed",
+                file=sys.stderr,
+            )
+
+    def run(self, asynchronous: bool = False) -> Dict[str, Any]:
+        """Run the test, with the scenarios' own output silenced, and summarize it"""
+        self.prepare()
+        stop: threading.Event = threading.Event()
+        threading.Thread(
+            target=self._report_progress, args=(stop,), daemon=True
+        ).start()
+        try:
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                if asynchronous:
+                    asyncio.run(self._arun())
+                else:
+                    users: List[threading.Thread] = [
+                        threading.Thread(target=self._user, args=(i,), daemon=True)
+                        for i in range(self.users)
+                    ]
+                    for thread in users:
+                        thread.start()
+                    for thread in users:
+                        thread.join()
+        finally:
+            stop.set()
+        elapsed: float = time.monotonic() - self.started
+        return {
+            "users": self.users,
+            "duration": self.duration,
+            "ramp_up": self.ramp_up,
+            "rate": self.bucket.max_rate,
+            "elapsed": elapsed,
+            "iterations": self.recorder.iterations,
+            "failures": self.recorder.failures,
+            "requests": self.recorder.summary(elapsed),
+        }
+
+    async def _arun(self) -> None:
+        from client import drain
+
+        try:
+            await asyncio.gather(*(self._auser(i) for i in range(self.users)))
+        finally:
+            await drain()
+
+
+def format_summary(summary: Dict[str, Any]) -> str:
+    """summary's requests as a table, latencies in milliseconds"""
+    names: List[str] = [f"{i['namespace']}.{i['request']}" for i in summary["requests"]]
+    width: int = max([len(i) for i in names] + [len("request")])
+    lines: List[str] = [
+        f"{summary['iterations']} scenario runs ({summary['failures']} failed) by "
+        f"{summary['users']} users in {summary['elapsed']:.1f}s",
+        f"{'request':<{width}} {'count':>7} {'errors':>6} {'req/s':>7} "
+        + " ".join(f"{'p' + str(q) + ' ms':>9}" for q in PERCENTILES),
+    ]
+    for name, row in zip(names, summary["requests"]):
+        lines.append(
+            f"{name:<{width}} {row['count']:>7} {row['errors']:>6} "
+            f"{row['throughput']:>7.2f} "
+            + " ".join(f"{row[f'p{q}'] * 1000:>9.1f}" for q in PERCENTILES)
+        )
+    return "\n".join(lines)
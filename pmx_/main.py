@@ -1,25 +1,41 @@
+import cProfile
+import io
 import json
 import logging
 import os
 import shutil
-import subprocess
 import sys
-from zipfile import ZipFile
-from typing import Any, Dict, List
+import time
+from concurrent import futures
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import click
 from jinja2 import Environment, FileSystemLoader, Template, select_autoescape
 
 from pmx_.constants import (
-    NEWLINE,
+    CACHE_DIR_NAME,
     EXPORT_DIR_EXCLUDES,
     EXPORT_FILE_EXCLUDES,
+    RUNTIME_MODULES,
 )
 from pmx_.fragments import (
     EXPORT_README,
     EXPORT_REQUIREMENTS,
 )
+from pmx_ import formatting
+from pmx_.archive import COMPRESSION_METHODS, ArchiveBuilder, walk_export
+from pmx_.fetch import (
+    POSTMAN_API_URL,
+    FetchError,
+    PostmanFetcher,
+    write_collection,
+    write_environment,
+)
+from pmx_.manifest import Manifest
 from pmx_.pm.collection import Collection
+from pmx_.profiling import PROFILER
+from pmx_.sinks import DirectorySink, Sink, TeeSink, ZipSink
+from pmx_.stream import JsonStream, iter_collection
 
 logging.getLogger("blib2to3").setLevel(logging.ERROR)
 
@@ -31,65 +47,309 @@ TEMPLATE_ENV: Environment = Environment(
 )
 
 
-def setup_workspace(dir: str, collection: str, environment_id: str):
+def setup_workspace(
+    dir: str,
+    collection_id: Optional[str],
+    environment_id: Optional[str],
+    from_file: Optional[str] = None,
+    env_file: Optional[str] = None,
+    offline: bool = False,
+    api_url: str = POSTMAN_API_URL,
+    cache_dir: Optional[str] = None,
+    runtime: bool = True,
+):
+    prepare_workspace(dir, runtime=runtime)
+    collection_path: str = os.path.join(WORKSPACE_DIR, "collection.json")
+    env_path: str = os.path.join(WORKSPACE_DIR, "vars", "env.local.json")
+
+    paths: Dict[str, str] = {}
+    if from_file:
+        with open(from_file, "rb") as reader:
+            write_collection(reader, collection_path)
+    elif collection_id:
+        paths["collection"] = f"collections/{collection_id}"
+    else:
+        print("Need a --collection-id or --from-file. bugging out")
+        sys.exit(1)
+
+    if env_file:
+        with open(env_file, "rb") as reader:
+            write_environment(reader.read(), env_path)
+    elif environment_id:
+        paths["environment"] = f"environments/{environment_id}"
+    elif not os.path.isfile(env_path):
+        logging.warning(f"No environment given, {env_path} needs to be filled in")
+
+    if paths:
+        fetcher: PostmanFetcher = PostmanFetcher(
+            os.environ.get("POSTMAN_API_KEY", str()),
+            api_url=api_url,
+            cache_dir=os.path.join(
+                cache_dir or os.path.join(WORKSPACE_DIR, CACHE_DIR_NAME), "postman"
+            ),
+            offline=offline,
+        )
+        try:
+            fetched: Dict[str, bytes] = fetcher.fetch_all(paths)
+        except FetchError as e:
+            print(f"{e}. bugging out")
+            sys.exit(1)
+        finally:
+            fetcher.close()
+        if "collection" in fetched:
+            write_collection(io.BytesIO(fetched["collection"]), collection_path)
+        if "environment" in fetched:
+            write_environment(fetched["environment"], env_path)
+
+
+def prepare_workspace(dir: str, runtime: bool = True):
+    """Point the exporter at dir and copy the runtime support files into it"""
     global WORKSPACE_DIR
 
     WORKSPACE_DIR = os.path.abspath(dir)
-    os.makedirs(WORKSPACE_DIR, exist_ok=True)
-
-    shutil.copyfile(
-        os.path.join(THIS_DIR, "client.py"), os.path.join(WORKSPACE_DIR, "client.py")
+    os.makedirs(os.path.join(WORKSPACE_DIR, "vars"), exist_ok=True)
+    if not runtime:
+        return
+
+    for module in RUNTIME_MODULES:
+        shutil.copyfile(
+            os.path.join(THIS_DIR, module), os.path.join(WORKSPACE_DIR, module)
+        )
+
+    # the user's own once it's there
+    kept: List[str] = (
+        ["custom_vars.py"]
+        if os.path.isfile(os.path.join(WORKSPACE_DIR, "vars", "custom_vars.py"))
+        else []
     )
-
     shutil.copytree(
         os.path.join(THIS_DIR, "vars"),
         os.path.join(WORKSPACE_DIR, "vars"),
+        ignore=shutil.ignore_patterns(*kept),
         dirs_exist_ok=True,
     )
 
-    # TODO: DO this in python?
-    run_env: Dict[str, str] = dict(os.environ)
-    run_env["PMX_WORKSPACE_DIR"] = WORKSPACE_DIR
-    subprocess.run(["fish", "./scripts/get_local_env.fish"], cwd=THIS_DIR, env=run_env)
-    subprocess.run(
-        ["fish", "./scripts/get_smoke_collection.fish"], cwd=THIS_DIR, env=run_env
-    )
 
+def runtime_files() -> Dict[str, str]:
+    """Workspace path of each runtime support file, mapped to where it comes from"""
+    result: Dict[str, str] = {
+        os.path.join(WORKSPACE_DIR, i): os.path.join(THIS_DIR, i)
+        for i in RUNTIME_MODULES
+    }
+    vars_dir: str = os.path.join(THIS_DIR, "vars")
+    for afile in sorted(os.listdir(vars_dir)):
+        # global_vars.py is generated from the collection
+        if afile != "global_vars.py" and os.path.isfile(os.path.join(vars_dir, afile)):
+            result[os.path.join(WORKSPACE_DIR, "vars", afile)] = os.path.join(
+                vars_dir, afile
+            )
+    custom_vars: str = os.path.join(WORKSPACE_DIR, "vars", "custom_vars.py")
+    if os.path.isfile(custom_vars):
+        result[custom_vars] = custom_vars
+    return result
 
-def post_processing(root_collections: List[Collection]) -> None:
+
+def write_namespace(collection: Collection) -> Tuple[str, float, List[str]]:
+    """Render, format and write a single namespace; safe to run in a worker process"""
+    start: float = time.process_time()
+    collection.attach(TEMPLATE_ENV)
+    outputs: List[str] = collection.write_scenario()
+    return collection.namespace, time.process_time() - start, outputs
+
+
+def render_namespace(collection: Collection) -> Tuple[str, float, Dict[str, str]]:
+    """Like write_namespace, but hand the files back for the caller to write"""
+    start: float = time.process_time()
+    collection.attach(TEMPLATE_ENV)
+    outputs: Dict[str, str] = collection.render()
+    return collection.namespace, time.process_time() - start, outputs
+
+
+def write_namespace_in_worker(
+    collection: Collection,
+) -> Tuple[Tuple[str, float, List[str]], List[Dict[str, Any]]]:
+    """write_namespace, plus the profile records the worker made for it"""
+    return write_namespace(collection), PROFILER.drain()
+
+
+def render_namespace_in_worker(
+    collection: Collection,
+) -> Tuple[Tuple[str, float, Dict[str, str]], List[Dict[str, Any]]]:
+    return render_namespace(collection), PROFILER.drain()
+
+
+def configure_templates(asynchronous: bool = False) -> None:
+    """Set what every template renders with, in this process"""
+    TEMPLATE_ENV.globals["asynchronous"] = asynchronous
+
+
+def init_worker(
+    profile: bool, profile_memory: bool, cache_dir: Optional[str], asynchronous: bool
+):
+    if profile:
+        PROFILER.enable(profile_memory)
+    formatting.configure(cache_dir)
+    configure_templates(asynchronous)
+
+
+class NamespaceWriter:
+    """Writes each namespace as soon as the parser has finished with it
+
+    With more than one job the work goes to a process pool; the number of
+    namespaces in flight is capped so raw postman data can't pile up behind it.
+    With batch_format namespaces are only rendered as they come in, and black
+    runs over all of them in one pool once the whole tree has been read.
+
+    Files go to sink when there is one, in which case every namespace is
+    regenerated, and the manifest is only kept if there is a tree on disk.
+    """
+
+    def __init__(
+        self,
+        jobs: int = 1,
+        force: bool = False,
+        cache_dir: Optional[str] = None,
+        batch_format: bool = False,
+        sink: Optional[Sink] = None,
+        tree: bool = True,
+        asynchronous: bool = False,
+    ) -> None:
+        self.sink: Optional[Sink] = sink
+        self.tree: bool = tree
+        self.manifest: Manifest = Manifest(
+            WORKSPACE_DIR,
+            force=force or bool(sink),
+            settings={"asynchronous": asynchronous},
+        )
+        self.jobs: int = jobs or os.cpu_count() or 1
+        self.batch_format: bool = batch_format
+        formatting.configure(cache_dir)
+        self.executor: Optional[futures.ProcessPoolExecutor] = None
+        if self.jobs > 1 and not batch_format:
+            self.executor = futures.ProcessPoolExecutor(
+                max_workers=self.jobs,
+                initializer=init_worker,
+                initargs=(PROFILER.enabled, PROFILER.memory, cache_dir, asynchronous),
+            )
+        self.pending: Dict[futures.Future, Collection] = {}
+        self.rendered: List[Tuple[Collection, Dict[str, str]]] = []
+        self.written: int = 0
+        self.busy: float = 0.0
+        self.start: float = time.perf_counter()
+
+    def __call__(self, coll: Collection) -> None:
+        if self.manifest.is_current(coll.namespace, coll.digest):
+            self.manifest.keep(coll.namespace)
+            coll.release()
+        elif self.batch_format:
+            self.rendered.append((coll, coll.render(formatted=False)))
+            coll.release()
+        elif self.executor:
+            if len(self.pending) >= self.jobs * 4:
+                self._drain(futures.FIRST_COMPLETED)
+            worker: Callable[[Collection], Any] = (
+                render_namespace_in_worker if self.sink else write_namespace_in_worker
+            )
+            self.pending[self.executor.submit(worker, coll)] = coll
+        elif self.sink:
+            self._record_rendered(coll, render_namespace(coll))
+        else:
+            self._record(coll, write_namespace(coll))
+
+    def _record_rendered(
+        self, coll: Collection, result: Tuple[str, float, Dict[str, str]]
+    ) -> None:
+        namespace, elapsed, outputs = result
+        self._record(coll, (namespace, elapsed, coll.write_outputs(outputs, self.sink)))
+
+    def _record(self, coll: Collection, result: Tuple[str, float, List[str]]) -> None:
+        namespace, elapsed, outputs = result
+        self.manifest.record(namespace, coll.digest, coll.collection_dir, outputs)
+        self.written += 1
+        self.busy += elapsed
+        coll.release()
+
+    def _drain(self, return_when: str = futures.ALL_COMPLETED) -> None:
+        done, _ = futures.wait(self.pending, return_when=return_when)
+        for future in done:
+            result, records = future.result()
+            PROFILER.merge(records)
+            if self.sink:
+                self._record_rendered(self.pending.pop(future), result)
+            else:
+                self._record(self.pending.pop(future), result)
+
+    def _format_and_write(self) -> None:
+        # -j 1 is the default, so a batch uses every core unless told otherwise
+        formatted: Dict[str, str] = formatting.format_many(
+            {
+                coll.base_scenario_path: outputs[coll.base_scenario_path]
+                for coll, outputs in self.rendered
+                if coll.base_scenario_path in outputs
+            },
+            jobs=0 if self.jobs == 1 else self.jobs,
+        )
+        for coll, outputs in self.rendered:
+            outputs.update(
+                (path, formatted[path]) for path in outputs.keys() & formatted.keys()
+            )
+            self._record_rendered(coll, (coll.namespace, 0.0, outputs))
+        self.rendered = []
+
+    def close(self) -> None:
+        if self.executor:
+            self._drain()
+            self.executor.shutdown()
+        if self.rendered:
+            self._format_and_write()
+        wall: float = time.perf_counter() - self.start
+
+        removed: List[str] = []
+        if self.tree:
+            removed = self.manifest.remove_stale()
+            self.manifest.save()
+
+        # batched formatting happens outside of any one namespace
+        timing: str = (
+            str()
+            if self.batch_format
+            else f" ({self.busy:.2f}s of namespace cpu time, {self.busy / (wall or 1):.1f}x speedup over serial)"
+        )
+        print(
+            f"Wrote {self.written} namespaces in {wall:.2f}s{timing}, "
+            f"{len(self.manifest.current) - self.written} unchanged, {len(removed)} stale files removed"
+        )
+        cache: Optional[formatting.FormatCache] = formatting.FORMAT_CACHE
+        if cache and cache.hits + cache.misses:
+            print(f"black cache: {cache.hits} hits, {cache.misses} misses")
+
+
+def post_processing(
+    root_collections: List[Collection], sink: Optional[Sink] = None
+) -> None:
     if root_collections:
-        with open(os.path.join(WORKSPACE_DIR, "run.py"), "w") as writer:
-
-            def _recurse_collections(
-                coll: Collection, ns_list: Dict[str, Collection]
-            ) -> None:
-                ns_list[coll.namespace] = coll
-                for child in coll.children:
-                    if type(child) is Collection:
-                        _recurse_collections(child, ns_list)
-
-            namespaces: Dict[str, Collection] = {}
-            for root_collection in root_collections:
-                _recurse_collections(root_collection, namespaces)
-
-            render_args: Dict[str, str] = {
-                "import_strings": NEWLINE.join(
-                    [
-                        f"from {ns}.scenarios import tous as {ns.replace('.', '_')}"
-                        for ns in namespaces.keys()
-                        if len(namespaces[ns].requests) > 0
-                    ]
-                ),
-                "import_fns": ", ".join(
-                    [
-                        f"{ns.replace('.', '_')}"
-                        for ns in namespaces.keys()
-                        if len(namespaces[ns].requests) > 0
-                    ]
-                ),
-            }
-            template: Template = TEMPLATE_ENV.get_template("run.py.tmpl")
-            writer.write(template.render(**render_args))
+
+        def _recurse_collections(
+            coll: Collection, ns_list: Dict[str, Collection]
+        ) -> None:
+            ns_list[coll.namespace] = coll
+            for child in coll.children:
+                if type(child) is Collection:
+                    _recurse_collections(child, ns_list)
+
+        namespaces: Dict[str, Collection] = {}
+        for root_collection in root_collections:
+            _recurse_collections(root_collection, namespaces)
+
+        render_args: Dict[str, Any] = {
+            "namespaces": [
+                ns for ns in namespaces.keys() if len(namespaces[ns].requests) > 0
+            ],
+        }
+        template: Template = TEMPLATE_ENV.get_template("run.py.tmpl")
+        (sink or DirectorySink()).write(
+            os.path.join(WORKSPACE_DIR, "run.py"), template.render(**render_args)
+        )
 
 
 def extract_env(input_vars: List[Dict[str, str]]) -> Dict[str, str]:
@@ -125,6 +385,28 @@ def cli():
     envvar="PMX_COLLECTION_ID",
     help="The postman collection id to export",
 )
+@click.option(
+    "--from-file",
+    type=str,
+    help="Export this collection.json instead of fetching one",
+)
+@click.option(
+    "--env-file",
+    type=str,
+    help="Use this postman environment json instead of fetching one",
+)
+@click.option(
+    "--offline",
+    is_flag=True,
+    help="Only use collections and environments fetched before",
+)
+@click.option(
+    "--api-url",
+    type=str,
+    envvar="PMX_POSTMAN_API_URL",
+    default=POSTMAN_API_URL,
+    help="Base url of the postman api",
+)
 @click.option(
     "-d",
     "--dir",
@@ -133,33 +415,286 @@ def cli():
     default="./scenes",
     help="Target directory for generated code",
 )
-def export(dir: str, collection_id: str, environment_id: str):
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=0),
+    default=1,
+    help="Worker processes for rendering namespaces (0 for one per core)",
+)
+@click.option(
+    "-f",
+    "--force",
+    is_flag=True,
+    help="Regenerate every namespace, even those unchanged since the last export",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="Parse collection.json incrementally to bound memory on huge collections",
+)
+@click.option(
+    "--archive",
+    "archive_path",
+    type=str,
+    help="Write the generated project straight into this zip instead of --dir",
+)
+@click.option(
+    "--keep-tree",
+    is_flag=True,
+    help="With --archive, also write the generated files to --dir",
+)
+@click.option(
+    "--batch-format",
+    is_flag=True,
+    help="Render every namespace first, then black them all at once on every core",
+)
+@click.option(
+    "--format-cache/--no-format-cache",
+    default=True,
+    help="Reuse black output for modules rendered identically before",
+)
+@click.option(
+    "--cache-dir",
+    type=str,
+    help="Where fetched documents and black output are cached (default: .pmx_cache in the target directory)",
+)
+@click.option(
+    "--async",
+    "asynchronous",
+    is_flag=True,
+    help="Generate async request functions and client, run in one event loop",
+)
+@click.option(
+    "--profile",
+    is_flag=True,
+    help="Time each export stage and namespace and print a summary",
+)
+@click.option(
+    "--profile-memory",
+    is_flag=True,
+    help="With --profile, also trace peak allocations per stage (much slower)",
+)
+@click.option(
+    "--profile-report",
+    type=str,
+    default="pmx_profile.json",
+    help="Where --profile writes its machine-readable report",
+)
+@click.option(
+    "--pstats",
+    type=str,
+    help="Also run cProfile over the main process and dump pstats here",
+)
+def export(
+    dir: str,
+    collection_id: str,
+    environment_id: str,
+    from_file: Optional[str],
+    env_file: Optional[str],
+    offline: bool,
+    api_url: str,
+    jobs: int,
+    force: bool,
+    stream: bool,
+    archive_path: Optional[str],
+    keep_tree: bool,
+    batch_format: bool,
+    format_cache: bool,
+    cache_dir: Optional[str],
+    asynchronous: bool,
+    profile: bool,
+    profile_memory: bool,
+    profile_report: str,
+    pstats: Optional[str],
+):
     """Export postman data to python"""
-    setup_workspace(dir, collection_id, environment_id)
-
+    if profile:
+        PROFILER.enable(memory=profile_memory)
+    profiler: Optional[cProfile.Profile] = cProfile.Profile() if pstats else None
+    if profiler:
+        profiler.enable()
+
+    start: float = time.perf_counter()
+    with PROFILER.stage("fetch"):
+        setup_workspace(
+            dir,
+            collection_id,
+            environment_id,
+            from_file=from_file,
+            env_file=env_file,
+            offline=offline,
+            api_url=api_url,
+            cache_dir=cache_dir,
+            runtime=keep_tree or not archive_path,
+        )
+    cache_dir = cache_dir or os.path.join(WORKSPACE_DIR, CACHE_DIR_NAME)
+
+    sink: Optional[Sink] = None
+    zip_sink: Optional[ZipSink] = None
+    if archive_path:
+        zip_sink = ZipSink(archive_path, WORKSPACE_DIR)
+        sink = TeeSink([DirectorySink(), zip_sink]) if keep_tree else zip_sink
+    export_collection(
+        jobs,
+        force,
+        stream,
+        cache_dir=cache_dir if format_cache else None,
+        batch_format=batch_format,
+        sink=sink,
+        tree=keep_tree or not archive_path,
+        asynchronous=asynchronous,
+    )
+    if zip_sink:
+        with PROFILER.stage("archive"):
+            write_archive_extras(zip_sink)
+            zip_sink.close()
+        print(f"Archived to {archive_path}")
+    total: float = time.perf_counter() - start
+
+    if profiler:
+        profiler.disable()
+        profiler.dump_stats(pstats)
+    if profile:
+        print(PROFILER.summary())
+        PROFILER.write(
+            profile_report,
+            {
+                "jobs": jobs,
+                "stream": stream,
+                "force": force,
+                "batch_format": batch_format,
+                "format_cache": format_cache,
+                "asynchronous": asynchronous,
+                "total_wall": total,
+            },
+        )
+        print(f"Profile report written to {profile_report}")
+
+
+def export_collection(
+    jobs: int = 1,
+    force: bool = False,
+    stream: bool = False,
+    cache_dir: Optional[str] = None,
+    batch_format: bool = False,
+    sink: Optional[Sink] = None,
+    tree: bool = True,
+    asynchronous: bool = False,
+):
+    """Generate the workspace from the collection.json already fetched into it"""
+    configure_templates(asynchronous)
+    writer: NamespaceWriter = NamespaceWriter(
+        jobs,
+        force,
+        cache_dir,
+        batch_format,
+        sink=sink,
+        tree=tree,
+        asynchronous=asynchronous,
+    )
+    root_collections: List[Collection] = []
+    variables: List[Dict[str, str]] = []
     with open(os.path.join(WORKSPACE_DIR, "collection.json"), "r") as reader:
-        raw: Dict[str, Any] = json.load(reader).get("collection", {})
+        if stream:
+            with PROFILER.stage("build_tree"):
+                for key, value in iter_collection(JsonStream(reader)):
+                    if key == "item":
+                        for item in value:
+                            root_collections.append(
+                                Collection(
+                                    item,
+                                    WORKSPACE_DIR,
+                                    WORKSPACE_DIR,
+                                    [],
+                                    TEMPLATE_ENV,
+                                    on_complete=writer,
+                                )
+                            )
+                    elif key == "variable":
+                        variables = value
+        else:
+            with PROFILER.stage("load_json"):
+                raw: Dict[str, Any] = json.load(reader).get("collection", {})
+            variables = raw.get("variable", [])
+            with PROFILER.stage("build_tree"):
+                for item in raw.get("item", []):
+                    root_collections.append(
+                        Collection(
+                            item,
+                            WORKSPACE_DIR,
+                            WORKSPACE_DIR,
+                            [],
+                            TEMPLATE_ENV,
+                            on_complete=writer,
+                        )
+                    )
 
-        env: Dict[str, str] = extract_env(raw.get("variable", []))
-        with open(os.path.join(WORKSPACE_DIR, "vars", "global_vars.py"), "w") as writer:
-            writer.write(
-                f"""GLOBAL_VARS = {json.dumps(env, indent="    ", separators=(",", ":"), sort_keys=True)}"""
-            )
+    env: Dict[str, str] = extract_env(variables)
+    (sink or DirectorySink()).write(
+        os.path.join(WORKSPACE_DIR, "vars", "global_vars.py"),
+        f"""GLOBAL_VARS = {json.dumps(env, indent="    ", separators=(",", ":"), sort_keys=True)}""",
+    )
 
-        root_collections: List[Collection] = []
-        for item in raw.get("item", []):
-            root_collection: Collection = Collection(
-                item, WORKSPACE_DIR, WORKSPACE_DIR, [], TEMPLATE_ENV
-            )
-            root_collection.write_scenario()
-            root_collections.append(root_collection)
+    with PROFILER.stage("wait_for_workers"):
+        writer.close()
+    with PROFILER.stage("post_processing"):
+        post_processing(root_collections, sink)
 
-        post_processing(root_collections)
+
+def write_archive_extras(zip_sink: ZipSink) -> None:
+    """Everything besides the generated code that `archive` would have bundled"""
+    zip_sink.write(os.path.join(WORKSPACE_DIR, "README.md"), EXPORT_README)
+    zip_sink.write(os.path.join(WORKSPACE_DIR, "requirements.txt"), EXPORT_REQUIREMENTS)
+    for path, source in runtime_files().items():
+        zip_sink.copy(source, path)
+    env_path: str = os.path.join(WORKSPACE_DIR, "vars", "env.local.json")
+    if os.path.isfile(env_path):
+        zip_sink.copy(env_path, env_path)
 
 
 @click.command()
 @click.option("-d", "--dir", default="./scenes", help="Directory to archive")
-def archive(dir):
+@click.option(
+    "-o",
+    "--output",
+    type=str,
+    help="Zip to write (default: <dir name>.zip in the current directory)",
+)
+@click.option(
+    "-m",
+    "--compression",
+    type=click.Choice(list(COMPRESSION_METHODS)),
+    default="deflated",
+    help="Compression method for every member",
+)
+@click.option(
+    "-l",
+    "--level",
+    type=int,
+    help="Compression level (0-9 for deflated, 1-9 for bzip2; lzma ignores it)",
+)
+@click.option(
+    "-j",
+    "--jobs",
+    type=click.IntRange(min=0),
+    default=0,
+    help="Threads compressing members (0 for one per core)",
+)
+@click.option(
+    "-u",
+    "--update",
+    is_flag=True,
+    help="Only recompress members whose size, mtime or content changed",
+)
+def archive(
+    dir: str,
+    output: Optional[str],
+    compression: str,
+    level: Optional[int],
+    jobs: int,
+    update: bool,
+):
     """Make a ready-to-run  archive for sharing"""
     export_dir: str = os.path.abspath(dir)
     if not os.path.isdir(export_dir):
@@ -167,21 +702,25 @@ def archive(dir):
         sys.exit(1)
 
     bn: str = os.path.basename(export_dir)
-    with ZipFile(f"{bn}.zip", "w") as ex_zip:
-        ex_zip.writestr(os.path.join(bn, "README.md"), EXPORT_README)
-        ex_zip.writestr(os.path.join(bn, "requirements.txt"), EXPORT_REQUIREMENTS)
-
-        for root, _, files in os.walk(export_dir):
-            for afile in files:
-                if all([i not in root for i in EXPORT_DIR_EXCLUDES]):
-                    if all([i != afile for i in EXPORT_FILE_EXCLUDES]):
-                        fullpath = os.path.join(root, afile)
-                        ex_zip.write(
-                            fullpath,
-                            arcname=fullpath.replace(
-                                os.path.dirname(export_dir), str()
-                            )[1:],
-                        )
+    start: float = time.perf_counter()
+    builder: ArchiveBuilder = ArchiveBuilder(
+        output or f"{bn}.zip",
+        compression=COMPRESSION_METHODS[compression],
+        level=level,
+        jobs=jobs,
+        update=update,
+    )
+    members: List[str] = builder.build(
+        walk_export(export_dir, EXPORT_DIR_EXCLUDES, EXPORT_FILE_EXCLUDES),
+        extras={
+            os.path.join(bn, "README.md"): EXPORT_README.encode(),
+            os.path.join(bn, "requirements.txt"): EXPORT_REQUIREMENTS.encode(),
+        },
+    )
+    print(
+        f"Archived {len(members)} files to {builder.zip_path} ({os.path.getsize(builder.zip_path)} bytes) "
+        f"in {time.perf_counter() - start:.2f}s, {builder.compressed} compressed, {builder.reused} unchanged"
+    )
 
 
 cli.add_command(export)
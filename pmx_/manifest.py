@@ -0,0 +1,122 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from pmx_ import __version__
+
+THIS_DIR: str = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_FILE: str = ".pmx_manifest.json"
+
+
+def digest(obj: Any) -> str:
+    """Stable content hash of a chunk of postman json"""
+    return hashlib.sha256(
+        json.dumps(obj, sort_keys=True, separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+def fingerprint(settings: Optional[Dict[str, Any]] = None) -> str:
+    """Hash of everything besides collection.json that shapes the generated code"""
+    hasher = hashlib.sha256(__version__.encode())
+    # export options that change what's generated, e.g. --async
+    if settings:
+        hasher.update(digest(settings).encode())
+    templates_dir: str = os.path.join(THIS_DIR, "templates")
+    for name in sorted(os.listdir(templates_dir)):
+        with open(os.path.join(templates_dir, name), "rb") as reader:
+            hasher.update(name.encode())
+            hasher.update(reader.read())
+    return hasher.hexdigest()
+
+
+class Manifest:
+    """Record of what each namespace was generated from and which files it wrote"""
+
+    def __init__(
+        self,
+        workspace_dir: str,
+        force: bool = False,
+        settings: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.workspace_dir: str = workspace_dir
+        self.path: str = os.path.join(workspace_dir, MANIFEST_FILE)
+        self.fingerprint: str = fingerprint(settings)
+
+        self.previous: Dict[str, Dict[str, Any]] = {}
+        self.current: Dict[str, Dict[str, Any]] = {}
+        if os.path.isfile(self.path):
+            with open(self.path, "r") as reader:
+                raw: Dict[str, Any] = json.load(reader)
+            # a different pmx_, template set or settings invalidates everything, but the
+            # old outputs are still needed to clean up after deleted items
+            self.previous = raw.get("namespaces", {})
+            if force or raw.get("fingerprint") != self.fingerprint:
+                for entry in self.previous.values():
+                    entry["digest"] = str()
+
+    def is_current(self, namespace: str, content_digest: str) -> bool:
+        entry: Dict[str, Any] = self.previous.get(namespace, {})
+        if not entry or entry.get("digest") != content_digest:
+            return False
+        return all(
+            os.path.isfile(os.path.join(self.workspace_dir, i))
+            for i in entry.get("outputs", [])
+        )
+
+    def keep(self, namespace: str) -> None:
+        self.current[namespace] = self.previous[namespace]
+
+    def record(
+        self,
+        namespace: str,
+        content_digest: str,
+        directory: str,
+        outputs: Iterable[str],
+    ) -> None:
+        self.current[namespace] = {
+            "digest": content_digest,
+            "dir": os.path.relpath(directory, self.workspace_dir),
+            "outputs": sorted(os.path.relpath(i, self.workspace_dir) for i in outputs),
+        }
+
+    def remove_stale(self) -> List[str]:
+        """Delete files written by a previous export that this export didn't produce"""
+        produced: Set[str] = set()
+        for entry in self.current.values():
+            produced.update(entry["outputs"])
+
+        removed: List[str] = []
+        for entry in self.previous.values():
+            for output in entry.get("outputs", []):
+                if output not in produced:
+                    try:
+                        os.remove(os.path.join(self.workspace_dir, output))
+                        removed.append(output)
+                    except FileNotFoundError:
+                        pass
+
+        # children come after their parents, so walk backwards to empty them first
+        for namespace, entry in reversed(list(self.previous.items())):
+            if namespace not in self.current:
+                # only drop the directories if nothing else (responses, etc) lives there
+                ns_dir: str = os.path.join(self.workspace_dir, entry.get("dir", str()))
+                for directory in (os.path.join(ns_dir, "data"), ns_dir):
+                    try:
+                        os.rmdir(directory)
+                    except OSError:
+                        pass
+        return removed
+
+    def save(self) -> None:
+        with open(self.path, "w") as writer:
+            json.dump(
+                {
+                    "version": __version__,
+                    "fingerprint": self.fingerprint,
+                    "namespaces": self.current,
+                },
+                writer,
+                indent=2,
+                sort_keys=True,
+            )
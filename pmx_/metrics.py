@@ -0,0 +1,402 @@
+import bisect
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# upper bounds in seconds, as Prometheus' default buckets plus a few slow ones
+BUCKETS: Tuple[float, ...] = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+PHASES: Tuple[str, ...] = ("wait", "connect", "ttfb", "total")
+QUANTILES: Tuple[int, ...] = (50, 95, 99)
+
+# the Sample of the call a connection is working for, if any
+_SAMPLE: contextvars.ContextVar[Optional["Sample"]] = contextvars.ContextVar(
+    "pmx_sample", default=None
+)
+# the waits of the calls finished in the current waits() block, if any
+_WAITS: contextvars.ContextVar[Optional[List[float]]] = contextvars.ContextVar(
+    "pmx_waits", default=None
+)
+
+
+class Sample:
+    """One call through BoostClient: its tags, timings in seconds and sizes
+
+    wait is whatever of the call wasn't spent on HTTP attempts, i.e. pacing and
+    backing off. connect covers new connections only, reused ones cost nothing.
+    ttfb runs from the start of the last attempt to its response's headers.
+    """
+
+    def __init__(self, namespace: str, greek: str, method: str) -> None:
+        self.namespace: str = namespace
+        self.greek: str = greek
+        self.method: str = method
+        self.status: int = 0
+        self.sent: int = 0
+        self.received: int = 0
+        self.wait: float = 0.0
+        self.connect: float = 0.0
+        self.ttfb: float = 0.0
+        self.total: float = 0.0
+        self.started: float = time.perf_counter()
+        self.attempt_started: float = self.started
+        self.sending: float = 0.0
+
+    def timed(self, send, *args, **kwargs) -> Any:
+        """send(*args, **kwargs), as one attempt of this call"""
+        token: contextvars.Token = _SAMPLE.set(self)
+        self.attempt_started = time.perf_counter()
+        try:
+            return send(*args, **kwargs)
+        finally:
+            self.sending += time.perf_counter() - self.attempt_started
+            _SAMPLE.reset(token)
+
+    async def atimed(self, send, *args, **kwargs) -> Any:
+        token: contextvars.Token = _SAMPLE.set(self)
+        self.attempt_started = time.perf_counter()
+        try:
+            return await send(*args, **kwargs)
+        finally:
+            self.sending += time.perf_counter() - self.attempt_started
+            _SAMPLE.reset(token)
+
+    def headers_received(self) -> None:
+        self.ttfb = time.perf_counter() - self.attempt_started
+
+    def finish(self, response: Optional[Any]) -> "Sample":
+        """Done, with response or None if the call raised, leaving status 0"""
+        self.total = time.perf_counter() - self.started
+        self.wait = max(self.total - self.sending, 0.0)
+        waits: Optional[List[float]] = _WAITS.get()
+        if waits is not None:
+            waits.append(self.wait)
+        if response is None:
+            return self
+        self.status = response.status_code
+        self.sent = _body_size(response.request)
+        self.received = _received(response)
+        return self
+
+
+@contextlib.contextmanager
+def waits() -> Iterator[List[float]]:
+    """The wait of each call finished in the block, or the threads it starts
+
+    An enclosing block gets them too once this one ends.
+    """
+    collected: List[float] = []
+    token: contextvars.Token = _WAITS.set(collected)
+    try:
+        yield collected
+    finally:
+        _WAITS.reset(token)
+        outer: Optional[List[float]] = _WAITS.get()
+        if outer is not None:
+            outer.extend(collected)
+
+
+def _body_size(request: Any) -> int:
+    # requests' prepared body, or httpx's
+    body: Any = getattr(request, "body", None)
+    if body is None:
+        body = getattr(request, "content", None)
+    if isinstance(body, str):
+        return len(body.encode())
+    return len(body) if isinstance(body, (bytes, bytearray)) else 0
+
+
+def _received(response: Any) -> int:
+    """Body bytes as they came over the wire, before decompressing"""
+    if hasattr(response, "num_bytes_downloaded"):
+        return response.num_bytes_downloaded
+    try:
+        return response.raw.tell()
+    except (AttributeError, OSError):
+        return len(response.content)
+
+
+def dequeued(send, *args, **kwargs) -> Any:
+    """send(*args, **kwargs), restarting the current attempt's clock first
+
+    For work that waited in a queue, e.g. for a thread, so that the time spent
+    there counts as wait rather than ttfb.
+    """
+    sample: Optional[Sample] = _SAMPLE.get()
+    if sample is not None:
+        sample.attempt_started = time.perf_counter()
+    return send(*args, **kwargs)
+
+
+class _TimedConnection:
+    """Reports connecting and receiving headers to the current Sample"""
+
+    def connect(self) -> None:
+        start: float = time.perf_counter()
+        super().connect()  # type: ignore
+        sample: Optional[Sample] = _SAMPLE.get()
+        if sample is not None:
+            sample.connect += time.perf_counter() - start
+
+    def getresponse(self, *args, **kwargs) -> Any:
+        response: Any = super().getresponse(*args, **kwargs)  # type: ignore
+        sample: Optional[Sample] = _SAMPLE.get()
+        if sample is not None:
+            sample.headers_received()
+        return response
+
+
+class TimedHTTPConnection(_TimedConnection, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnection, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection  # type: ignore
+
+
+class TimedAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections report to the current Sample"""
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+
+async def trace(event: str, info: Dict[str, Any]) -> None:
+    """httpx's trace extension, doing what the timed connections do for requests"""
+    sample: Optional[Sample] = _SAMPLE.get()
+    if sample is None:
+        return
+    # take away the start and add the end, leaving how long it took
+    if event in ("connection.connect_tcp.started", "connection.start_tls.started"):
+        sample.connect -= time.perf_counter()
+    elif event in ("connection.connect_tcp.complete", "connection.start_tls.complete"):
+        sample.connect += time.perf_counter()
+    elif event.endswith(".receive_response_headers.complete"):
+        sample.headers_received()
+
+
+class Histogram:
+    """Counts of observations at or under each of bounds, plus the ones above"""
+
+    def __init__(self, bounds: Sequence[float] = BUCKETS) -> None:
+        self.bounds: Sequence[float] = bounds
+        self.counts: List[int] = [0] * (len(bounds) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.min: float = float("inf")
+        self.max: float = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other: "Histogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """Estimated, interpolating within the bucket it falls in and min..max"""
+        if not self.count:
+            return 0.0
+        rank: float = q / 100 * self.count
+        seen: int = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower: float = max(self.bounds[index - 1] if index else 0.0, self.min)
+                upper: float = min(
+                    self.bounds[index] if index < len(self.bounds) else self.max,
+                    self.max,
+                )
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+
+class Series:
+    """Everything recorded for one (namespace, greek, method)"""
+
+    def __init__(self) -> None:
+        self.phases: Dict[str, Histogram] = {i: Histogram() for i in PHASES}
+        self.statuses: Dict[int, int] = {}
+        self.sent: int = 0
+        self.received: int = 0
+
+    def observe(self, sample: Sample) -> None:
+        for phase, histogram in self.phases.items():
+            histogram.observe(getattr(sample, phase))
+        self.statuses[sample.status] = self.statuses.get(sample.status, 0) + 1
+        self.sent += sample.sent
+        self.received += sample.received
+
+    def merge(self, other: "Series") -> None:
+        for phase, histogram in self.phases.items():
+            histogram.merge(other.phases[phase])
+        for status, count in other.statuses.items():
+            self.statuses[status] = self.statuses.get(status, 0) + count
+        self.sent += other.sent
+        self.received += other.received
+
+
+Key = Tuple[str, str, str]
+
+
+def _labels(key: Key, **extra: Any) -> str:
+    pairs: Dict[str, Any] = dict(zip(("namespace", "greek", "method"), key))
+    pairs.update(extra)
+    escaped: List[str] = [
+        '{}="{}"'.format(
+            k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for k, v in pairs.items()
+    ]
+    return "{" + ",".join(escaped) + "}"
+
+
+class Metrics:
+    """Every Sample of the process, as histograms by (namespace, greek, method)"""
+
+    def __init__(self) -> None:
+        self.series: Dict[Key, Series] = {}
+        self._lock: threading.Lock = threading.Lock()
+
+    def observe(self, sample: Sample) -> None:
+        key: Key = (sample.namespace, sample.greek, sample.method)
+        with self._lock:
+            if key not in self.series:
+                self.series[key] = Series()
+            self.series[key].observe(sample)
+
+    def drain(self) -> Dict[Key, Series]:
+        """Take everything recorded so far, e.g. to hand it to the parent process"""
+        with self._lock:
+            series, self.series = self.series, {}
+        return series
+
+    def merge(self, series: Dict[Key, Series]) -> None:
+        with self._lock:
+            for key, other in series.items():
+                if key not in self.series:
+                    self.series[key] = Series()
+                self.series[key].merge(other)
+
+    def summary(self) -> List[Dict[str, Any]]:
+        rows: List[Dict[str, Any]] = []
+        with self._lock:
+            for key, series in sorted(self.series.items()):
+                row: Dict[str, Any] = dict(zip(("namespace", "greek", "method"), key))
+                row["count"] = series.phases["total"].count
+                row["statuses"] = {
+                    str(k): v for k, v in sorted(series.statuses.items())
+                }
+                row["sent_bytes"] = series.sent
+                row["received_bytes"] = series.received
+                for phase, histogram in series.phases.items():
+                    row[phase] = {
+                        "mean": (
+                            histogram.sum / histogram.count if histogram.count else 0
+                        ),
+                        "max": histogram.max,
+                        **{f"p{q}": histogram.quantile(q) for q in QUANTILES},
+                    }
+                rows.append(row)
+        return rows
+
+    def prometheus(self) -> str:
+        """Everything recorded, in Prometheus' text exposition format"""
+        lines: List[str] = [
+            "# HELP pmx_request_seconds Time BoostClient calls spent in each phase",
+            "# TYPE pmx_request_seconds histogram",
+        ]
+        counters: List[str] = [
+            "# HELP pmx_requests_total BoostClient calls by response status",
+            "# TYPE pmx_requests_total counter",
+        ]
+        sizes: List[str] = [
+            "# HELP pmx_request_bytes_total Body bytes sent and received on the wire",
+            "# TYPE pmx_request_bytes_total counter",
+        ]
+        with self._lock:
+            for key, series in sorted(self.series.items()):
+                for phase, histogram in series.phases.items():
+                    cumulative: int = 0
+                    for bound, count in zip(histogram.bounds, histogram.counts):
+                        cumulative += count
+                        lines.append(
+                            f"pmx_request_seconds_bucket"
+                            f"{_labels(key, phase=phase, le=bound)} {cumulative}"
+                        )
+                    lines.append(
+                        f"pmx_request_seconds_bucket"
+                        f"{_labels(key, phase=phase, le='+Inf')} {histogram.count}"
+                    )
+                    lines.append(
+                        f"pmx_request_seconds_sum{_labels(key, phase=phase)} "
+                        f"{histogram.sum}"
+                    )
+                    lines.append(
+                        f"pmx_request_seconds_count{_labels(key, phase=phase)} "
+                        f"{histogram.count}"
+                    )
+                for status, count in sorted(series.statuses.items()):
+                    counters.append(
+                        f"pmx_requests_total{_labels(key, status=status)} {count}"
+                    )
+                sizes.append(
+                    f"pmx_request_bytes_total{_labels(key, direction='sent')} "
+                    f"{series.sent}"
+                )
+                sizes.append(
+                    f"pmx_request_bytes_total{_labels(key, direction='received')} "
+                    f"{series.received}"
+                )
+        return "\n".join(lines + counters + sizes) + "\n"
+
+    def write(self, json_path: str, prometheus_path: str) -> None:
+        for path in (json_path, prometheus_path):
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(json_path, "w") as writer:
+            json.dump(self.summary(), writer, indent=2)
+        with open(prometheus_path, "w") as writer:
+            writer.write(self.prometheus())
+
+
+METRICS: Metrics = Metrics()
@@ -0,0 +1,239 @@
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    # PMX_RESPONSE_COMPRESSION=zstd falls back to gzip
+    zstandard = None
+
+THIS_DIR: str = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR: str = os.path.join(THIS_DIR, ".pmx_results")
+STORES: Tuple[str, ...] = ("files", "jsonl", "sqlite")
+COMPRESSIONS: Dict[str, str] = {"none": str(), "gzip": ".gz", "zstd": ".zst"}
+# taken off the queue and written in one go
+BATCH: int = 200
+
+logger = logging.getLogger(__name__)
+
+
+def run_id() -> str:
+    """The run's id, made by the first process and inherited by its workers"""
+    if "PMX_RUN_ID" not in os.environ:
+        os.environ["PMX_RUN_ID"] = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+    return os.environ["PMX_RUN_ID"]
+
+
+class Saved:
+    """A response waiting to be written, with what's needed to file it"""
+
+    __slots__ = ("directory", "namespace", "greek", "method", "url", "status", "body")
+
+    def __init__(self, directory: str, namespace: str, greek: str, response: Any):
+        self.directory: str = directory
+        self.namespace: str = namespace
+        self.greek: str = greek
+        self.method: str = response.request.method
+        self.url: str = str(response.url)
+        self.status: int = response.status_code
+        # the bytes as received, decoding and reformatting is left to the writer
+        self.body: bytes = response.content
+
+
+class ResponseWriter:
+    """Writes saved responses on a background thread, in the order they came
+
+    store is one of:
+    - files: one file per response under its client's response_dir, named as
+      always, {type}-{greek}.json, plus the compression's suffix
+    - jsonl: one line per response in .pmx_results/responses-{run}-{pid}.jsonl
+    - sqlite: one row per response in .pmx_results/responses-{run}.sqlite,
+      shared by the run's processes
+
+    Compressed JSONL is written as a gzip member or zstd frame per batch, so
+    the file is always whole up to the last flush. save blocks while the queue
+    is full, and everything queued is written at exit.
+    """
+
+    def __init__(
+        self,
+        store: str = "files",
+        compression: str = "none",
+        pretty: bool = False,
+        queue_size: int = 1000,
+    ) -> None:
+        if store not in STORES:
+            raise ValueError(f"store must be one of {', '.join(STORES)}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"compression must be one of {', '.join(COMPRESSIONS)}")
+        if compression == "zstd" and zstandard is None:
+            logger.warning("zstandard isn't installed, compressing with gzip")
+            compression = "gzip"
+        self.store: str = store
+        self.compression: str = compression
+        self.pretty: bool = pretty
+        self.queue: "queue.Queue[Optional[Saved]]" = queue.Queue(queue_size)
+        self.written: int = 0
+        self._thread: Optional[threading.Thread] = None
+        self._pid: int = os.getpid()
+        self._lock: threading.Lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+
+    @classmethod
+    def from_env(cls) -> "ResponseWriter":
+        return cls(
+            store=os.environ.get("PMX_RESPONSE_STORE", "files"),
+            compression=os.environ.get("PMX_RESPONSE_COMPRESSION", "none"),
+            pretty=os.environ.get("PMX_RESPONSE_PRETTY", "0") == "1",
+            queue_size=int(os.environ.get("PMX_RESPONSE_QUEUE", 1000)),
+        )
+
+    def save(self, directory: str, namespace: str, greek: str, response: Any) -> None:
+        with self._lock:
+            if self._pid != os.getpid():
+                # a forked worker, which has the queue but not the thread
+                self.queue = queue.Queue(self.queue.maxsize)
+                self._thread = None
+                self._db = None
+                self._pid = os.getpid()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="pmx-responses", daemon=True
+                )
+                self._thread.start()
+        self.queue.put(Saved(directory, namespace, greek, response))
+
+    def flush(self) -> None:
+        """Wait until every response saved so far is written"""
+        if self._thread is not None and self._pid == os.getpid():
+            self.queue.join()
+
+    def close(self) -> None:
+        if self._thread is not None and self._pid == os.getpid():
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            batch: List[Optional[Saved]] = [self.queue.get()]
+            while batch[-1] is not None and len(batch) < BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            saved: List[Saved] = [i for i in batch if i is not None]
+            try:
+                if saved:
+                    getattr(self, f"_write_{self.store}")(saved)
+                    self.written += len(saved)
+            except Exception:
+                logger.exception("Couldn't write %s responses", len(saved))
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+            if batch[-1] is None:
+                if self._db is not None:
+                    self._db.close()
+                    self._db = None
+                return
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == "gzip":
+            return gzip.compress(data, compresslevel=6)
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor().compress(data)
+        return data
+
+    def _write_files(self, saved: List[Saved]) -> None:
+        for item in saved:
+            body: bytes = item.body
+            try:
+                parsed: Any = json.loads(body)
+            except ValueError:
+                parsed = None
+            data: Any = parsed.get("data", {}) if isinstance(parsed, dict) else {}
+            type_hint: str = data.get("type", str()) if type(data) is dict else str()
+            name: str = f"{type_hint}-{item.greek}" if type_hint else item.greek
+            if self.pretty and parsed is not None:
+                body = json.dumps(parsed, indent=4).encode()
+            os.makedirs(item.directory, exist_ok=True)
+            path: str = os.path.join(
+                item.directory, f"{name}.json{COMPRESSIONS[self.compression]}"
+            )
+            with open(path, "wb") as writer:
+                writer.write(self._compress(body))
+
+    def _record(self, item: Saved) -> Dict[str, Any]:
+        return {
+            "namespace": item.namespace,
+            "greek": item.greek,
+            "method": item.method,
+            "url": item.url,
+            "status": item.status,
+            "body": item.body.decode("utf-8", errors="replace"),
+        }
+
+    def _write_jsonl(self, saved: List[Saved]) -> None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path: str = os.path.join(
+            RESULTS_DIR,
+            f"responses-{run_id()}-{os.getpid()}.jsonl"
+            f"{COMPRESSIONS[self.compression]}",
+        )
+        lines: bytes = b"".join(
+            json.dumps(self._record(i)).encode() + b"\n" for i in saved
+        )
+        with open(path, "ab") as writer:
+            writer.write(self._compress(lines))
+
+    def _write_sqlite(self, saved: List[Saved]) -> None:
+        if self._db is None:
+            os.makedirs(RESULTS_DIR, exist_ok=True)
+            self._db = sqlite3.connect(
+                os.path.join(RESULTS_DIR, f"responses-{run_id()}.sqlite"), timeout=30
+            )
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (namespace TEXT, greek TEXT, "
+                "method TEXT, url TEXT, status INTEGER, encoding TEXT, body BLOB)"
+            )
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        i.namespace,
+                        i.greek,
+                        i.method,
+                        i.url,
+                        i.status,
+                        self.compression,
+                        self._compress(i.body),
+                    )
+                    for i in saved
+                ],
+            )
+
+
+run_id()
+RESPONSES: ResponseWriter = ResponseWriter.from_env()
+# atexit doesn't run in process pool workers, runner flushes those itself
+atexit.register(lambda: RESPONSES.close())
+
+
+def configure_responses(**kwargs) -> ResponseWriter:
+    """Replace the shared writer, e.g. configure_responses(store="sqlite")"""
+    global RESPONSES
+
+    RESPONSES.close()
+    RESPONSES = ResponseWriter(**kwargs)
+    return RESPONSES
@@ -1,14 +1,18 @@
 from collections import defaultdict
 import logging
 import os
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
 
-import black
-from jinja2 import Environment, Template
+from jinja2 import Environment
 
 from pmx_.constants import INDENTED, NEWLINE, PREFIX
+from pmx_.formatting import format_cached
+from pmx_.manifest import digest
 from pmx_.pm.base import E2EBase
 from pmx_.pm.request import Request
+from pmx_.pm.translate import translate_collection_script
+from pmx_.profiling import PROFILER
+from pmx_.sinks import DirectorySink, Sink
 
 SAVE_RESPONSES = True
 
@@ -22,6 +26,7 @@ class Collection(E2EBase):
         stack: List[str],
         template_env: Environment,
         level: int = 0,
+        on_complete: Optional[Callable[["Collection"], None]] = None,
     ) -> None:
         if input_dict:
             self.input_dict: Dict[str, Any] = input_dict
@@ -44,6 +49,7 @@ class Collection(E2EBase):
 
             # snapshot module namespace
             self.namespace: str = ".".join(self.stack)
+            self.modules: List[str] = list(self.stack)
 
             self.children: List[E2EBase] = []
             self.requests: List[E2EBase] = []
@@ -53,33 +59,69 @@ class Collection(E2EBase):
 
             self.workspace_dir: str = workspace_dir
             self.collection_dir: str = os.path.join(running_dir, self.normal_name)  # type: ignore
-            os.makedirs(self.collection_dir, exist_ok=True)
-            with open(os.path.join(self.collection_dir, "__init__.py"), "w") as writer:
-                writer.write(f"# {self.name}")
-
             self.data_dir: str = os.path.join(self.collection_dir, "data")
-            os.makedirs(self.data_dir, exist_ok=True)
 
             self.base_scenario_path: str = os.path.join(self.collection_dir, "base.py")
             self.scenarios_path: str = os.path.join(self.collection_dir, "scenarios.py")
 
-            self.events: List[Dict[str, Any]] = input_dict.get("event", [str()])
-
             self.pre_script_raw: str = str()
             self.pre_script_event_vars: List[str] = []
-            self.parse_pre_collection_vars()
+            self.has_pre_event: bool = False
 
             self.template_env: Environment = template_env
-            self.base_template: Template = self.template_env.get_template(
-                "base.py.tmpl"
-            )
-            self.scenarios_template: Template = self.template_env.get_template(
-                "scenarios.py.tmpl"
-            )
+            self.on_complete: Optional[Callable[["Collection"], None]] = on_complete
 
             # main driver
+            self.item_digests: List[str] = []
             self.boost_user_key: str = self.route_items(input_dict)
 
+            # a streamed folder only has the keys that follow its items once
+            # route_items has drained them
+            self.events: List[Dict[str, Any]] = input_dict.get("event", [str()])
+            self.parse_pre_collection_vars()
+
+            # what this namespace's output is derived from, minus the sub folders
+            self.digest: str = digest(
+                [
+                    self.modules,
+                    {k: v for k, v in input_dict.items() if k != "item"},
+                    self.item_digests,
+                ]
+            )
+
+            # children have popped themselves by now
+            self.stack.pop()
+
+            if self.on_complete:
+                self.on_complete(self)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Only what's needed to render this namespace crosses a process boundary
+        state: Dict[str, Any] = dict(self.__dict__)
+        state["input_dict"] = {}
+        state["children"] = []
+        state["template_env"] = None
+        state["on_complete"] = None
+        return state
+
+    def release(self) -> None:
+        """Drop the raw postman data once this namespace has been written"""
+        self.input_dict = {}
+        self.events = []
+        for req in self.requests:
+            req.release()  # type: ignore
+
+    def attach(self, template_env: Environment) -> None:
+        self.template_env = template_env
+        for req in self.requests:
+            req.template_env = template_env  # type: ignore
+
+    def walk(self) -> Iterator["Collection"]:
+        yield self
+        for child in self.children:
+            if type(child) is Collection:
+                yield from child.walk()
+
     def parse_pre_collection_vars(self):
         pre_event: Dict[str, Any] = {}
         try:
@@ -94,22 +136,29 @@ class Collection(E2EBase):
         if pre_event:
             self.pre_script = pre_event.get("script", {}).get("exec", [str()])
             self.pre_script_event_vars = self.extract_event_vars(self.pre_script)
-            with open(os.path.join(self.collection_dir, "lvars.py"), "w") as lvwriter:
-                lvwriter.write(
-                    f"VARS = {{{NEWLINE}{(','+INDENTED).join(self.pre_script_event_vars)}\n}}"
-                )
+            self.has_pre_event = True
+
+    def render(self, formatted: bool = True) -> Dict[str, str]:
+        """Render every file of this namespace (not its children), keyed by path
+
+        With formatted=False base.py is left for the caller to run through black.
+        """
+        result: Dict[str, str] = {}
+        result[os.path.join(self.collection_dir, "__init__.py")] = f"# {self.name}"
+        if self.has_pre_event:
+            result[os.path.join(self.collection_dir, "lvars.py")] = (
+                f"VARS = {{{NEWLINE}{(','+INDENTED).join(self.pre_script_event_vars)}\n}}"
+            )
         else:
-            with open(os.path.join(self.collection_dir, "lvars.py"), "w") as lvwriter:
-                lvwriter.write("""VARS = {}""")
+            result[os.path.join(self.collection_dir, "lvars.py")] = """VARS = {}"""
 
-    def write_scenario(self):
         if len(self.requests) > 0:
             render_args: defaultdict = defaultdict(str)
 
             var_imports: List[str] = []
             running_import_path: str = str()
             named_imports: List[str] = []
-            for mod in self.stack:
+            for mod in self.modules:
                 var_imports.append(
                     f"from {running_import_path}{mod}.lvars import VARS as {mod}_vars"
                 )
@@ -117,42 +166,105 @@ class Collection(E2EBase):
                 named_imports.append(f"{mod}_vars")
             render_args["var_imports"] = NEWLINE.join(var_imports)
 
-            closet_imports: List[str] = []
-            for ni in named_imports:
-                closet_imports.append(f"CLOSET_VARS.update({ni})")
-            render_args["closet_imports"] = NEWLINE.join(closet_imports)
+            # outermost folder first, as each overrides the one before
+            render_args["var_layers"] = ", ".join(named_imports)
 
             render_args["boost_user_key"] = self.boost_user_key
-            render_args["pypath_prefix"] = "os.path.dirname(" * (len(self.stack) + 1)
-            render_args["pypath_suffix"] = ")" * (len(self.stack) + 1)
+            render_args["pypath_prefix"] = "os.path.dirname(" * (len(self.modules) + 1)
+            render_args["pypath_suffix"] = ")" * (len(self.modules) + 1)
             render_args["client_id_key"] = self.client_id_key
             render_args["client_secret_key"] = self.client_secret_key
             render_args["namespace"] = self.namespace
             render_args["save_responses"] = SAVE_RESPONSES
             render_args["requests"] = self.requests
             render_args["scenario_name"] = self.name
+            render_args["dependencies"] = self.dependencies()
+            render_args["work_totals"] = self.work_totals()
+            # only imported where a translated script uses it, it's slow to load
+            render_args["uses_moment"] = any(i.uses_moment for i in self.requests)
+
+            for req in self.requests:
+                if req.has_payload:
+                    result[req.payload_path] = req.render_payload()
+
+            with PROFILER.stage("render", self.namespace):
+                content: str = self.template_env.get_template("base.py.tmpl").render(
+                    **render_args
+                )
+            if formatted:
+                content = format_cached(content, self.namespace)
+            result[self.base_scenario_path] = content
 
-            black_mode = black.FileMode(
-                target_versions={black.mode.TargetVersion.PY310}, line_length=108
-            )
-            content: str = self.base_template.render(**render_args)
-            with open(self.base_scenario_path, "w") as writer:
-                try:
-                    content = black.format_str(content, mode=black_mode)
-                except Exception:
-                    pass
-                writer.write(content)
-
-            content = self.scenarios_template.render(**render_args)
-            with open(self.scenarios_path, "w") as writer:
-                writer.write(content)
+            with PROFILER.stage("render", self.namespace):
+                result[self.scenarios_path] = self.template_env.get_template(
+                    "scenarios.py.tmpl"
+                ).render(**render_args)
 
         else:
             # TODO? list of dirs to remove?
             pass  # os.remove(self.data_dir)
 
-        # pop here?
-        popped: str = self.stack.pop()
+        return result
+
+    def dependencies(self) -> Dict[str, List[str]]:
+        """Each request function and the earlier ones it has to wait for
+
+        A request waits for those writing CLOSET_VARS it reads or writes, or
+        reading ones it writes. Anything but a GET changes server state, so it
+        waits for everything before it and everything after it waits for it.
+        Waits implied through another request are left out.
+        """
+        requests: List[Request] = self.requests  # type: ignore
+        names: List[str] = [f"{i.normal_name}_{i.greek}" for i in requests]
+        reads: List[Set[str]] = [set(i.reads) for i in requests]
+        writes: List[Set[str]] = [set(i.writes) for i in requests]
+        for index, req in enumerate(requests):
+            # only the generated functions for other users switch CLOSET_VARS' one
+            if req.boost_user_key and req.boost_user_key != self.boost_user_key:
+                writes[index].add("BOOST_USER")
+
+        result: Dict[str, List[str]] = {}
+        # every request each one waits for, directly or not
+        waits: List[Set[int]] = []
+        for index, req in enumerate(requests):
+            direct: Set[int] = {
+                earlier
+                for earlier in range(index)
+                if req.method != "GET"
+                or requests[earlier].method != "GET"
+                or writes[index] & (reads[earlier] | writes[earlier])
+                or reads[index] & writes[earlier]
+            }
+            implied: Set[int] = set()
+            for earlier in direct:
+                implied |= waits[earlier]
+            waits.append(direct | implied)
+            result[names[index]] = [names[i] for i in sorted(direct - implied)]
+        return result
+
+    def work_totals(self) -> Dict[str, int]:
+        """Work segments each generated function runs, itself included
+
+        Every request function is one, and tous() runs all of them.
+        """
+        result: Dict[str, int] = {
+            f"{i.normal_name}_{i.greek}": 1 for i in self.requests
+        }
+        result["tous"] = len(result) + 1
+        return result
+
+    def write_scenario(self) -> List[str]:
+        return self.write_outputs(self.render())
+
+    def write_outputs(
+        self, outputs: Dict[str, str], sink: Optional[Sink] = None
+    ) -> List[str]:
+        sink = sink or DirectorySink()
+        sink.makedirs(self.data_dir)
+        with PROFILER.stage("write", self.namespace):
+            for path, content in outputs.items():
+                sink.write(path, content)
+        return list(outputs.keys())
 
     def __repr__(self) -> str:
         return (
@@ -173,9 +285,10 @@ class Collection(E2EBase):
                     self.stack,
                     self.template_env,
                     level=self.level + 1,
+                    on_complete=self.on_complete,
                 )
-                scene.write_scenario()
                 self.children.append(scene)
+                self.item_digests.append(scene.name)
 
             elif item.get("request"):
                 req = Request(
@@ -186,6 +299,7 @@ class Collection(E2EBase):
                     level=self.level + 1,
                     count=counter,
                 )
+                self.item_digests.append(req.digest)
                 if result == "unknown" and req.boost_user_key != str():
                     result = req.boost_user_key
                 # Don't write authentication steps since the client handles this
@@ -213,25 +327,13 @@ class Collection(E2EBase):
                 self.requests.append(req)
                 counter += 1
             else:
+                self.item_digests.append(digest(item))
                 logging.warning(f"Don't know what to do with item: {item}")
 
         return result
 
-    def extract_event_vars(self, input_list: List) -> Dict[str, str]:
-        result: List[str] = []
-        for line in input_list:
-            if "pm.variables.set" in line:
-                try:
-                    trim = line.split("(")[1]
-                    trim = trim.split(")")[0]
-                    key, val = trim.split(",")
-                    key = key.replace("\\", "").replace('"', "").strip()
-                    val = val.replace("\\", "").replace('"', "").strip()
-                    result.append(f'"{key}": "{val}"')
-                except Exception as err:
-                    logging.warning(f"Error parsing collection event: {err}: {line}")
-
-        return result
+    def extract_event_vars(self, input_list: List) -> List[str]:
+        return translate_collection_script(input_list)
 
 
 def extract_env(input_vars: List[Dict[str, str]]) -> Dict[str, str]:
@@ -2,12 +2,15 @@ from collections import defaultdict
 import json
 import os
 import re
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Set, Tuple
 
 from jinja2 import Environment, Template
 
 from pmx_.fragments import READ_PAYLOAD_DATA, READ_PAYLOAD_DATA_PANDADOC
+from pmx_.manifest import digest
 from pmx_.pm.base import E2EBase
+from pmx_.pm.translate import translate_request_script
+from pmx_.profiling import PROFILER
 from pmx_.constants import (
     GREEK_LEN,
     GREEK_LETTERS,
@@ -18,6 +21,17 @@ from pmx_.constants import (
 )
 
 WRITE_OUT_EVENTS: bool = False
+PAYLOAD_METHODS: List[str] = ["POST", "PATCH", "PUT", "DELETE"]
+
+# how generated code touches CLOSET_VARS, see Request.variables
+CLOSET_ACCESS = re.compile(r'CLOSET_VARS(?:\["([^"]+)"\]|\.get\("([^"]+)")')
+ASSIGNMENT = re.compile(r"\s*=(?!=)")
+URL_FIELD = re.compile(r"\{(\w+)")
+PAYLOAD_FIELD = re.compile(r"\{\{\s*(\w+)")
+
+
+def awaitable(line: str) -> str:
+    return line.replace("time.sleep(", "await asyncio.sleep(")
 
 
 class Request(E2EBase):
@@ -34,6 +48,7 @@ class Request(E2EBase):
         self.level: int = level
         self.count: int = count
         self.stack = stack
+        self.namespace: str = ".".join(stack)
         self.name: str = self.input_dict.get("name", str())
         self.normal_name: str = (
             self.name.lower()
@@ -47,6 +62,10 @@ class Request(E2EBase):
             .replace("&", "and")
         )
         self.method: str = self.input_dict.get("request", {}).get("method", "GET")
+        # example responses don't end up in the generated code
+        self.digest: str = digest(
+            {k: v for k, v in self.input_dict.items() if k != "response"}
+        )
 
         self.data_dir: str = data_dir
         self.url: str = (
@@ -69,7 +88,7 @@ class Request(E2EBase):
 
         self.events: List[Dict[str, Any]] = self.input_dict.get("event", [str()])
 
-        self.template: Template = template_env.get_template("requests.py.tmpl")
+        self.template_env: Environment = template_env
 
         # stuff related to script parsing
         self._doc_id: str = str()
@@ -86,6 +105,10 @@ class Request(E2EBase):
 
         self.is_pandadoc_req: bool = "pandadoc" in self.normal_name
 
+        self.reads: List[str] = []
+        self.writes: List[str] = []
+        self.reads, self.writes = self.variables()
+
     def parse_pre_event(self):
         pre_event: Dict[str, Any] = {}
         try:
@@ -129,6 +152,56 @@ class Request(E2EBase):
             self.test_script_raw = "\n    ".join(self.test_script)
             self.test_script_event_vars = self.extract_event_vars(self.test_script)
 
+    def variables(self) -> Tuple[List[str], List[str]]:
+        """The CLOSET_VARS keys this request's generated function reads and writes"""
+        reads: Set[str] = set(URL_FIELD.findall(self.url))
+        writes: Set[str] = set()
+        if self.has_payload:
+            reads.update(PAYLOAD_FIELD.findall(self.render_payload()))
+        if self.is_pandadoc_req:
+            writes.update(("quote_type", "document_id"))
+
+        lines: List[str] = [
+            *self.pre_script_event_vars,
+            self.read_payload_data,
+            *self.test_script_event_vars,
+        ]
+        for line in lines:
+            for match in CLOSET_ACCESS.finditer(line):
+                key: str = match.group(1) or match.group(2)
+                statement_start: int = line.rfind(NEWLINE, 0, match.start()) + 1
+                if (
+                    match.group(1)
+                    and not line[statement_start : match.start()].strip()
+                    and ASSIGNMENT.match(line, match.end())
+                ):
+                    writes.add(key)
+                else:
+                    reads.add(key)
+        return sorted(reads), sorted(writes)
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # resolve lazy properties before dropping the raw postman item
+        self.boost_user_key
+        state: Dict[str, Any] = dict(self.__dict__)
+        state["input_dict"] = {}
+        state["template_env"] = None
+        return state
+
+    def release(self) -> None:
+        """Drop everything only needed for rendering"""
+        self.boost_user_key
+        self.input_dict = {}
+        self.events = []
+        self.payload = str()
+        self.body = {}
+        self.pre_script = []
+        self.pre_script_raw = str()
+        self.pre_script_event_vars = []
+        self.test_script = []
+        self.test_script_raw = str()
+        self.test_script_event_vars = []
+
     def __repr__(self) -> str:
         return (
             f"{NEWLINE}{PREFIX * self.level}{{type: Request, name: {self.name},"
@@ -159,17 +232,38 @@ class Request(E2EBase):
                     )
         return self._boost_user_key
 
+    @property
+    def has_payload(self) -> bool:
+        return self.method in PAYLOAD_METHODS
+
+    @property
+    def uses_moment(self) -> bool:
+        """Whether the translated scripts call the moment library"""
+        return any(
+            "moment." in i
+            for i in (*self.pre_script_event_vars, *self.test_script_event_vars)
+        )
+
+    @property
+    def payload_path(self) -> str:
+        return os.path.join(self.data_dir, f"{self.greek}.json")
+
     @property
     def read_payload_data(self) -> str:
         result = str()
-        if self.method in ["POST", "PATCH", "PUT", "DELETE"]:
+        if self.has_payload:
             result = READ_PAYLOAD_DATA.format(**{"greek": self.greek})
             if self.is_pandadoc_req:
                 result += READ_PAYLOAD_DATA_PANDADOC
         return result
 
     def write_request(self) -> str:
-        self.write_payload()
+        pre_script_event_vars: List[str] = self.pre_script_event_vars
+        test_script_event_vars: List[str] = self.test_script_event_vars
+        if self.template_env.globals.get("asynchronous"):
+            # a blocking sleep would hold up every namespace on the event loop
+            pre_script_event_vars = [awaitable(i) for i in pre_script_event_vars]
+            test_script_event_vars = [awaitable(i) for i in test_script_event_vars]
 
         render_args: Dict[str, str | bool] = defaultdict(str)
         render_args.update(
@@ -182,202 +276,28 @@ class Request(E2EBase):
                 "method": self.method,
                 "name": self.name,
                 "normal_name": self.normal_name,
-                "pre_script_event_vars": INDENTED.join(self.pre_script_event_vars),
+                "pre_script_event_vars": INDENTED.join(pre_script_event_vars),
                 "pre_script_raw": self.pre_script_raw,
                 "quote_type": self._quote_type,
                 "read_payload_data": self.read_payload_data,
                 "test_script_raw": self.test_script_raw,
-                "test_script_event_vars": INDENTED.join(self.test_script_event_vars),
+                "test_script_event_vars": INDENTED.join(test_script_event_vars),
                 "write_out_events": WRITE_OUT_EVENTS,
             }
         )
-        return self.template.render(**render_args)
+        template: Template = self.template_env.get_template("requests.py.tmpl")
+        with PROFILER.stage("render_request", self.namespace):
+            return template.render(**render_args)
+
+    def render_payload(self) -> str:
+        if "pandadoc_message" in self.payload:
+            return PANDADOC_MESSASGE
+        return self.payload
 
     def write_payload(self):
-        if self.method in ["POST", "PATCH", "PUT", "DELETE"]:
-            with open(os.path.join(self.data_dir, f"{self.greek}.json"), "w") as writer:
-                if "pandadoc_message" in self.payload:
-                    writer.write(PANDADOC_MESSASGE)
-                else:
-                    writer.write(self.payload)
+        if self.has_payload:
+            with open(self.payload_path, "w") as writer:
+                writer.write(self.render_payload())
 
     def extract_event_vars(self, input_list: List) -> List[str]:
-        result: List[str] = []
-        use_next_literal_val: bool = False
-        ignore_next_environment_set: bool = False
-        find_open: bool = False
-        find_content: List[str] = []
-        for line in input_list:
-            line = line.split("//")[0]
-            if "pm.variables.set" in line or "pm.environment.set" in line:
-                if ignore_next_environment_set:
-                    ignore_next_environment_set = False
-                    continue
-                trim = line.split("(")[1]
-                trim = trim.split(")")[0]
-                key, val = trim.split(", ")
-                key = key.replace("\\", "").replace('"', "").strip()
-                val = val.replace("\\", "").replace('"', "").strip()
-
-                if "jsonData.data.id);" in line:
-                    result.append(f'CLOSET_VARS["{key}"] = json_data.data.id')
-                    continue
-
-                if "jsonData.id);" in line:
-                    result.append(f'CLOSET_VARS["{key}"] = json_data.id')
-                    continue
-
-                if ', jsonData["data"]["id"])' in line:
-                    result.append(f'CLOSET_VARS["{key}"] = json_data.data.id')
-                    continue
-
-                if "jsonData.included" in line and line.endswith("find("):
-                    result.append(f'CLOSET_VARS["{key}"] = ')
-                    find_open = True
-                    continue
-
-                er_type = (
-                    "endorsement_quote_entity_relation"
-                    if "endorsement_quote" in line
-                    else "policy_entity_relation"
-                )
-                er_role = (
-                    "additional_insured"
-                    if "additional_insured" in key or "_ai" in key
-                    else "primary_named_insured"
-                )
-
-                if "relation" in key:
-                    result.append(
-                        f'CLOSET_VARS["{key}"] = get_er_id(json_data.included, "{er_type}", "{er_role}")'
-                    )
-                    continue
-
-                if (
-                    "primary_named_insured" in key
-                    or "additional_insured" in key
-                    or "_ai" in key
-                    or "_pni" in key
-                ):
-                    result.append(
-                        f'CLOSET_VARS["{key}"] = get_entity_id(json_data.included, "{er_type}", "{er_role}")'
-                    )
-                    continue
-
-                if "jsonData.data" in line:
-                    parts = line.split("jsonData")
-                    # Second half of split minus trailing );
-                    result.append(
-                        f'CLOSET_VARS["{key}"] = json_data{parts[-1].rstrip(";").rstrip(")")}'
-                    )
-                    continue
-                if use_next_literal_val:
-                    if "format(" in line:
-                        val = line.split(",")[-1].replace(";", "")[:-1]
-                        result.append(f'CLOSET_VARS["{key}"] = {val}')
-                    else:
-                        result.append(f'CLOSET_VARS["{key}"] = {val}')
-                    use_next_literal_val = False
-                else:
-                    result.append(f'CLOSET_VARS["{key}"] = "{val}"')
-
-            elif "var jsonData" in line:
-                result.append("json_data = Prodict(**response.json())")
-
-            elif "pm.response.to.have.status" in line:
-                status = line.split("(")[-1][:-2]
-                result.append(f"assert response.status_code == {status}")
-
-            elif "pm.expect(jsonData.data).to.have.lengthOf" in line:
-                expected_length = int(line.split("(")[-1][:-1].split(")")[0])
-                result.append(f"assert len(json_data.data) == {expected_length}")
-
-            elif "pm.expect(jsonData" in line:
-                if (
-                    "pm.expect(jsonData.data.attributes.status_reasons).to.eql([]);"
-                    in line
-                ):
-                    result.append(
-                        "assert json_data.data.attributes.status_reasons == []"
-                    )
-                else:
-                    k = re.compile(
-                        r'[\s]+pm\.expect\(jsonData\.([^\)]+)\)\.to\.eql\([\'"]([a-z]+)[\'"]\)\;'
-                    )
-                    match = k.match(line)
-                    if match:
-                        groups = match.groups()
-                        result.append(f'assert json_data.{groups[0]} == "{groups[1]}"')
-
-            elif "moment()" in line:
-                if "unix()" in line:
-                    stripped = line.strip()
-                    if stripped.startswith("let ") and stripped.endswith(
-                        "moment().unix()"
-                    ):
-                        wline = (
-                            line.replace("let ", 'CLOSET_VARS["')
-                            .replace(" = ", '"] = moment.now()')
-                            .replace("moment().unix()", "")
-                        )
-                        result.append(wline)
-                        ignore_next_environment_set = True
-                        continue
-                    result.append("moment.now()")
-                else:
-                    try:
-                        norm1 = line[4:-1].replace("moment()", "moment.now()")
-                        parts = norm1.split("(")
-                        end_parts = (
-                            parts[-1][:-1].replace("'", "").replace('"', "").split(",")
-                        )
-                        prefix = "(".join(parts[:-1])
-                        suffix = f"({end_parts[1].strip()}={end_parts[0].strip()})"
-                        result.append(f"{prefix}{suffix}")
-                        use_next_literal_val = True
-                    except IndexError:
-                        logger.warning(f"bugging out on {line}")
-
-            elif "pm.environment.get" in line and "pm.expect" not in line:
-                wline = (
-                    line.replace("var ", 'CLOSET_VARS["')
-                    .replace("let ", 'CLOSET_VARS["')
-                    .replace("pm.environment.get(", "CLOSET_VARS[")
-                    .replace(");", "]")
-                    .replace(")", "]")
-                    .replace(" = ", '"] = ')
-                )
-                result.append(wline.strip())
-
-            elif "pm.variables.get" in line and "pm.expect" not in line:
-                wline = (
-                    line.replace("var ", 'CLOSET_VARS["')
-                    .replace("let ", 'CLOSET_VARS["')
-                    .replace("pm.variables.get(", "CLOSET_VARS[")
-                    .replace(");", "]")
-                    .replace(")", "]")
-                    .replace(" = ", '"] = ')
-                )
-                result.append(wline.strip())
-
-            elif "setTimeout" in line:
-                timeout = int(line.split(",")[-1].rstrip(";").rstrip(")").strip())
-                result.append(f"time.sleep({timeout} / 1000)")
-
-            elif find_open:
-                if ")" in line:
-                    address: str = str()
-                    suffix_parts: List[str] = line.split(")")
-                    if len(suffix_parts) > 2:
-                        address = suffix_parts[1]
-
-                    # TODO: parse the stuff
-                    content: str = " ".join(find_content)
-                    result[-1] += f"finder(json_data.included, '{content}'){address}"
-                    # reset stuff
-                    find_open = False
-                    find_content = []
-                else:
-                    find_content.append(line.strip())
-
-        return result
+        return translate_request_script(input_list)
@@ -0,0 +1,280 @@
+import functools
+import logging
+import re
+from typing import Callable, Dict, List, Sequence, Tuple
+
+# Every construct the translator understands starts with one of these tokens
+TOKENS = re.compile(
+    r"pm\.(?:variables\.(?:set|get)|environment\.(?:set|get)"
+    r"|response\.to\.have\.status"
+    r"|expect(?:\(jsonData(?:\.data\)\.to\.have\.lengthOf)?)?)"
+    r"|var jsonData|moment\(\)|setTimeout"
+)
+EXPECT_EQL = re.compile(
+    r'[\s]+pm\.expect\(jsonData\.([^\)]+)\)\.to\.eql\([\'"]([a-z]+)[\'"]\)\;'
+)
+TIMEOUT_CLOSE = re.compile(r"^\s*\}\s*,\s*(\d+)\s*\)\s*;?\s*$")
+
+# distinct scripts remembered; hundreds of requests share identical test scripts
+CACHE_SIZE: int = 4096
+STATUS_REASONS_EMPTY: str = (
+    "pm.expect(jsonData.data.attributes.status_reasons).to.eql([]);"
+)
+
+
+def _clean(arg: str) -> str:
+    return arg.replace("\\", "").replace('"', "").strip()
+
+
+class _RequestScript:
+    """Single pass translation of a request's pm.* javascript to python lines
+
+    Each line is tokenized once and handled by the handler of its highest
+    priority token; lines without any only matter inside multi-line constructs.
+    """
+
+    __slots__ = (
+        "result",
+        "use_next_literal_val",
+        "ignore_next_environment_set",
+        "find_open",
+        "find_content",
+        "timeout_open",
+    )
+
+    def __init__(self) -> None:
+        self.result: List[str] = []
+        self.use_next_literal_val: bool = False
+        self.ignore_next_environment_set: bool = False
+        self.find_open: bool = False
+        self.find_content: List[str] = []
+        self.timeout_open: bool = False
+
+    def translate(self, lines: Sequence[str]) -> List[str]:
+        handlers: Dict[str, Callable] = HANDLERS
+        priority: Callable[[str], int] = PRIORITY.__getitem__
+        tokenize: Callable[[str], List[str]] = TOKENS.findall
+        if "//" in "".join(lines):
+            lines = [i.partition("//")[0] for i in lines]
+        for line in lines:
+            tokens: List[str] = tokenize(line)
+            if tokens:
+                # a line holding several constructs goes to its highest priority one
+                token: str = (
+                    tokens[0] if len(tokens) == 1 else min(tokens, key=priority)
+                )
+                handlers[token](self, line, tokens)
+            elif self.find_open or self.timeout_open:
+                self.fallback(line, tokens)
+        return self.result
+
+    def fallback(self, line: str, tokens: Sequence[str]) -> None:
+        if "setTimeout" in tokens:
+            self.set_timeout(line)
+        elif self.timeout_open and (close := TIMEOUT_CLOSE.match(line)):
+            self.result.append(f"time.sleep({int(close.group(1))} / 1000)")
+            self.timeout_open = False
+        elif self.find_open:
+            self.find(line)
+
+    def json_data(self, line: str, tokens: Sequence[str]) -> None:
+        self.result.append("json_data = Prodict(**response.json())")
+
+    def status(self, line: str, tokens: Sequence[str]) -> None:
+        self.result.append(f"assert response.status_code == {line.split('(')[-1][:-2]}")
+
+    def length_of(self, line: str, tokens: Sequence[str]) -> None:
+        try:
+            expected_length = int(line.split("(")[-1][:-1].split(")")[0])
+        except ValueError:
+            logging.warning(f"Can't read expected length: {line}")
+            return
+        self.result.append(f"assert len(json_data.data) == {expected_length}")
+
+    def expect(self, line: str, tokens: Sequence[str]) -> None:
+        if STATUS_REASONS_EMPTY in line:
+            self.result.append("assert json_data.data.attributes.status_reasons == []")
+        elif match := EXPECT_EQL.match(line):
+            groups = match.groups()
+            self.result.append(f'assert json_data.{groups[0]} == "{groups[1]}"')
+
+    def get_environment(self, line: str, tokens: Sequence[str]) -> None:
+        if "pm.expect" in tokens:
+            self.fallback(line, tokens)
+        else:
+            self.get_var(line, "pm.environment.get(")
+
+    def get_variable(self, line: str, tokens: Sequence[str]) -> None:
+        if "pm.expect" in tokens:
+            self.fallback(line, tokens)
+        else:
+            self.get_var(line, "pm.variables.get(")
+
+    def set_var(self, line: str, tokens: Sequence[str]) -> None:
+        if self.ignore_next_environment_set:
+            self.ignore_next_environment_set = False
+            return
+
+        # what's between the call's opening paren and the next paren
+        args: List[str] = (
+            line.split("(", 2)[1].split(")", 1)[0].split(", ") if "(" in line else []
+        )
+        if len(args) != 2:
+            logging.warning(f"Can't read variable assignment: {line}")
+            return
+        key: str = _clean(args[0])
+        target: str = f'CLOSET_VARS["{key}"] = '
+
+        if "jsonData.data.id);" in line or ', jsonData["data"]["id"])' in line:
+            self.result.append(f"{target}json_data.data.id")
+        elif "jsonData.id);" in line:
+            self.result.append(f"{target}json_data.id")
+        elif "jsonData.included" in line and line.endswith("find("):
+            self.result.append(target)
+            self.find_open = True
+        elif (
+            "relation" in key
+            or "_ai" in key
+            or "_pni" in key
+            or "additional_insured" in key
+            or "primary_named_insured" in key
+        ):
+            self.result.append(f"{target}{_entity_lookup(line, key)}")
+        elif "jsonData.data" in line:
+            # everything after the last jsonData, minus the trailing );
+            accessor: str = line.split("jsonData")[-1].rstrip(";").rstrip(")")
+            self.result.append(f"{target}json_data{accessor}")
+        elif self.use_next_literal_val:
+            val: str = (
+                line.split(",")[-1].replace(";", "")[:-1]
+                if "format(" in line
+                else _clean(args[1])
+            )
+            self.result.append(f"{target}{val}")
+            self.use_next_literal_val = False
+        else:
+            self.result.append(f'{target}"{_clean(args[1])}"')
+
+    def moment(self, line: str, tokens: Sequence[str]) -> None:
+        if "unix()" in line:
+            stripped: str = line.strip()
+            if stripped.startswith("let ") and stripped.endswith("moment().unix()"):
+                self.result.append(
+                    line.replace("let ", 'CLOSET_VARS["')
+                    .replace(" = ", '"] = moment.now()')
+                    .replace("moment().unix()", "")
+                )
+                # the timestamp is already in the closet
+                self.ignore_next_environment_set = True
+            else:
+                self.result.append("moment.now()")
+            return
+
+        # var x = moment().add(1, "days"); -> x = moment.now().add(days=1)
+        parts: List[str] = line[4:-1].replace("moment()", "moment.now()").split("(")
+        end_parts: List[str] = (
+            parts[-1][:-1].replace("'", "").replace('"', "").split(",")
+        )
+        if len(end_parts) < 2:
+            logging.warning(f"bugging out on {line}")
+            return
+        prefix: str = "(".join(parts[:-1])
+        self.result.append(f"{prefix}({end_parts[1].strip()}={end_parts[0].strip()})")
+        self.use_next_literal_val = True
+
+    def get_var(self, line: str, accessor: str) -> None:
+        self.result.append(
+            line.replace("var ", 'CLOSET_VARS["')
+            .replace("let ", 'CLOSET_VARS["')
+            .replace(accessor, "CLOSET_VARS[")
+            .replace(");", "]")
+            .replace(")", "]")
+            .replace(" = ", '"] = ')
+            .strip()
+        )
+
+    def set_timeout(self, line: str) -> None:
+        try:
+            timeout = int(line.split(",")[-1].rstrip(";").rstrip(")").strip())
+        except ValueError:
+            # setTimeout(function () { ... spread over lines; wait for the }, N);
+            self.timeout_open = True
+            return
+        self.result.append(f"time.sleep({timeout} / 1000)")
+
+    def find(self, line: str) -> None:
+        if ")" in line:
+            suffix_parts: List[str] = line.split(")")
+            address: str = suffix_parts[1] if len(suffix_parts) > 2 else str()
+            content: str = " ".join(self.find_content)
+            self.result[-1] += f"finder(json_data.included, '{content}'){address}"
+            self.find_open = False
+            self.find_content = []
+        else:
+            self.find_content.append(line.strip())
+
+
+def _entity_lookup(line: str, key: str) -> str:
+    """get_er_id or get_entity_id of the entity relation key names"""
+    er_type: str = (
+        "endorsement_quote_entity_relation"
+        if "endorsement_quote" in line
+        else "policy_entity_relation"
+    )
+    is_ai: bool = "additional_insured" in key or "_ai" in key
+    er_role: str = "additional_insured" if is_ai else "primary_named_insured"
+    if "relation" in key:
+        return f'get_er_id(json_data.included, "{er_type}", "{er_role}")'
+    return f'get_entity_id(json_data.included, "{er_type}", "{er_role}")'
+
+
+# Handlers in order of precedence
+HANDLERS: Dict[str, Callable[[_RequestScript, str, Sequence[str]], None]] = {
+    "pm.variables.set": _RequestScript.set_var,
+    "pm.environment.set": _RequestScript.set_var,
+    "var jsonData": _RequestScript.json_data,
+    "pm.response.to.have.status": _RequestScript.status,
+    "pm.expect(jsonData.data).to.have.lengthOf": _RequestScript.length_of,
+    "pm.expect(jsonData": _RequestScript.expect,
+    "moment()": _RequestScript.moment,
+    "pm.environment.get": _RequestScript.get_environment,
+    "pm.variables.get": _RequestScript.get_variable,
+    "setTimeout": _RequestScript.fallback,
+    "pm.expect": _RequestScript.fallback,
+}
+PRIORITY: Dict[str, int] = {token: i for i, token in enumerate(HANDLERS)}
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _translate_request(lines: Tuple[str, ...]) -> Tuple[str, ...]:
+    return tuple(_RequestScript().translate(lines))
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _translate_collection(lines: Tuple[str, ...]) -> Tuple[str, ...]:
+    result: List[str] = []
+    for line in lines:
+        if "pm.variables.set" in line:
+            args: List[str] = (
+                line.split("(", 2)[1].split(")", 1)[0].split(",") if "(" in line else []
+            )
+            if len(args) != 2:
+                logging.warning(f"Error parsing collection event: {line}")
+                continue
+            result.append(f'"{_clean(args[0])}": "{_clean(args[1])}"')
+    return tuple(result)
+
+
+def clear_cache() -> None:
+    _translate_request.cache_clear()
+    _translate_collection.cache_clear()
+
+
+def translate_request_script(lines: Sequence[str]) -> List[str]:
+    """Python statements for a request's pre-request or test script"""
+    return list(_translate_request(tuple(lines)))
+
+
+def translate_collection_script(lines: Sequence[str]) -> List[str]:
+    """`"key": "value"` entries for a folder's lvars.VARS"""
+    return list(_translate_collection(tuple(lines)))
@@ -0,0 +1,141 @@
+import contextlib
+import json
+import logging
+import time
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pmx_ import __version__
+from pmx_.constants import NEWLINE
+
+NULL_STAGE: contextlib.nullcontext = contextlib.nullcontext()
+
+
+class Profiler:
+    """Wall time and allocations per export stage, optionally per namespace
+
+    Stages nest; each record carries its inclusive wall time and the time spent
+    outside of nested stages, so self times add up to the total.
+    """
+
+    def __init__(self) -> None:
+        self.enabled: bool = False
+        self.memory: bool = False
+        self.records: List[Dict[str, Any]] = []
+        # [start time, nested time, start traced bytes, peak saved from nested stages]
+        self._frames: List[List[float]] = []
+
+    def enable(self, memory: bool = False) -> None:
+        """Start recording; tracing allocations slows the export down several times"""
+        self.enabled = True
+        if memory and not hasattr(tracemalloc, "reset_peak"):
+            # per-stage peaks need Python 3.9+
+            logging.warning("Peak allocations per stage need Python 3.9, skipping")
+            memory = False
+        self.memory = memory
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _traced(self) -> Tuple[int, int]:
+        return tracemalloc.get_traced_memory() if self.memory else (0, 0)
+
+    def stage(self, name: str, namespace: str = str()):
+        if not self.enabled:
+            return NULL_STAGE
+        return self._stage(name, namespace)
+
+    @contextlib.contextmanager
+    def _stage(self, name: str, namespace: str) -> Iterator[None]:
+        current, peak = self._traced()
+        if self._frames:
+            # resetting below would lose the enclosing stage's peak so far
+            self._frames[-1][3] = max(self._frames[-1][3], peak)
+        if self.memory:
+            tracemalloc.reset_peak()
+        frame: List[float] = [time.perf_counter(), 0.0, current, 0]
+        self._frames.append(frame)
+        try:
+            yield
+        finally:
+            self._frames.pop()
+            wall: float = time.perf_counter() - frame[0]
+            peak = max(self._traced()[1], frame[3])
+            if self._frames:
+                self._frames[-1][1] += wall
+                self._frames[-1][3] = max(self._frames[-1][3], peak)
+            self.records.append(
+                {
+                    "stage": name,
+                    "namespace": namespace,
+                    "wall": wall,
+                    "self": wall - frame[1],
+                    "alloc_peak": int(peak - frame[2]),
+                }
+            )
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Hand over the records made so far, e.g. from a worker process"""
+        records: List[Dict[str, Any]] = self.records
+        self.records = []
+        return records
+
+    def merge(self, records: List[Dict[str, Any]]) -> None:
+        self.records.extend(records)
+
+    def by_stage(self) -> Dict[str, Dict[str, float]]:
+        result: Dict[str, Dict[str, float]] = defaultdict(
+            lambda: {"count": 0, "wall": 0.0, "self": 0.0, "alloc_peak": 0}
+        )
+        for record in self.records:
+            totals: Dict[str, float] = result[record["stage"]]
+            totals["count"] += 1
+            totals["wall"] += record["wall"]
+            totals["self"] += record["self"]
+            totals["alloc_peak"] = max(totals["alloc_peak"], record["alloc_peak"])
+        return dict(sorted(result.items(), key=lambda i: -i[1]["self"]))
+
+    def by_namespace(self) -> Dict[str, Dict[str, float]]:
+        result: Dict[str, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        for record in self.records:
+            if record["namespace"]:
+                result[record["namespace"]][record["stage"]] += record["self"]
+                result[record["namespace"]]["total"] += record["self"]
+        return {
+            k: dict(v) for k, v in sorted(result.items(), key=lambda i: -i[1]["total"])
+        }
+
+    def summary(self, top: int = 10) -> str:
+        lines: List[str] = [
+            f"{'stage':<20}{'count':>8}{'self s':>10}{'wall s':>10}"
+            + (f"{'peak MB':>10}" if self.memory else str())
+        ]
+        for name, totals in self.by_stage().items():
+            lines.append(
+                f"{name:<20}{totals['count']:>8}{totals['self']:>10.3f}"
+                f"{totals['wall']:>10.3f}"
+                + (f"{totals['alloc_peak'] / 2**20:>10.2f}" if self.memory else str())
+            )
+        namespaces: Dict[str, Dict[str, float]] = self.by_namespace()
+        if namespaces:
+            lines.append(f"{NEWLINE}slowest namespaces")
+            for namespace, stages in list(namespaces.items())[:top]:
+                lines.append(f"{stages['total']:>10.3f}s  {namespace}")
+        return NEWLINE.join(lines)
+
+    def write(self, path: str, extra: Optional[Dict[str, Any]] = None) -> None:
+        with open(path, "w") as writer:
+            json.dump(
+                {
+                    "version": __version__,
+                    **(extra or {}),
+                    "stages": self.by_stage(),
+                    "namespaces": self.by_namespace(),
+                    "records": self.records,
+                },
+                writer,
+                indent=2,
+            )
+
+
+PROFILER: Profiler = Profiler()
@@ -0,0 +1,545 @@
+import asyncio
+import glob
+import importlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from concurrent import futures
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import click
+
+import downloads
+import persist
+from metrics import METRICS
+from vars.times import run_started
+
+THIS_DIR: str = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR: str = os.path.join(THIS_DIR, ".pmx_results")
+# kept out of .pmx_results so clearing results doesn't forget past durations
+HISTORY_FILE: str = os.path.join(THIS_DIR, ".pmx_history.json")
+# weight of the latest run in a namespace's expected duration
+HISTORY_WEIGHT: float = 0.5
+# fixed before any worker starts, so every namespace's dates agree
+run_started()
+EXECUTORS: Dict[str, Any] = {
+    "thread": futures.ThreadPoolExecutor,
+    "process": futures.ProcessPoolExecutor,
+}
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """A shard given as i/n, e.g. 2/4, as (i, n); shards count from 1"""
+    try:
+        index, count = (int(i) for i in value.split("/"))
+    except ValueError:
+        raise click.BadParameter(f"{value} isn't of the form i/n")
+    if not 1 <= index <= count:
+        raise click.BadParameter(f"{value}: i must be between 1 and n")
+    return index, count
+
+
+def load_history(path: str) -> Dict[str, Dict[str, Any]]:
+    """Past durations by namespace; missing or unreadable history is empty"""
+    try:
+        with open(path, "r") as reader:
+            history: Any = json.load(reader)
+    except (OSError, ValueError):
+        return {}
+    return history if isinstance(history, dict) else {}
+
+
+def update_history(path: str, results: Sequence[Dict[str, Any]]) -> None:
+    """Fold passed namespaces' durations into path's moving averages"""
+    history: Dict[str, Dict[str, Any]] = load_history(path)
+    for result in results:
+        # a failure's duration says little about how long a pass takes
+        if result["status"] != "passed":
+            continue
+        entry: Dict[str, Any] = history.get(result["namespace"], {})
+        previous: Optional[float] = entry.get("expected")
+        history[result["namespace"]] = {
+            "expected": (
+                result["duration"]
+                if previous is None
+                else HISTORY_WEIGHT * result["duration"]
+                + (1 - HISTORY_WEIGHT) * previous
+            ),
+            "last": result["duration"],
+            "runs": entry.get("runs", 0) + 1,
+        }
+    # written whole and renamed, so concurrent shards never read half a file
+    directory: str = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w") as writer:
+        json.dump(history, writer, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def expected_durations(
+    namespaces: Sequence[str], history: Dict[str, Dict[str, Any]]
+) -> Dict[str, float]:
+    """Each namespace's expected seconds; ones never run get the median"""
+    known: Dict[str, float] = {
+        i: float(history[i]["expected"])
+        for i in namespaces
+        if "expected" in history.get(i, {})
+    }
+    default: float = statistics.median(known.values()) if known else 1.0
+    return {i: known.get(i, default) for i in namespaces}
+
+
+def longest_first(namespaces: Sequence[str], expected: Dict[str, float]) -> List[str]:
+    # sorted is stable, so ties keep run.py's order
+    return sorted(namespaces, key=lambda i: -expected[i])
+
+
+def partition(
+    namespaces: Sequence[str], expected: Dict[str, float], count: int
+) -> List[List[str]]:
+    """count groups of about equal expected time, each longest first
+
+    Greedy LPT: each namespace, longest first, goes to the group with the least
+    expected time so far, the lowest index on ties. Without history it deals
+    namespaces round robin.
+    """
+    groups: List[List[str]] = [[] for _ in range(count)]
+    loads: List[float] = [0.0] * count
+    for namespace in longest_first(namespaces, expected):
+        lightest: int = min(range(count), key=lambda i: (loads[i], i))
+        groups[lightest].append(namespace)
+        loads[lightest] += expected[namespace]
+    return groups
+
+
+def select_shard(
+    namespaces: Sequence[str],
+    index: int,
+    count: int,
+    expected: Dict[str, float],
+) -> List[str]:
+    """Shard index of count, balanced by expected time
+
+    Every machine agrees on the split as long as they share the history file.
+    """
+    return partition(namespaces, expected, count)[index - 1]
+
+
+def clear_responses(namespaces: Sequence[str]) -> None:
+    for namespace in namespaces:
+        shutil.rmtree(
+            os.path.join(THIS_DIR, *namespace.split("."), "responses"),
+            ignore_errors=True,
+        )
+
+
+def _result(namespace: str, start: float, **kwargs) -> Dict[str, Any]:
+    return {
+        "namespace": namespace,
+        "duration": time.perf_counter() - start,
+        **kwargs,
+    }
+
+
+def run_namespace(namespace: str) -> Dict[str, Any]:
+    """Import a namespace's scenarios and run them; safe in a worker process
+
+    It ends once the documents they asked for are downloaded, or given up on.
+    """
+    start: float = time.perf_counter()
+    try:
+        data: Any = importlib.import_module(f"{namespace}.scenarios").tous()
+    except Exception as exc:
+        return _result(
+            namespace,
+            start,
+            status="failed",
+            error=repr(exc),
+            downloads=downloads.DOWNLOADS.join(namespace),
+        )
+    return _result(
+        namespace,
+        start,
+        status="passed",
+        result=data,
+        downloads=downloads.DOWNLOADS.join(namespace),
+    )
+
+
+async def _join_downloads(namespace: str) -> Dict[str, Any]:
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, downloads.DOWNLOADS.join, namespace)
+
+
+async def arun_namespace(namespace: str) -> Dict[str, Any]:
+    start: float = time.perf_counter()
+    try:
+        module: Any = importlib.import_module(f"{namespace}.scenarios")
+        data: Any = await module.tous()
+    except Exception as exc:
+        return _result(
+            namespace,
+            start,
+            status="failed",
+            error=repr(exc),
+            downloads=await _join_downloads(namespace),
+        )
+    return _result(
+        namespace,
+        start,
+        status="passed",
+        result=data,
+        downloads=await _join_downloads(namespace),
+    )
+
+
+def _in_worker(fn, *args) -> Tuple[Any, Any]:
+    """fn(*args) and the metrics recorded meanwhile, to merge into the parent's
+
+    Its responses are written first, as process pool workers skip atexit. In a
+    thread it just hands METRICS back to itself.
+    """
+    result: Any = fn(*args)
+    persist.RESPONSES.flush()
+    return result, METRICS.drain()
+
+
+def report(result: Dict[str, Any]) -> None:
+    if result["status"] == "failed":
+        print(f"{result['namespace']} generated an exception: {result['error']}")
+    else:
+        print(f"Completed {result['namespace']}: result: {result['result']}")
+    fetched: Dict[str, Any] = result.get("downloads", {})
+    if fetched.get("polled") or fetched.get("timed_out"):
+        print(
+            f"  documents: {fetched['downloaded']} downloaded, "
+            f"{fetched['failed']} failed, {fetched['deduped']} already downloaded, "
+            f"{fetched['timed_out']} lists still empty at timeout"
+        )
+
+
+async def arun_namespaces(
+    namespaces: Sequence[str], workers: int
+) -> List[Dict[str, Any]]:
+    """Run namespaces on the event loop, workers of them in flight at once"""
+    from client import drain
+
+    semaphore: asyncio.Semaphore = asyncio.Semaphore(workers)
+
+    async def bounded(namespace: str) -> Dict[str, Any]:
+        async with semaphore:
+            return await arun_namespace(namespace)
+
+    results: List[Dict[str, Any]] = []
+    try:
+        for future in asyncio.as_completed([bounded(i) for i in namespaces]):
+            result: Dict[str, Any] = await future
+            report(result)
+            results.append(result)
+    finally:
+        await drain()
+    return results
+
+
+def run_event_loop(namespaces: Sequence[str], workers: int) -> List[Dict[str, Any]]:
+    return asyncio.run(arun_namespaces(namespaces, workers))
+
+
+def run_all(
+    namespaces: Sequence[str],
+    workers: int,
+    executor: str,
+    asynchronous: bool,
+    expected: Dict[str, float],
+) -> List[Dict[str, Any]]:
+    """Run namespaces longest expected first, so no long one starts last"""
+    if asynchronous and executor == "thread":
+        return run_event_loop(longest_first(namespaces, expected), workers)
+
+    results: List[Dict[str, Any]] = []
+    if asynchronous:
+        # an event loop per process, each with its share of the namespaces
+        concurrency: int = int(os.environ.get("PMX_SCENARIO_CONCURRENCY", 64))
+        with futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            tasks: List[futures.Future] = [
+                pool.submit(_in_worker, run_event_loop, group, concurrency)
+                for group in partition(namespaces, expected, workers)
+                if group
+            ]
+            for task in tasks:
+                done, recorded = task.result()
+                METRICS.merge(recorded)
+                results.extend(done)
+        return results
+
+    with EXECUTORS[executor](max_workers=workers) as pool:
+        for task in futures.as_completed(
+            [
+                pool.submit(_in_worker, run_namespace, i)
+                for i in longest_first(namespaces, expected)
+            ]
+        ):
+            result, recorded = task.result()
+            METRICS.merge(recorded)
+            report(result)
+            results.append(result)
+    return results
+
+
+def write_results(path: str, document: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as writer:
+        json.dump(document, writer, indent=2, default=str)
+
+
+def write_metrics(directory: str, name: str) -> str:
+    """Write METRICS as metrics-name.json and .prom in directory"""
+    json_path: str = os.path.join(directory, f"metrics-{name}.json")
+    METRICS.write(json_path, os.path.join(directory, f"metrics-{name}.prom"))
+    return json_path
+
+
+def shard_results(directory: str) -> Dict[int, List[str]]:
+    """The shard results files in directory, by the shard count they ran with"""
+    result: Dict[int, List[str]] = {}
+    for path in sorted(glob.glob(os.path.join(directory, "shard-*-of-*.json"))):
+        count: str = os.path.basename(path)[: -len(".json")].rsplit("-of-", 1)[1]
+        if count.isdigit():
+            result.setdefault(int(count), []).append(path)
+    return result
+
+
+def clear_other_shards(directory: str, count: int) -> None:
+    """Remove results left by runs split into other than count shards"""
+    for other, paths in shard_results(directory).items():
+        if other == count:
+            continue
+        for path in paths:
+            name: str = os.path.basename(path)[len("shard-") : -len(".json")]
+            for stale in (
+                path,
+                os.path.join(directory, f"metrics-{name}.json"),
+                os.path.join(directory, f"metrics-{name}.prom"),
+            ):
+                if os.path.isfile(stale):
+                    os.remove(stale)
+
+
+def latest_shards(directory: str) -> List[str]:
+    """The results files of the latest run's shard count in directory"""
+    by_count: Dict[int, List[str]] = shard_results(directory)
+    if not by_count:
+        return []
+    latest: int = max(
+        by_count, key=lambda i: max(os.path.getmtime(j) for j in by_count[i])
+    )
+    return by_count[latest]
+
+
+def merge_results(paths: Sequence[str], namespaces: Sequence[str]) -> Dict[str, Any]:
+    """One report out of every shard's results file, all split the same way"""
+    shards: List[Dict[str, Any]] = []
+    results: Dict[str, Dict[str, Any]] = {}
+    for path in paths:
+        with open(path, "r") as reader:
+            document: Dict[str, Any] = json.load(reader)
+        shards.append({k: v for k, v in document.items() if k != "namespaces"})
+        for result in document.get("namespaces", []):
+            results[result["namespace"]] = result
+    counts: List[str] = sorted({i["shard"].split("/")[1] for i in shards})
+    if len(counts) > 1:
+        # each split covers every namespace, so mixing them double counts some
+        raise click.ClickException(
+            f"Can't merge results of runs split {' and '.join(counts)} ways"
+        )
+    return {
+        "shards": shards,
+        # shards run side by side, so the slowest one is the suite's wall time
+        "wall": max((i["wall"] for i in shards), default=0.0),
+        "passed": sorted(k for k, v in results.items() if v["status"] == "passed"),
+        "failed": sorted(k for k, v in results.items() if v["status"] == "failed"),
+        "missing": [i for i in namespaces if i not in results],
+        "namespaces": [results[i] for i in namespaces if i in results],
+    }
+
+
+def main(namespaces: Sequence[str], asynchronous: bool = False) -> None:
+    """run.py's command line, over the namespaces it lists"""
+
+    @click.group(invoke_without_command=True)
+    @click.option(
+        "-w",
+        "--workers",
+        type=int,
+        help="Namespaces run at once (default 4, or 64 in flight for --async "
+        "projects); with --async and --executor process, event loop processes",
+    )
+    @click.option(
+        "-x",
+        "--executor",
+        type=click.Choice(list(EXECUTORS)),
+        default="thread",
+        help="Run namespaces on threads, or on processes to spread the cpu work",
+    )
+    @click.option(
+        "--shard",
+        type=str,
+        help="Only run shard i of n, e.g. 2/4, to split the suite across machines",
+    )
+    @click.option(
+        "--results",
+        type=str,
+        help="Where to write this run's results (default: .pmx_results/)",
+    )
+    @click.option(
+        "--history",
+        type=str,
+        default=HISTORY_FILE,
+        envvar="PMX_HISTORY",
+        help="Past durations (default: .pmx_history.json), which order and shard "
+        "the namespaces; only unsharded runs update it, see merge --history",
+    )
+    @click.pass_context
+    def cli(
+        ctx: click.Context,
+        workers: Optional[int],
+        executor: str,
+        shard: Optional[str],
+        results: Optional[str],
+        history: str,
+    ) -> None:
+        """Run the exported scenarios; `merge` combines the results of shards"""
+        if ctx.invoked_subcommand:
+            return
+        index, count = parse_shard(shard) if shard else (1, 1)
+        expected: Dict[str, float] = expected_durations(
+            namespaces, load_history(history)
+        )
+        selected: List[str] = select_shard(namespaces, index, count, expected)
+        workers = workers or (
+            int(os.environ.get("PMX_SCENARIO_CONCURRENCY", 64)) if asynchronous else 4
+        )
+        clear_responses(selected)
+        if not results:
+            clear_other_shards(RESULTS_DIR, count)
+
+        start: float = time.perf_counter()
+        outcome: List[Dict[str, Any]] = run_all(
+            selected, workers, executor, asynchronous, expected
+        )
+        if count == 1:
+            # shards only read it, so every one splits the suite the same way
+            update_history(history, outcome)
+        failed: int = sum(i["status"] == "failed" for i in outcome)
+        path: str = results or os.path.join(
+            RESULTS_DIR, f"shard-{index}-of-{count}.json"
+        )
+        write_results(
+            path,
+            {
+                "shard": f"{index}/{count}",
+                "workers": workers,
+                "executor": executor,
+                "wall": time.perf_counter() - start,
+                "expected": sum(expected[i] for i in selected),
+                "passed": len(outcome) - failed,
+                "failed": failed,
+                "namespaces": outcome,
+            },
+        )
+        metrics_path: str = write_metrics(
+            os.path.dirname(os.path.abspath(path)), f"{index}-of-{count}"
+        )
+        print(
+            f"{len(outcome) - failed} passed, {failed} failed, results in {path}, "
+            f"request timings in {metrics_path} and .prom"
+        )
+        if failed:
+            sys.exit(1)
+
+    @cli.command()
+    @click.argument("paths", nargs=-1)
+    @click.option(
+        "-o",
+        "--output",
+        type=str,
+        default=os.path.join(RESULTS_DIR, "report.json"),
+        help="Where to write the combined report",
+    )
+    @click.option(
+        "--history",
+        type=str,
+        help="Also fold every shard's durations into this history file, which "
+        "sharded runs only read",
+    )
+    def merge(paths: Tuple[str, ...], output: str, history: Optional[str]) -> None:
+        """Combine shard results files (default: the latest run's in .pmx_results/)"""
+        paths = paths or tuple(latest_shards(RESULTS_DIR))
+        document: Dict[str, Any] = merge_results(paths, namespaces)
+        write_results(output, document)
+        if history:
+            update_history(history, document["namespaces"])
+        print(
+            f"{len(document['passed'])} passed, {len(document['failed'])} failed, "
+            f"{len(document['missing'])} missing across {len(paths)} shards "
+            f"in {document['wall']:.2f}s, report in {output}"
+        )
+        if document["failed"] or document["missing"]:
+            sys.exit(1)
+
+    @cli.command()
+    @click.argument("chosen", nargs=-1)
+    @click.option("-u", "--users", type=int, default=10, help="Virtual users")
+    @click.option(
+        "-d", "--duration", type=float, default=60.0, help="Seconds to start runs for"
+    )
+    @click.option(
+        "--ramp-up",
+        type=float,
+        default=0.0,
+        help="Seconds over which the users start, evenly spread",
+    )
+    @click.option(
+        "--rate",
+        type=float,
+        default=0.0,
+        help="Most scenario runs a second, across all users (default: no limit)",
+    )
+    @click.option(
+        "-o",
+        "--output",
+        type=str,
+        default=os.path.join(RESULTS_DIR, "load.json"),
+        help="Where to write the latencies",
+    )
+    def load(
+        chosen: Tuple[str, ...],
+        users: int,
+        duration: float,
+        ramp_up: float,
+        rate: float,
+        output: str,
+    ) -> None:
+        """Load test: run the chosen namespaces (default: all) as virtual users"""
+        from loadtest import LoadTest, format_summary
+
+        unknown: List[str] = [i for i in chosen if i not in namespaces]
+        if unknown:
+            raise click.BadParameter(f"no such namespaces: {', '.join(unknown)}")
+        test: LoadTest = LoadTest(
+            list(chosen) or namespaces, users, duration, ramp_up, rate
+        )
+        summary: Dict[str, Any] = test.run(asynchronous)
+        write_results(output, summary)
+        metrics_path: str = write_metrics(
+            os.path.dirname(os.path.abspath(output)), "load"
+        )
+        print(format_summary(summary))
+        print(f"Latencies in {output}, request timings in {metrics_path} and .prom")
+
+    cli()
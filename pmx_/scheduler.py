@@ -0,0 +1,85 @@
+import asyncio
+import contextvars
+import os
+from concurrent import futures
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set
+
+# PMX_SCHEDULE=serial runs each namespace's requests one after another again
+GRAPH_SCHEDULING: bool = os.environ.get("PMX_SCHEDULE", "graph") != "serial"
+# requests of one namespace in flight at once
+WORKERS: int = int(os.environ.get("PMX_SCENARIO_WORKERS", 4))
+
+
+def _ready(
+    dependencies: Dict[str, Sequence[str]], done: Set[str], started: Set[str]
+) -> List[str]:
+    """Requests not started yet whose dependencies are all done, in generated order"""
+    return [
+        name
+        for name, waits_for in dependencies.items()
+        if name not in started and all(i in done for i in waits_for)
+    ]
+
+
+def run_graph(
+    dependencies: Dict[str, Sequence[str]],
+    functions: Dict[str, Any],
+    workers: int = WORKERS,
+) -> None:
+    """Call each of dependencies' functions once all it depends on have returned
+
+    Independent ones run at the same time on up to workers threads. After a
+    failure nothing new is started, and the first exception is raised once the
+    running ones are done.
+    """
+    done: Set[str] = set()
+    started: Set[str] = set()
+    error: Optional[BaseException] = None
+    with futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        running: Dict[futures.Future, str] = {}
+        while True:
+            if error is None:
+                for name in _ready(dependencies, done, started):
+                    started.add(name)
+                    fn: Callable[[], Any] = functions[name]
+                    # in the caller's context, e.g. a load test user's CLOSET_VARS
+                    running[executor.submit(contextvars.copy_context().run, fn)] = name
+            if not running:
+                break
+            finished, _ = futures.wait(running, return_when=futures.FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                if future.exception() is not None:
+                    error = error or future.exception()
+                else:
+                    done.add(name)
+    if error is not None:
+        raise error
+
+
+async def arun_graph(
+    dependencies: Dict[str, Sequence[str]],
+    functions: Dict[str, Any],
+    workers: int = WORKERS,
+) -> None:
+    """run_graph for coroutine functions, as tasks on the running event loop"""
+    done: Set[str] = set()
+    started: Set[str] = set()
+    error: Optional[BaseException] = None
+    running: Dict[asyncio.Task, str] = {}
+    while True:
+        if error is None:
+            for name in _ready(dependencies, done, started)[: workers - len(running)]:
+                started.add(name)
+                running[asyncio.create_task(functions[name]())] = name
+        if not running:
+            break
+        finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+        for task in finished:
+            name = running.pop(task)
+            if task.exception() is not None:
+                error = error or task.exception()
+            else:
+                done.add(name)
+    if error is not None:
+        raise error
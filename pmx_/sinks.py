@@ -0,0 +1,85 @@
+import os
+import shutil
+import zipfile
+from typing import Sequence, Union
+
+
+class DirectorySink:
+    """Writes generated files where their paths say"""
+
+    def makedirs(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, path: str, content: str) -> None:
+        with open(path, "w") as writer:
+            writer.write(content)
+
+    def copy(self, source: str, path: str) -> None:
+        if os.path.abspath(source) != os.path.abspath(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(source, path)
+
+    def close(self) -> None:
+        pass
+
+
+class ZipSink:
+    """Writes generated files into a zip instead, under basename(root)/
+
+    Paths are laid out as `archive` would lay out the same files on disk.
+    """
+
+    def __init__(
+        self,
+        zip_path: str,
+        root: str,
+        compression: int = zipfile.ZIP_DEFLATED,
+        compresslevel: int = 6,
+    ) -> None:
+        self.root: str = os.path.abspath(root)
+        self.prefix: str = os.path.basename(self.root)
+        self.zip: zipfile.ZipFile = zipfile.ZipFile(
+            zip_path, "w", compression=compression, compresslevel=compresslevel
+        )
+
+    def arcname(self, path: str) -> str:
+        return os.path.join(self.prefix, os.path.relpath(path, self.root))
+
+    def makedirs(self, path: str) -> None:
+        # zips only need entries for files
+        pass
+
+    def write(self, path: str, content: str) -> None:
+        self.zip.writestr(self.arcname(path), content)
+
+    def copy(self, source: str, path: str) -> None:
+        self.zip.write(source, arcname=self.arcname(path))
+
+    def close(self) -> None:
+        self.zip.close()
+
+
+class TeeSink:
+    """Writes to every one of sinks, e.g. a zip and the tree it was made from"""
+
+    def __init__(self, sinks: Sequence[Union[DirectorySink, ZipSink]]) -> None:
+        self.sinks: Sequence[Union[DirectorySink, ZipSink]] = sinks
+
+    def makedirs(self, path: str) -> None:
+        for sink in self.sinks:
+            sink.makedirs(path)
+
+    def write(self, path: str, content: str) -> None:
+        for sink in self.sinks:
+            sink.write(path, content)
+
+    def copy(self, source: str, path: str) -> None:
+        for sink in self.sinks:
+            sink.copy(source, path)
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
+
+
+Sink = Union[DirectorySink, ZipSink, TeeSink]
@@ -0,0 +1,167 @@
+import json
+import re
+from typing import Any, Dict, Iterator, Sequence, TextIO, Tuple
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+TERMINATORS: str = " \t\n\r,:]}"
+CHUNK_SIZE: int = 1 << 16
+
+
+class JsonStream:
+    """Pull reader over a json document that never holds more than one value at a time
+
+    Structure (objects and arrays) is walked by hand; each leaf value is handed to
+    the stdlib decoder once enough of it has been buffered.
+    """
+
+    def __init__(self, reader: TextIO, chunk_size: int = CHUNK_SIZE) -> None:
+        self.reader: TextIO = reader
+        self.chunk_size: int = chunk_size
+        self.buffer: str = str()
+        self.pos: int = 0
+        self.eof: bool = False
+        self.decoder: json.JSONDecoder = json.JSONDecoder()
+
+    def _fill(self, size: int) -> bool:
+        if self.eof:
+            return False
+        chunk: str = self.reader.read(size)
+        if not chunk:
+            self.eof = True
+            return False
+        # drop what's been consumed so the buffer only ever holds the current value
+        consumed: int = self.pos
+        self.buffer = self.buffer[consumed:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()  # type: ignore
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill(self.chunk_size):
+                return str()
+
+    def expect(self, char: str) -> None:
+        found: str = self.peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' at offset {self.pos}, found '{found}'")
+        self.pos += 1
+
+    def read_value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a number cut off by the chunk boundary still decodes, so only
+                # trust a value once whatever follows it is in the buffer
+                if self.eof or (
+                    end < len(self.buffer) and self.buffer[end] in TERMINATORS
+                ):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            # grow geometrically so big values aren't re-decoded too often
+            self._fill(max(self.chunk_size, len(self.buffer) - self.pos))
+
+    def iter_object(self) -> Iterator[str]:
+        """Yield each key of an object; the caller must consume its value"""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key: str = self.read_value()
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.pos += 1
+            else:
+                self.expect("}")
+                return
+
+    def iter_array(self) -> Iterator[None]:
+        """Yield once per element of an array; the caller must consume the element"""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.peek() == ",":
+                self.pos += 1
+            else:
+                self.expect("]")
+                return
+
+
+def read_object(
+    stream: JsonStream,
+    lazy: str = "item",
+    requires: Sequence[str] = ("name",),
+    skip: Sequence[str] = ("response",),
+) -> Dict[str, Any]:
+    """Read a postman item, leaving a non-empty `lazy` array as a generator
+
+    Keys after the lazy array are added to the returned dict once the generator
+    is exhausted. If the array turns up before the `requires` keys it is read
+    eagerly instead. Values for `skip` keys are read and thrown away.
+    """
+    result: Dict[str, Any] = {}
+    keys: Iterator[str] = stream.iter_object()
+    for key in keys:
+        if key == lazy and stream.peek() == "[":
+            if all(i in result for i in requires):
+                elements: Iterator[None] = stream.iter_array()
+                try:
+                    next(elements)
+                except StopIteration:
+                    result[key] = []
+                    continue
+                result[key] = _lazy_items(stream, elements, keys, result)
+                return result
+        value: Any = stream.read_value()
+        if key not in skip:
+            result[key] = value
+    return result
+
+
+def _lazy_items(
+    stream: JsonStream,
+    elements: Iterator[None],
+    keys: Iterator[str],
+    parent: Dict[str, Any],
+) -> Iterator[Any]:
+    # the first element has already been stepped into to rule out an empty array
+    while True:
+        if stream.peek() == "{":
+            yield read_object(stream)
+        else:
+            yield stream.read_value()
+        try:
+            next(elements)
+        except StopIteration:
+            break
+
+    for key in keys:
+        parent[key] = stream.read_value()
+
+
+def iter_collection(stream: JsonStream) -> Iterator[Tuple[str, Any]]:
+    """Yield the top level (key, value) pairs of a postman collection export
+
+    `item` is yielded as a generator of lazily read root items, so it must be
+    consumed before iteration continues.
+    """
+    for outer in stream.iter_object():
+        if outer != "collection":
+            stream.read_value()
+            continue
+        for key in stream.iter_object():
+            if key == "item":
+                yield key, (read_object(stream) for _ in stream.iter_array())
+            else:
+                yield key, stream.read_value()
@@ -0,0 +1,236 @@
+import asyncio
+import email.utils
+import fnmatch
+import os
+import threading
+import time
+from contextlib import ExitStack, asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+# statuses that mean "slow down", retried after backing off
+BACKOFF_STATUSES: Tuple[int, ...] = (429, 503)
+MAX_BACKOFF: float = 60.0
+
+
+class TokenBucket:
+    """rate tokens a second, up to burst of them saved up; a rate of 0 never waits"""
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate: float = rate
+        self.max_rate: float = rate
+        self.burst: int = max(burst, 1)
+        self.tokens: float = float(self.burst)
+        self.updated: float = time.monotonic()
+        self.paused_until: float = 0.0
+        self._lock: threading.Lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token, returning how long to wait before it's usable"""
+        with self._lock:
+            now: float = time.monotonic()
+            if self.rate:
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated) * self.rate
+                )
+            self.updated = now
+            wait: float = max(self.paused_until - now, 0.0)
+            if not self.rate:
+                return wait
+            self.tokens -= 1
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens / self.rate)
+            return wait
+
+    def acquire(self) -> float:
+        wait: float = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def pause(self, seconds: float) -> None:
+        """Hold every acquire for seconds and halve the rate, e.g. on a 429"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            if self.rate:
+                self.rate = max(self.rate / 2, self.max_rate / 16)
+
+    def recover(self) -> None:
+        """Creep back towards the configured rate after a success"""
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.rate + self.max_rate / 20, self.max_rate)
+
+
+def retry_after(response: requests.Response) -> Optional[float]:
+    """Seconds asked for by a Retry-After header, in either of its forms"""
+    value: str = response.headers.get("Retry-After", str()).strip()
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
+
+def parse_caps(spec: str) -> List[Tuple[str, int]]:
+    """Concurrency caps from 'pattern=limit,...', e.g. '/documents*=2,/policies/*=4'"""
+    caps: List[Tuple[str, int]] = []
+    for item in spec.split(","):
+        if "=" in item:
+            pattern, limit = item.rsplit("=", 1)
+            caps.append((pattern.strip(), int(limit)))
+    return caps
+
+
+class Throttle:
+    """Paces requests through a global and a per-host token bucket, rates per second
+
+    Requests whose path matches one of caps' fnmatch patterns also hold one of
+    that pattern's slots while in flight. Disabled, nothing waits except for a
+    server's explicit Retry-After.
+    """
+
+    def __init__(
+        self,
+        rate: float = 0.0,
+        burst: int = 10,
+        host_rate: float = 20.0,
+        host_burst: int = 10,
+        caps: Optional[List[Tuple[str, int]]] = None,
+        retries: int = 3,
+        enabled: bool = True,
+    ) -> None:
+        self.enabled: bool = enabled
+        self.retries: int = retries
+        self.host_rate: float = host_rate
+        self.host_burst: int = host_burst
+        self.bucket: TokenBucket = TokenBucket(rate if enabled else 0, burst)
+        self.hosts: Dict[str, TokenBucket] = {}
+        self.caps: List[Tuple[str, threading.BoundedSemaphore]] = [
+            (pattern, threading.BoundedSemaphore(limit))
+            for pattern, limit in caps or []
+        ]
+        self.waited: float = 0.0
+        self._lock: threading.Lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, **overrides) -> "Throttle":
+        """The throttle the PMX_* variables describe, with overrides of its args"""
+        settings: Dict[str, Any] = {
+            "rate": float(os.environ.get("PMX_RATE", 0)),
+            "burst": int(os.environ.get("PMX_BURST", 10)),
+            "host_rate": float(os.environ.get("PMX_HOST_RATE", 20)),
+            "host_burst": int(os.environ.get("PMX_HOST_BURST", 10)),
+            "caps": parse_caps(os.environ.get("PMX_CONCURRENCY", str())),
+            "retries": int(os.environ.get("PMX_RETRIES", 3)),
+            "enabled": os.environ.get("PMX_THROTTLE", "1") != "0",
+        }
+        settings.update(overrides)
+        return cls(**settings)
+
+    def host(self, url: str) -> TokenBucket:
+        netloc: str = urlsplit(url).netloc
+        with self._lock:
+            if netloc not in self.hosts:
+                self.hosts[netloc] = TokenBucket(
+                    self.host_rate if self.enabled else 0, self.host_burst
+                )
+            return self.hosts[netloc]
+
+    @contextmanager
+    def slot(self, url: str) -> Iterator[None]:
+        """Wait for url's turn, holding its concurrency slots until the block ends"""
+        with ExitStack() as stack:
+            waited: float = self.bucket.acquire() + self.host(url).acquire()
+            if self.enabled:
+                path: str = urlsplit(url).path
+                for pattern, semaphore in self.caps:
+                    if fnmatch.fnmatch(path, pattern):
+                        start: float = time.monotonic()
+                        stack.enter_context(semaphore)
+                        waited += time.monotonic() - start
+            with self._lock:
+                self.waited += waited
+            yield
+
+    @asynccontextmanager
+    async def aslot(self, url: str) -> AsyncIterator[None]:
+        """slot for coroutines, waiting without blocking the event loop"""
+        waited: float = max(self.bucket.reserve(), self.host(url).reserve())
+        if waited > 0:
+            await asyncio.sleep(waited)
+        held: List[threading.BoundedSemaphore] = []
+        try:
+            if self.enabled:
+                path: str = urlsplit(url).path
+                for pattern, semaphore in self.caps:
+                    if fnmatch.fnmatch(path, pattern):
+                        # shared with threads, so it can't be awaited directly
+                        while not semaphore.acquire(blocking=False):
+                            await asyncio.sleep(0.01)
+                            waited += 0.01
+                        held.append(semaphore)
+            with self._lock:
+                self.waited += waited
+            yield
+        finally:
+            for semaphore in held:
+                semaphore.release()
+
+    def backoff(self, url: str, response: requests.Response, attempt: int) -> bool:
+        """Back url's host off after a 429/503, returning whether to retry"""
+        if response.status_code not in BACKOFF_STATUSES or attempt >= self.retries:
+            return False
+        delay: Optional[float] = retry_after(response)
+        if delay is None:
+            delay = 0.5 * 2**attempt if self.enabled else 0.0
+        self.host(url).pause(min(delay, MAX_BACKOFF))
+        return True
+
+    def succeeded(self, url: str) -> None:
+        self.host(url).recover()
+
+    def send(self, send, url: str) -> requests.Response:
+        """Call send() in url's slot, retrying it while the server asks to back off"""
+        attempt: int = 0
+        while True:
+            with self.slot(url):
+                response: requests.Response = send()
+            if not self.backoff(url, response, attempt):
+                break
+            attempt += 1
+        if response.status_code not in BACKOFF_STATUSES:
+            self.succeeded(url)
+        return response
+
+    async def asend(self, send, url: str) -> requests.Response:
+        """send for coroutines, awaiting send() instead of calling it"""
+        attempt: int = 0
+        while True:
+            async with self.aslot(url):
+                response: requests.Response = await send()
+            if not self.backoff(url, response, attempt):
+                break
+            attempt += 1
+        if response.status_code not in BACKOFF_STATUSES:
+            self.succeeded(url)
+        return response
+
+
+THROTTLE: Throttle = Throttle.from_env()
+
+
+def configure_throttle(**kwargs) -> Throttle:
+    """Replace the shared throttle, e.g. configure_throttle(enabled=False)"""
+    global THROTTLE
+
+    THROTTLE = Throttle(**kwargs)
+    return THROTTLE
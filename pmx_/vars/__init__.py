@@ -1,23 +1,45 @@
-from collections import defaultdict
+from collections import ChainMap, defaultdict
+import contextlib
+from contextvars import ContextVar
 import hashlib
 import hmac
 import inspect
 import json
 import os
-from typing import Any, Dict, List, Optional, Tuple
+import threading
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
 
 import enlighten
 from prodict import Prodict  # type: ignore
 
-from .times import read_env_times
+from .times import (  # noqa: F401
+    COMPUTED,
+    COMPUTED_VARS,
+    computed,
+    computed_value,
+    read_env_times,
+    relative,
+)
 from .global_vars import GLOBAL_VARS
+from . import custom_vars  # noqa: F401
 
 THIS_DIR: str = os.path.dirname(os.path.abspath(__file__))
 ENV: str = "local"
+# names of the work segments being run, outermost first; threads the scheduler
+# starts and asyncio tasks inherit it
+SCENARIO_PATH: ContextVar[Tuple[str, ...]] = ContextVar("pmx_scenario_path", default=())
+# load_vars() of each path, loaded once per process
+_SNAPSHOTS: Dict[str, Mapping[str, Any]] = {}
+_SNAPSHOTS_LOCK: threading.Lock = threading.Lock()
 
 
 class SafeArgs(defaultdict):
     def __missing__(self, key):
+        if key in COMPUTED:
+            # computed the first time it's used, see times.computed
+            self[key] = computed_value(key)
+            return self[key]
         return f"{{{key}}}"
 
 
@@ -32,12 +54,28 @@ def load_vars(path: str = os.path.join(THIS_DIR, f"env.{ENV}.json")) -> SafeArgs
         for item in env:
             result[item["key"]] = item["value"]
 
-    all_times: Dict[str, Any] = read_env_times()
-    result.update(all_times)
-
     return result
 
 
+def shared_vars(
+    path: str = os.path.join(THIS_DIR, f"env.{ENV}.json")
+) -> Mapping[str, Any]:
+    """load_vars(path) as first loaded in this process, read-only"""
+    with _SNAPSHOTS_LOCK:
+        if path not in _SNAPSHOTS:
+            _SNAPSHOTS[path] = MappingProxyType(
+                # computed vars win over the env's, as they always have
+                {k: v for k, v in load_vars(path).items() if k not in COMPUTED}
+            )
+        return _SNAPSHOTS[path]
+
+
+def namespace_vars(*layers: Mapping[str, Any]) -> ChainMap:
+    """Vars written to a map of their own, over layers (the last wins),
+    shared_vars() and the computed vars"""
+    return ChainMap({}, *reversed(layers), shared_vars(), COMPUTED_VARS)
+
+
 def get_entity_id(
     included: List[Dict[str, Any]],
     type_string: str,
@@ -108,9 +146,19 @@ def get_coverage_by_id(
     return coverage.id  # type: ignore
 
 
-def get_stack_path():
-    stack = list(reversed([f.function for f in inspect.stack()]))[1:-3]
-    return ".".join(stack)
+@contextlib.contextmanager
+def scenario_segment(name: str) -> Iterator[None]:
+    """Add name to SCENARIO_PATH for the block"""
+    token = SCENARIO_PATH.set(SCENARIO_PATH.get() + (name,))
+    try:
+        yield
+    finally:
+        SCENARIO_PATH.reset(token)
+
+
+def get_stack_path() -> str:
+    # the segments the calling request runs in, leaving out the request itself
+    return ".".join(SCENARIO_PATH.get()[:-1])
 
 
 def finder(included: List[Dict[str, Any]], arrow_func: str) -> Optional[Prodict]:
@@ -152,17 +200,48 @@ def finder(included: List[Dict[str, Any]], arrow_func: str) -> Optional[Prodict]
     return Prodict(**expresult)
 
 
-class ProgressBar:
+class ProgressManager:
+    """The one enlighten manager every namespace in a process draws on"""
+
     def __init__(self):
-        self.manager: "enlighten.NotebookManager|enlighten.Manager" = (
-            enlighten.get_manager(no_resize=True)
-        )
+        self._manager: "Optional[enlighten.NotebookManager|enlighten.Manager]" = None
+        self._lock: threading.Lock = threading.Lock()
+
+    @property
+    def manager(self) -> "enlighten.NotebookManager|enlighten.Manager":
+        # made on first use, so importing a namespace doesn't start one
+        with self._lock:
+            if self._manager is None:
+                self._manager = enlighten.get_manager(no_resize=True)
+            return self._manager
+
+    def counter(self, total: int, desc: str) -> enlighten.Counter:
+        return self.manager.counter(total=total, desc=desc, leave=True, color="green")
+
+
+PROGRESS: ProgressManager = ProgressManager()
+
+
+class ProgressBar:
+    """A namespace's progress, counting the work segments run under its top caller
+
+    calls starts as the totals the exporter worked out, WORK_TOTALS; those of
+    segments it didn't know of, like hand-written scenarios, are read from
+    their source the first time they're needed.
+    """
+
+    def __init__(self, calls: Optional[Dict[str, int]] = None):
         self._counter: Optional[Any | enlighten.Counter] = None
-        self._calls: Dict[str, int] = {}
+        self._calls: Dict[str, int] = dict(calls or {})
+        self._segments: Dict[str, Callable] = {}
         self._caller: str = str()
         self._completed_work: int = 0
         self._total_work: int = 0
 
+    @property
+    def manager(self):
+        return PROGRESS.manager
+
     @property
     def counter(self):
         return self._counter
@@ -191,15 +270,31 @@ class ProgressBar:
     def percent_done(self):
         return f"{int((self.completed_work/self.total_work)*100)}%"
 
+    def register(self, function_name: str, fn: Callable) -> None:
+        self._segments[function_name] = fn
+
+    def work_total(self, function_name: str) -> int:
+        if function_name not in self.calls:
+            # counts itself, and guards against segments calling each other
+            self.calls[function_name] = 1
+            fn: Optional[Callable] = self._segments.get(function_name)
+            if fn is not None:
+                for line in inspect.getsourcelines(fn)[0]:
+                    call: str = line.split("#")[0].strip().replace("await ", str())
+                    name: str = call[: -len("()")]
+                    if call.endswith("()") and (
+                        name in self.calls or name in self._segments
+                    ):
+                        self.calls[function_name] += self.work_total(name)
+        return self.calls[function_name]
+
     def init_top_caller(self, function_name: str, desc: str):
         self.caller = function_name
-        self._total_work = self.calls[function_name]
+        self._total_work = self.work_total(function_name)
         self.make_counter(self.total_work, desc)
 
     def make_counter(self, total: int, desc: str) -> None:
-        self._counter = self.manager.counter(
-            total=total, desc=desc, leave=True, color="green"
-        )
+        self._counter = PROGRESS.counter(total, desc)
 
     def increment_total_work(self):
         self._total_work += 1
@@ -0,0 +1,13 @@
+"""Computed vars of your own; export makes this file once and leaves it be after
+
+e.g.
+
+    relative("IN_30_DAYS", days=30)
+
+
+    @computed("NEXT_MONTH")
+    def next_month(start):
+        return add_months(start, 1).strftime(DATE)
+"""
+
+from .times import DATE, add_months, computed, relative  # noqa: F401
@@ -1,117 +1,165 @@
-from typing import Any, Dict
-
-import moment  # type: ignore
-
-
-def read_env_times() -> Dict[str, Any]:
-    result: Dict[str, Any] = {}
-    result["tomorrowIsoMidnightUtc"] = (
-        moment.now().add(days=1).format("YYYY-MM-DDT00:00:00-00:00")
-    )
-    result["TIME"] = moment.now().format("HHmmssSSS")
-    result["TODAY"] = moment.now().format("YYYY-MM-DD")
-
-    # These are the timezones, most of which are in Daylight Savings Time (DST)",
-    result["AZ_TZ"] = "-0700"  # "Mountain Standard Time"
-    result["CA_TZ"] = "-0700"  # "Pacific Daylight Time"
-    result["NV_TZ"] = "-0700"  # "Pacific Daylight Time"
-    result["CO_TZ"] = "-0600"  # "Mountain Daylight Time
-    result["IL_TZ"] = "-0500"  # "Central Daylight Time"
-    result["NC_TZ"] = "-0400"  # "Eastern Daylight Time"
-    result["NJ_TZ"] = "-0400"  # "Eastern Daylight Time"
-    result["NY_TZ"] = "-0400"  # "Eastern Daylight Time"
-    result["OR_TZ"] = "-0700"  # "Pacific Daylight Time"
-    result["PA_TZ"] = "-0400"  # "Eastern Daylight Time"
-    result["VA_TZ"] = "-0400"  # "Eastern Daylight Time"
-
-    today: moment.core.Moment = moment.now()
-    result["TODAY_MIDNIGHT"] = today.format("YYYY-MM-DDT00:00:00")
-    today_midnight_plus_1_year: moment.core.Moment = today.add(years=1)
-    result["TODAY_MIDNIGHT_PLUS_1_YEAR"] = today_midnight_plus_1_year.format(
-        "YYYY-MM-DDT00:00:00"
-    )
-
-    tomorrow = moment.now().add(days=1)
-    result["TOMORROW"] = tomorrow.format("YYYY-MM-DDT00:00:00")
-
-    tomorrow_plus_1_year = moment.now().add(days=1).add(years=1)
-    result["TOMORROW_PLUS_1_YEAR"] = tomorrow_plus_1_year.format("YYYY-MM-DDT00:00:00")
-
-    yesterday = moment.now().subtract(days=1)
-    result["YESTERDAY"] = yesterday.format("YYYY-MM-DDT00:00:00")
-
-    yesterday_plus_1_year = moment.now().subtract(days=1).add(years=1)
-    result["YESTERDAY_PLUS_1_YEAR"] = yesterday_plus_1_year.format(
-        "YYYY-MM-DDT00:00:00"
-    )
-
-    yesterday_plus_2_years = moment.now().subtract(days=1).add(years=2)
-    result["YESTERDAY_PLUS_2_YEARS"] = yesterday_plus_2_years.format(
-        "YYYY-MM-DDT00:00:00"
+import calendar
+import os
+import threading
+import time
+from collections.abc import Mapping
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:
+    # python 3.8, utc_offset() goes by the fallback offsets
+    ZoneInfo = None  # type: ignore
+
+DATE: str = "%Y-%m-%d"
+MIDNIGHT: str = "%Y-%m-%dT00:00:00"
+
+# every computed var, as fn(run start) -> value, see computed()
+COMPUTED: Dict[str, Callable[[datetime], Any]] = {}
+_VALUES: Dict[str, Any] = {}
+_LOCK: threading.Lock = threading.Lock()
+
+
+def run_started() -> float:
+    """When the run started, taken by its first process and inherited by the rest"""
+    if "PMX_RUN_STARTED" not in os.environ:
+        os.environ["PMX_RUN_STARTED"] = str(time.time())
+    return float(os.environ["PMX_RUN_STARTED"])
+
+
+def run_start() -> datetime:
+    """The run's start, in local time"""
+    return datetime.fromtimestamp(run_started())
+
+
+def add_months(when: datetime, months: int) -> datetime:
+    """when, months later (or earlier), on the month's last day if it's shorter"""
+    index: int = when.month - 1 + months
+    year: int = when.year + index // 12
+    month: int = index % 12 + 1
+    day: int = min(when.day, calendar.monthrange(year, month)[1])
+    return when.replace(year=year, month=month, day=day)
+
+
+def computed(name: str) -> Callable:
+    """Make the decorated fn(run start) the var name, computed on first use, e.g.
+
+    @computed("NEXT_MONTH")
+    def next_month(start):
+        return add_months(start, 1).strftime(DATE)
+    """
+
+    def register(fn: Callable[[datetime], Any]) -> Callable[[datetime], Any]:
+        with _LOCK:
+            COMPUTED[name] = fn
+            _VALUES.pop(name, None)
+        return fn
+
+    return register
+
+
+def relative(
+    name: str, days: int = 0, months: int = 0, years: int = 0, fmt: str = MIDNIGHT
+) -> None:
+    """Make the var name the run's start moved by days, then months and years"""
+    computed(name)(
+        lambda start: add_months(
+            start + timedelta(days=days), months + 12 * years
+        ).strftime(fmt)
     )
 
-    last_week = moment.now().subtract(days=7)
-    result["LAST_WEEK"] = last_week.format("YYYY-MM-DDT00:00:00")
 
-    six_days_ago = moment.now().subtract(days=6)
-    result["SIX_DAYS_AGO"] = six_days_ago.format("YYYY-MM-DDT00:00:00")
+def utc_offset(name: str, zone: str, fallback: str) -> None:
+    """Make the var name zone's offset at the run's start, e.g. -0700"""
 
-    six_days_ago_plus_1_year = moment.now().subtract(days=6).add(years=1)
-    result["SIX_DAYS_AGO_PLUS_1_YEAR"] = six_days_ago_plus_1_year.format(
-        "YYYY-MM-DDT00:00:00"
-    )
+    def offset(start: datetime) -> str:
+        if ZoneInfo is None:
+            return fallback
+        try:
+            return start.astimezone(ZoneInfo(zone)).strftime("%z")
+        except ZoneInfoNotFoundError:
+            # no tz database here, go by daylight saving time
+            return fallback
 
-    next_week = moment.now().add(days=7)
-    result["NEXT_WEEK"] = next_week.format("YYYY-MM-DDT00:00:00")
+    computed(name)(offset)
 
-    next_week_minus_1_day = moment.now().add(days=6)
-    result["NEXT_WEEK_MINUS_1_DAY"] = next_week_minus_1_day.format(
-        "YYYY-MM-DDT00:00:00"
-    )
 
-    next_week_minus_1_year = moment.now().add(days=7).subtract(years=1)
-    result["NEXT_WEEK_MINUS_1_YEAR"] = next_week_minus_1_year.format(
-        "YYYY-MM-DDT00:00:00"
-    )
+def computed_value(name: str) -> Any:
+    """name's value, computed the first time it's asked for"""
+    if name not in _VALUES:
+        fn: Callable[[datetime], Any] = COMPUTED[name]
+        with _LOCK:
+            if name not in _VALUES:
+                _VALUES[name] = fn(run_start())
+    return _VALUES[name]
 
-    next_week_minus_2_years = moment.now().add(days=7).subtract(years=2)
-    result["NEXT_WEEK_MINUS_2_YEARS"] = next_week_minus_2_years.format(
-        "YYYY-MM-DDT00:00:00"
-    )
 
-    next_week_minus_3_years = moment.now().add(days=7).subtract(years=2)
-    result["NEXT_WEEK_MINUS_3_YEARS"] = next_week_minus_3_years.format(
-        "YYYY-MM-DDT00:00:00"
-    )
+class ComputedVars(Mapping):
+    """Every computed var by name, each computed when it's first looked up"""
 
-    next_week_plus_1_day = moment.now().add(days=8)
-    result["NEXT_WEEK_PLUS_1_DAY"] = next_week_plus_1_day.format("YYYY-MM-DDT00:00:00")
+    def __getitem__(self, key: str) -> Any:
+        return computed_value(key)
 
-    next_week_plus_1_year = moment.now().add(days=7).add(years=1)
-    result["NEXT_WEEK_PLUS_1_YEAR"] = next_week_plus_1_year.format(
-        "YYYY-MM-DDT00:00:00"
-    )
+    def __contains__(self, key: object) -> bool:
+        return key in COMPUTED
 
-    next_week_plus_2_years = moment.now().add(days=7).add(years=2)
-    result["NEXT_WEEK_PLUS_2_YEARS"] = next_week_plus_2_years.format(
-        "YYYY-MM-DDT00:00:00"
-    )
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(COMPUTED))
 
-    two_weeks = moment.now().add(days=14)
-    result["TWO_WEEKS"] = two_weeks.format("YYYY-MM-DDT00:00:00")
+    def __len__(self) -> int:
+        return len(COMPUTED)
 
-    two_weeks_plus_1_year = moment.now().add(days=14).add(years=1)
-    result["TWO_WEEKS_PLUS_1_YEAR"] = two_weeks_plus_1_year.format(
-        "YYYY-MM-DDT00:00:00"
-    )
 
-    twentyone_years_ago_datetime = moment.now().subtract(years=21)
-    result["TWENTYONE_YEARS_AGO"] = twentyone_years_ago_datetime.format("YYYY-MM-DD")
+COMPUTED_VARS: ComputedVars = ComputedVars()
 
-    one_month_ago_datetime = moment.now().subtract(months=1)
-    result["ONE_MONTH_AGO"] = one_month_ago_datetime.format("YYYY-MM-DD")
 
-    two_months_ago_datetime = moment.now().subtract(months=2)
-    result["TWO_MONTHS_AGO"] = two_months_ago_datetime.format("YYYY-MM-DD")
-
-    return result
+def read_env_times() -> Dict[str, Any]:
+    """Every computed var, computing any not used yet"""
+    return dict(COMPUTED_VARS)
+
+
+@computed("TIME")
+def _time(start: datetime) -> str:
+    return f"{start.strftime('%H%M%S')}{start.microsecond // 1000:03d}"
+
+
+relative("tomorrowIsoMidnightUtc", days=1, fmt="%Y-%m-%dT00:00:00-00:00")
+relative("TODAY", fmt=DATE)
+
+utc_offset("AZ_TZ", "America/Phoenix", "-0700")
+utc_offset("CA_TZ", "America/Los_Angeles", "-0700")
+utc_offset("NV_TZ", "America/Los_Angeles", "-0700")
+utc_offset("CO_TZ", "America/Denver", "-0600")
+utc_offset("IL_TZ", "America/Chicago", "-0500")
+utc_offset("NC_TZ", "America/New_York", "-0400")
+utc_offset("NJ_TZ", "America/New_York", "-0400")
+utc_offset("NY_TZ", "America/New_York", "-0400")
+utc_offset("OR_TZ", "America/Los_Angeles", "-0700")
+utc_offset("PA_TZ", "America/New_York", "-0400")
+utc_offset("VA_TZ", "America/New_York", "-0400")
+
+relative("TODAY_MIDNIGHT")
+relative("TODAY_MIDNIGHT_PLUS_1_YEAR", years=1)
+relative("TOMORROW", days=1)
+relative("TOMORROW_PLUS_1_YEAR", days=1, years=1)
+relative("YESTERDAY", days=-1)
+relative("YESTERDAY_PLUS_1_YEAR", days=-1, years=1)
+relative("YESTERDAY_PLUS_2_YEARS", days=-1, years=2)
+relative("LAST_WEEK", days=-7)
+relative("SIX_DAYS_AGO", days=-6)
+relative("SIX_DAYS_AGO_PLUS_1_YEAR", days=-6, years=1)
+relative("NEXT_WEEK", days=7)
+relative("NEXT_WEEK_MINUS_1_DAY", days=6)
+relative("NEXT_WEEK_MINUS_1_YEAR", days=7, years=-1)
+relative("NEXT_WEEK_MINUS_2_YEARS", days=7, years=-2)
+# two years, as it's always been, which scenarios may depend on
+relative("NEXT_WEEK_MINUS_3_YEARS", days=7, years=-2)
+relative("NEXT_WEEK_PLUS_1_DAY", days=8)
+relative("NEXT_WEEK_PLUS_1_YEAR", days=7, years=1)
+relative("NEXT_WEEK_PLUS_2_YEARS", days=7, years=2)
+relative("TWO_WEEKS", days=14)
+relative("TWO_WEEKS_PLUS_1_YEAR", days=14, years=1)
+relative("TWENTYONE_YEARS_AGO", years=-21, fmt=DATE)
+relative("ONE_MONTH_AGO", months=-1, fmt=DATE)
+relative("TWO_MONTHS_AGO", months=-2, fmt=DATE)
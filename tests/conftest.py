@@ -0,0 +1,8 @@
+import os
+import sys
+
+# the runtime modules import each other as top-level modules, as they do once
+# copied into an exported project
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "pmx_")
+)
@@ -0,0 +1,92 @@
+import os
+import zipfile
+from typing import Dict, List
+
+import pytest
+
+from pmx_ import archive
+from pmx_.archive import COMPRESSION_METHODS, ArchiveBuilder, walk_export
+
+FILES: Dict[str, bytes] = {
+    "scenes/run.py": b"print('run')\n" * 50,
+    "scenes/vars/times.py": b"TODAY = None\n" * 20,
+    "scenes/policies/requests.py": os.urandom(2048),
+    "scenes/.pmx_cache/black.json": b"{}",
+    "scenes/empty.txt": b"",
+}
+
+
+@pytest.fixture
+def export_dir(tmp_path) -> str:
+    for name, content in FILES.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content)
+    return str(tmp_path / "scenes")
+
+
+def build(export_dir: str, zip_path: str, **kwargs) -> ArchiveBuilder:
+    builder: ArchiveBuilder = ArchiveBuilder(zip_path, jobs=2, **kwargs)
+    builder.build(
+        walk_export(export_dir, dir_excludes=[".pmx_cache"]),
+        extras={"scenes/README.txt": b"python run.py\n"},
+    )
+    return builder
+
+
+def read_back(zip_path: str) -> Dict[str, bytes]:
+    with zipfile.ZipFile(zip_path) as zf:
+        assert zf.testzip() is None
+        return {i: zf.read(i) for i in zf.namelist()}
+
+
+def expected() -> Dict[str, bytes]:
+    result: Dict[str, bytes] = {k: v for k, v in FILES.items() if ".pmx_cache" not in k}
+    result["scenes/README.txt"] = b"python run.py\n"
+    return result
+
+
+@pytest.mark.parametrize("compression", list(COMPRESSION_METHODS))
+def test_round_trip(export_dir, tmp_path, compression):
+    zip_path: str = str(tmp_path / "scenes.zip")
+    build(export_dir, zip_path, compression=COMPRESSION_METHODS[compression])
+
+    assert read_back(zip_path) == expected()
+
+
+def test_update_reuses_unchanged_members(export_dir, tmp_path):
+    zip_path: str = str(tmp_path / "scenes.zip")
+    build(export_dir, zip_path)
+    with open(os.path.join(export_dir, "run.py"), "ab") as writer:
+        writer.write(b"print('again')\n")
+
+    builder: ArchiveBuilder = build(export_dir, zip_path, update=True)
+
+    # README.txt is rebuilt in memory, but its CRC shows it's unchanged
+    assert (builder.reused, builder.compressed) == (4, 1)
+    members: Dict[str, bytes] = read_back(zip_path)
+    assert members["scenes/run.py"].endswith(b"print('again')\n")
+    assert {k: v for k, v in members.items() if k != "scenes/run.py"} == {
+        k: v for k, v in expected().items() if k != "scenes/run.py"
+    }
+
+
+def test_without_zipfile_internals(export_dir, tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "ZIP_INTERNALS", ("_no_such_internal",))
+    zip_path: str = str(tmp_path / "scenes.zip")
+    build(export_dir, zip_path)
+    builder: ArchiveBuilder = build(export_dir, zip_path, update=True)
+
+    assert builder.reused == 0
+    assert read_back(zip_path) == expected()
+
+
+def test_member_order_follows_the_walk(export_dir, tmp_path):
+    zip_path: str = str(tmp_path / "scenes.zip")
+    build(export_dir, zip_path)
+
+    with zipfile.ZipFile(zip_path) as zf:
+        names: List[str] = zf.namelist()
+    assert names == ["scenes/README.txt"] + [
+        arcname for _, arcname in walk_export(export_dir, dir_excludes=[".pmx_cache"])
+    ]
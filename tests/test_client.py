@@ -0,0 +1,149 @@
+import threading
+import time
+from typing import Any, Dict, List
+
+import pytest
+import requests
+
+import client
+from client import BoostClient, TokenCache
+
+KEY = ("https://api.boostinsurance.io", "client-1")
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now: float = 1000.0
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    fake: FakeClock = FakeClock()
+    monkeypatch.setattr(client, "time", fake)
+    return fake
+
+
+def issuer(lifetime: float = 300.0) -> Any:
+    """fetch() handing out token-1, token-2, ... and counting its calls"""
+    issued: List[str] = []
+
+    def fetch() -> Dict[str, Any]:
+        issued.append(f"token-{len(issued) + 1}")
+        return {"access_token": issued[-1], "expires_in": lifetime}
+
+    fetch.issued = issued  # type: ignore
+    return fetch
+
+
+def test_token_reused_until_close_to_expiring(clock):
+    cache: TokenCache = TokenCache(refresh_margin=60)
+    fetch: Any = issuer(lifetime=300)
+
+    assert cache.get(KEY, fetch) == "token-1"
+    clock.now += 239
+    assert cache.get(KEY, fetch) == "token-1"
+    clock.now += 1
+    assert cache.get(KEY, fetch) == "token-2"
+    assert cache.fetched == 2
+
+
+def test_stale_token_refreshed_once(clock):
+    cache: TokenCache = TokenCache()
+    fetch: Any = issuer()
+    cache.get(KEY, fetch)
+
+    # the first to be told token-1 is stale refetches, later ones get its token
+    assert cache.get(KEY, fetch, stale="token-1") == "token-2"
+    assert cache.get(KEY, fetch, stale="token-1") == "token-2"
+    assert cache.cached(KEY, stale="token-2") is None
+    assert fetch.issued == ["token-1", "token-2"]
+
+
+def test_concurrent_refreshes_fetch_once():
+    cache: TokenCache = TokenCache()
+    calls: List[int] = []
+
+    def fetch() -> Dict[str, Any]:
+        calls.append(1)
+        time.sleep(0.2)
+        return {"access_token": "token-1", "expires_in": 300}
+
+    tokens: List[str] = []
+    threads: List[threading.Thread] = [
+        threading.Thread(target=lambda: tokens.append(cache.get(KEY, fetch)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert tokens == ["token-1"] * 8
+    assert len(calls) == 1
+
+
+def test_tokens_kept_on_disk_while_fresh(clock, tmp_path):
+    path: str = str(tmp_path / "tokens.json")
+    TokenCache(path).get(KEY, issuer(lifetime=300))
+
+    assert TokenCache(path).cached(KEY) == "token-1"
+    clock.now += 300
+    assert TokenCache(path).tokens == {}
+
+
+class StubClient(BoostClient):
+    """BoostClient whose requests never leave the process
+
+    The api only takes the latest token handed out, as if the others expired,
+    and holds back rejections until every client has been rejected.
+    """
+
+    def __init__(self, tokens: Any, rejected: threading.Barrier) -> None:
+        self.fetch: Any = tokens
+        self.rejected: threading.Barrier = rejected
+        self.sent: List[str] = []
+        super().__init__(
+            BOOST_URL=KEY[0], BOOST_USER="user", CLIENT_ID=KEY[1], save_responses=False
+        )
+
+    def _fetch_token(self) -> Dict[str, Any]:
+        return self.fetch()
+
+    def _send(
+        self, method: str, url: str, greek: str = str(), **kwargs
+    ) -> requests.Response:
+        token: str = kwargs["headers"]["Authorization"].split()[-1]
+        self.sent.append(token)
+        response: requests.Response = requests.Response()
+        response.status_code = 200
+        if token != self.fetch.issued[-1]:
+            self.rejected.wait()
+            response.status_code = 401
+        return response
+
+
+def test_clients_share_one_refresh_of_a_rejected_token(monkeypatch):
+    monkeypatch.setattr(client, "TOKENS", TokenCache())
+    fetch: Any = issuer()
+    rejected: threading.Barrier = threading.Barrier(2, timeout=5)
+    clients: List[StubClient] = [StubClient(fetch, rejected) for _ in range(2)]
+    # the api stops taking token-1
+    fetch()
+
+    statuses: List[int] = []
+    threads: List[threading.Thread] = [
+        threading.Thread(target=lambda i=i: statuses.append(i.get("/q").status_code))
+        for i in clients
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert statuses == [200, 200]
+    assert [i.sent for i in clients] == [["token-1", "token-3"]] * 2
+    # both were told token-1 is stale, but only one of them fetched
+    assert fetch.issued == ["token-1", "token-2", "token-3"]
@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+from typing import Any, Dict, List, Sequence
+
+from pmx_.pm.collection import Collection
+
+
+def request(
+    name: str,
+    method: str = "GET",
+    reads: Sequence[str] = (),
+    writes: Sequence[str] = (),
+) -> Any:
+    return SimpleNamespace(
+        normal_name=name,
+        greek="alpha",
+        method=method,
+        reads=list(reads),
+        writes=list(writes),
+        boost_user_key=str(),
+    )
+
+
+def dependencies(*requests: Any) -> Dict[str, List[str]]:
+    collection: Any = SimpleNamespace(requests=list(requests), boost_user_key="u")
+    return Collection.dependencies(collection)
+
+
+def test_independent_gets_wait_for_nothing():
+    assert dependencies(
+        request("a", reads=["x"]), request("b", reads=["x"]), request("c")
+    ) == {"a_alpha": [], "b_alpha": [], "c_alpha": []}
+
+
+def test_anything_but_a_get_is_a_barrier():
+    assert dependencies(
+        request("a"),
+        request("b"),
+        request("c", "POST"),
+        request("d"),
+        request("e", "DELETE"),
+    ) == {
+        "a_alpha": [],
+        "b_alpha": [],
+        "c_alpha": ["a_alpha", "b_alpha"],
+        # everything before c is waited for through it
+        "d_alpha": ["c_alpha"],
+        "e_alpha": ["d_alpha"],
+    }
+
+
+def test_read_after_write():
+    assert dependencies(
+        request("a", writes=["quote_id"]),
+        request("b", reads=["policy_id"]),
+        request("c", reads=["quote_id"]),
+    ) == {"a_alpha": [], "b_alpha": [], "c_alpha": ["a_alpha"]}
+
+
+def test_write_after_read_and_write():
+    assert dependencies(
+        request("a", reads=["quote_id"]),
+        request("b", writes=["policy_id"]),
+        request("c", writes=["quote_id"]),
+        request("d", writes=["policy_id"]),
+    ) == {
+        "a_alpha": [],
+        "b_alpha": [],
+        "c_alpha": ["a_alpha"],
+        "d_alpha": ["b_alpha"],
+    }
+
+
+def test_implied_waits_are_left_out():
+    assert dependencies(
+        request("a", writes=["x"]),
+        request("b", reads=["x"], writes=["y"]),
+        request("c", reads=["x", "y"]),
+    ) == {"a_alpha": [], "b_alpha": ["a_alpha"], "c_alpha": ["b_alpha"]}
+
+
+def test_other_users_switch_the_boost_user():
+    other: Any = request("b")
+    other.boost_user_key = "admin"
+
+    assert dependencies(request("a", reads=["BOOST_USER"]), other, request("c"))[
+        "b_alpha"
+    ] == ["a_alpha"]
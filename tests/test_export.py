@@ -0,0 +1,152 @@
+import json
+import os
+import types
+from typing import Any, Dict, List
+
+import pytest
+
+from pmx_ import main
+from pmx_.manifest import MANIFEST_FILE
+from pmx_.stream import JsonStream, iter_collection
+
+TEST_SCRIPT: List[str] = [
+    "var jsonData = pm.response.json();",
+    'pm.environment.set("quote_id", jsonData.data.id);',
+]
+
+
+def request(name: str, method: str = "GET", body: str = str()) -> Dict[str, Any]:
+    result: Dict[str, Any] = {
+        "name": name,
+        "request": {
+            "method": method,
+            "header": [{"key": "BOOST-USER", "value": "{{boost_user}}"}],
+            "url": {"raw": "{{BOOST_URL}}/quotes/{{quote_id}}"},
+        },
+        "event": [
+            {
+                "listen": "test",
+                "script": {"exec": TEST_SCRIPT, "type": "text/javascript"},
+            }
+        ],
+        "response": [{"name": "example", "body": "x" * 100}],
+    }
+    if body:
+        result["request"]["body"] = {"mode": "raw", "raw": body}
+    return result
+
+
+def folder(name: str, items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"name": name, "item": items}
+
+
+def collection() -> Dict[str, Any]:
+    escaped: str = json.dumps(
+        {"note": 'a "quoted" \\ back\\slash, tab\t, newline\n and café ☃'}
+    )
+    return {
+        "collection": {
+            "info": {"name": "Policies"},
+            "item": [
+                folder(
+                    "Quotes",
+                    [
+                        request("Create quote", "POST", escaped),
+                        folder("Renewal", [request("Get quote")]),
+                    ],
+                ),
+                folder("Policies", [request("Get policy")]),
+            ],
+            "variable": [{"key": "boost_user", "value": "user\\one"}],
+        }
+    }
+
+
+def export(workspace: str, document: Dict[str, Any], *args: str) -> None:
+    source: str = os.path.join(os.path.dirname(workspace), "collection.json")
+    os.makedirs(os.path.dirname(source), exist_ok=True)
+    with open(source, "w") as writer:
+        json.dump(document, writer)
+    main.export.main(
+        ["-d", workspace, "--from-file", source, *args], standalone_mode=False
+    )
+
+
+def tree(workspace: str) -> Dict[str, bytes]:
+    """Every generated file by path, leaving out caches and the manifest"""
+    result: Dict[str, bytes] = {}
+    for directory, dirs, files in os.walk(workspace):
+        dirs[:] = [i for i in dirs if not i.startswith(".") and i != "__pycache__"]
+        for name in files:
+            if name == MANIFEST_FILE:
+                continue
+            path: str = os.path.join(directory, name)
+            with open(path, "rb") as reader:
+                result[os.path.relpath(path, workspace)] = reader.read()
+    return result
+
+
+def materialize(value: Any) -> Any:
+    """value with the stream's lazy item generators read into lists"""
+    if isinstance(value, dict):
+        items: Any = value.pop("item", None)
+        if items is not None:
+            value["item"] = [materialize(i) for i in items]
+        return {k: materialize(v) for k, v in value.items()}
+    if isinstance(value, (list, types.GeneratorType)):
+        return [materialize(i) for i in value]
+    return value
+
+
+def without_responses(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {k: without_responses(v) for k, v in value.items() if k != "response"}
+    if isinstance(value, list):
+        return [without_responses(i) for i in value]
+    return value
+
+
+@pytest.mark.parametrize("chunk_size", [7, 64, 1 << 16])
+def test_stream_reads_what_json_load_does(tmp_path, chunk_size):
+    path: str = str(tmp_path / "collection.json")
+    with open(path, "w") as writer:
+        json.dump(collection(), writer, indent=2)
+
+    with open(path) as reader:
+        streamed: Dict[str, Any] = {
+            key: materialize(value)
+            for key, value in iter_collection(JsonStream(reader, chunk_size))
+        }
+
+    assert streamed == without_responses(collection()["collection"])
+
+
+def test_stream_export_is_byte_identical(tmp_path):
+    export(str(tmp_path / "loaded" / "scenes"), collection())
+    export(str(tmp_path / "streamed" / "scenes"), collection(), "--stream")
+
+    loaded: Dict[str, bytes] = tree(str(tmp_path / "loaded" / "scenes"))
+    assert "quotes/renewal/base.py" in loaded
+    assert tree(str(tmp_path / "streamed" / "scenes")) == loaded
+
+
+def test_reexport_rewrites_only_changed_namespaces(tmp_path):
+    workspace: str = str(tmp_path / "scenes")
+    document: Dict[str, Any] = collection()
+    export(workspace, document)
+    with open(os.path.join(workspace, MANIFEST_FILE)) as reader:
+        namespaces: Dict[str, Any] = json.load(reader)["namespaces"]
+    outputs: List[str] = [i for entry in namespaces.values() for i in entry["outputs"]]
+    for path in outputs:
+        os.utime(os.path.join(workspace, path), (0, 0))
+
+    renewal: Dict[str, Any] = document["collection"]["item"][0]["item"][1]
+    renewal["item"].append(request("Get renewal"))
+    export(workspace, document)
+
+    rewritten: List[str] = sorted(
+        i for i in outputs if os.path.getmtime(os.path.join(workspace, i)) != 0
+    )
+    renewal_dir: str = namespaces["quotes.renewal"]["dir"]
+    assert rewritten == sorted(namespaces["quotes.renewal"]["outputs"])
+    assert all(i.startswith(renewal_dir + os.sep) for i in rewritten)
@@ -0,0 +1,192 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Tuple
+
+import pytest
+
+from pmx_ import main
+from pmx_.fetch import FetchError, PostmanFetcher
+
+COLLECTION: Dict[str, Any] = {
+    "collection": {"info": {"name": "Policies"}, "item": [], "variable": []}
+}
+ENVIRONMENT: Dict[str, Any] = {
+    "environment": {
+        "name": "local",
+        "values": [
+            {"key": "host", "value": "localhost", "enabled": True},
+            {"key": "api_key", "value": "secret", "enabled": True},
+        ],
+    }
+}
+
+
+class PostmanStandIn(ThreadingHTTPServer):
+    """Serves documents by path with an ETag, remembering every request"""
+
+    daemon_threads = True
+
+    def __init__(self, documents: Dict[str, bytes], delay: float = 0.0) -> None:
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.documents: Dict[str, bytes] = documents
+        self.delay: float = delay
+        # (path, If-None-Match) of each request
+        self.requests: List[Tuple[str, str]] = []
+        self.active: int = 0
+        self.most_active: int = 0
+        self.lock: threading.Lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class Handler(BaseHTTPRequestHandler):
+    server: PostmanStandIn
+
+    def do_GET(self) -> None:
+        server: PostmanStandIn = self.server
+        with server.lock:
+            server.requests.append((self.path, self.headers.get("If-None-Match", "")))
+            server.active += 1
+            server.most_active = max(server.most_active, server.active)
+        try:
+            time.sleep(server.delay)
+            body: bytes = server.documents.get(self.path.lstrip("/"), b"")
+            if not body:
+                self.send_response(404)
+                self.end_headers()
+                return
+            etag: str = f'"{len(body)}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+def serve(documents: Dict[str, bytes], delay: float = 0.0) -> PostmanStandIn:
+    server: PostmanStandIn = PostmanStandIn(documents, delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def postman() -> Iterator[PostmanStandIn]:
+    server: PostmanStandIn = serve(
+        {
+            "collections/c-1": json.dumps(COLLECTION).encode(),
+            "environments/e-1": json.dumps(ENVIRONMENT).encode(),
+        },
+        delay=0.3,
+    )
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def read_json(path: str) -> Any:
+    with open(path) as reader:
+        return json.load(reader)
+
+
+def test_collection_and_environment_fetched_concurrently(postman, tmp_path):
+    main.setup_workspace(
+        str(tmp_path), "c-1", "e-1", api_url=postman.url, runtime=False
+    )
+
+    assert read_json(tmp_path / "collection.json") == COLLECTION
+    assert [i["key"] for i in read_json(tmp_path / "vars" / "env.local.json")] == [
+        "api_key",
+        "host",
+    ]
+    assert sorted(i[0] for i in postman.requests) == [
+        "/collections/c-1",
+        "/environments/e-1",
+    ]
+    assert postman.most_active == 2
+
+
+def test_unchanged_documents_revalidated_from_cache(postman, tmp_path):
+    cache_dir: str = str(tmp_path / "cache")
+    for _ in range(2):
+        fetcher: PostmanFetcher = PostmanFetcher(
+            api_url=postman.url, cache_dir=cache_dir
+        )
+        assert json.loads(fetcher.get("collections/c-1")) == COLLECTION
+        fetcher.close()
+
+    assert postman.requests == [
+        ("/collections/c-1", ""),
+        ("/collections/c-1", f'"{len(json.dumps(COLLECTION))}"'),
+    ]
+
+
+def test_offline_reads_the_cache_only(postman, tmp_path):
+    cache_dir: str = str(tmp_path / "cache")
+    online: PostmanFetcher = PostmanFetcher(api_url=postman.url, cache_dir=cache_dir)
+    online.get("collections/c-1")
+    online.close()
+
+    offline: PostmanFetcher = PostmanFetcher(
+        api_url=postman.url, cache_dir=cache_dir, offline=True
+    )
+    assert json.loads(offline.get("collections/c-1")) == COLLECTION
+    with pytest.raises(FetchError, match="isn't cached"):
+        offline.get("environments/e-1")
+    offline.close()
+
+    assert len(postman.requests) == 1
+
+
+def test_offline_export_without_cache_bugs_out(postman, tmp_path):
+    with pytest.raises(SystemExit):
+        main.setup_workspace(
+            str(tmp_path),
+            "c-1",
+            None,
+            offline=True,
+            api_url=postman.url,
+            runtime=False,
+        )
+    assert postman.requests == []
+
+
+def test_from_files_fetch_nothing(postman, tmp_path):
+    collection_file: str = str(tmp_path / "exported.json")
+    env_file: str = str(tmp_path / "exported_env.json")
+    with open(collection_file, "w") as writer:
+        # as exported from the postman app, without the api envelope
+        json.dump(COLLECTION["collection"], writer)
+    with open(env_file, "w") as writer:
+        json.dump(ENVIRONMENT["environment"], writer)
+
+    workspace: str = str(tmp_path / "workspace")
+    main.setup_workspace(
+        workspace,
+        None,
+        None,
+        from_file=collection_file,
+        env_file=env_file,
+        api_url=postman.url,
+        runtime=False,
+    )
+
+    assert read_json(os.path.join(workspace, "collection.json")) == COLLECTION
+    assert read_json(os.path.join(workspace, "vars", "env.local.json")) == sorted(
+        ENVIRONMENT["environment"]["values"], key=lambda i: i["key"]
+    )
+    assert postman.requests == []
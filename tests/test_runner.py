@@ -0,0 +1,112 @@
+import json
+import os
+import sys
+from typing import Any, Dict, List
+
+import click
+import pytest
+
+import runner
+
+NAMESPACES: List[str] = ["ns_a", "ns_b", "ns_c", "ns_d", "ns_e"]
+HISTORY: Dict[str, Dict[str, Any]] = {
+    "ns_a": {"expected": 5.0, "last": 5.0, "runs": 3},
+    "ns_b": {"expected": 1.0, "last": 1.0, "runs": 3},
+    "ns_c": {"expected": 3.0, "last": 3.0, "runs": 3},
+    "ns_d": {"expected": 2.0, "last": 2.0, "runs": 3},
+}
+
+
+@pytest.fixture
+def project(tmp_path, monkeypatch) -> str:
+    """An exported project's namespaces, each with scenarios whose tous passes"""
+    for namespace in NAMESPACES:
+        package = tmp_path / namespace
+        package.mkdir()
+        (package / "__init__.py").write_text("")
+        (package / "scenarios.py").write_text(
+            f"def tous():\n    return {namespace!r}\n"
+        )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(runner, "THIS_DIR", str(tmp_path))
+    monkeypatch.setattr(runner, "RESULTS_DIR", str(tmp_path / ".pmx_results"))
+    monkeypatch.setattr(runner, "HISTORY_FILE", str(tmp_path / ".pmx_history.json"))
+    with open(tmp_path / ".pmx_history.json", "w") as writer:
+        json.dump(HISTORY, writer, indent=2, sort_keys=True)
+    return str(tmp_path)
+
+
+def run(monkeypatch, *args: str) -> None:
+    monkeypatch.setattr(sys, "argv", ["run.py", *args])
+    with pytest.raises(SystemExit) as exited:
+        runner.main(NAMESPACES)
+    assert exited.value.code == 0
+
+
+def read_json(path: str) -> Any:
+    with open(path) as reader:
+        return json.load(reader)
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 5, 7])
+def test_shards_cover_every_namespace_once(count):
+    expected: Dict[str, float] = runner.expected_durations(NAMESPACES, HISTORY)
+    shards: List[List[str]] = [
+        runner.select_shard(NAMESPACES, i, count, expected) for i in range(1, count + 1)
+    ]
+
+    assert sorted(i for shard in shards for i in shard) == NAMESPACES
+    # the split is the same every time it's worked out from the same history
+    assert shards == runner.partition(NAMESPACES, expected, count)
+
+
+def test_shards_balance_expected_time():
+    expected: Dict[str, float] = runner.expected_durations(NAMESPACES, HISTORY)
+
+    # ns_e was never run, so it's expected to take the median of the rest
+    assert expected["ns_e"] == 2.5
+    assert runner.partition(NAMESPACES, expected, 2) == [
+        ["ns_a", "ns_d"],
+        ["ns_c", "ns_e", "ns_b"],
+    ]
+
+
+def test_merge_rejects_mixed_shard_counts(tmp_path):
+    paths: List[str] = []
+    for shard in ("1/2", "2/2", "1/3"):
+        path: str = str(tmp_path / f"shard-{shard.replace('/', '-of-')}.json")
+        runner.write_results(path, {"shard": shard, "wall": 1.0, "namespaces": []})
+        paths.append(path)
+
+    assert runner.merge_results(paths[:2], NAMESPACES)["missing"] == NAMESPACES
+    with pytest.raises(click.ClickException, match="split 2 and 3 ways"):
+        runner.merge_results(paths, NAMESPACES)
+
+
+def test_sharded_runs_leave_the_history_alone(project, monkeypatch):
+    history_path: str = os.path.join(project, ".pmx_history.json")
+    with open(history_path) as reader:
+        before: str = reader.read()
+
+    for index in (1, 2):
+        run(monkeypatch, "--shard", f"{index}/2")
+
+    with open(history_path) as reader:
+        assert reader.read() == before
+    results: str = os.path.join(project, ".pmx_results")
+    report: Dict[str, Any] = runner.merge_results(
+        runner.latest_shards(results), NAMESPACES
+    )
+    assert report["passed"] == NAMESPACES
+    assert report["missing"] == []
+
+
+def test_unsharded_runs_update_the_history(project, monkeypatch):
+    run(monkeypatch)
+
+    history: Dict[str, Dict[str, Any]] = read_json(
+        os.path.join(project, ".pmx_history.json")
+    )
+    assert sorted(history) == NAMESPACES
+    assert history["ns_a"]["runs"] == 4
+    assert history["ns_e"]["runs"] == 1
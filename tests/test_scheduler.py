@@ -0,0 +1,130 @@
+import asyncio
+import threading
+import time
+from typing import Any, Callable, Dict, List, Sequence
+
+import pytest
+
+from scheduler import arun_graph, run_graph
+
+# b and c read what a writes, d waits for both
+DEPENDENCIES: Dict[str, Sequence[str]] = {
+    "a": [],
+    "b": ["a"],
+    "c": ["a"],
+    "d": ["b", "c"],
+}
+
+
+class Failed(Exception):
+    pass
+
+
+def recording(log: List[str], name: str, delay: float = 0.0) -> Callable[[], None]:
+    def fn() -> None:
+        log.append(f"{name} started")
+        time.sleep(delay)
+        log.append(f"{name} done")
+
+    return fn
+
+
+def test_dependencies_finish_first():
+    log: List[str] = []
+    run_graph(DEPENDENCIES, {i: recording(log, i, 0.01) for i in DEPENDENCIES})
+
+    assert log.index("a done") < log.index("b started")
+    assert log.index("a done") < log.index("c started")
+    assert log.index("b done") < log.index("d started")
+    assert log.index("c done") < log.index("d started")
+
+
+def test_independent_ones_run_at_once():
+    # b and c only get past the barrier if they run at the same time
+    barrier: threading.Barrier = threading.Barrier(2, timeout=5)
+    functions: Dict[str, Any] = {i: lambda: None for i in DEPENDENCIES}
+    functions["b"] = functions["c"] = barrier.wait
+
+    run_graph(DEPENDENCIES, functions, workers=2)
+
+
+def test_failure_stops_the_rest_and_is_raised():
+    log: List[str] = []
+    functions: Dict[str, Any] = {i: recording(log, i) for i in DEPENDENCIES}
+    functions["c"] = recording(log, "c", 0.2)
+
+    def fail() -> None:
+        log.append("b started")
+        raise Failed("b")
+
+    functions["b"] = fail
+
+    with pytest.raises(Failed, match="b"):
+        run_graph(DEPENDENCIES, functions)
+    # c was already running, so it's waited for; d never starts
+    assert "c done" in log
+    assert "d started" not in log
+
+
+def test_first_failure_wins():
+    def fail(name: str) -> Callable[[], None]:
+        def fn() -> None:
+            time.sleep(0.1 if name == "c" else 0.0)
+            raise Failed(name)
+
+        return fn
+
+    functions: Dict[str, Any] = {i: fail(i) for i in DEPENDENCIES}
+    functions["a"] = lambda: None
+
+    with pytest.raises(Failed, match="b"):
+        run_graph(DEPENDENCIES, functions)
+
+
+def arecording(log: List[str], name: str, delay: float = 0.0) -> Callable:
+    async def fn() -> None:
+        log.append(f"{name} started")
+        await asyncio.sleep(delay)
+        log.append(f"{name} done")
+
+    return fn
+
+
+def test_async_dependencies_finish_first():
+    log: List[str] = []
+    asyncio.run(
+        arun_graph(DEPENDENCIES, {i: arecording(log, i, 0.01) for i in DEPENDENCIES})
+    )
+
+    assert log[:3] == ["a started", "a done", "b started"]
+    assert log.index("c started") < log.index("b done")
+    assert log[-2:] == ["d started", "d done"]
+
+
+def test_async_workers_bound_tasks_in_flight():
+    log: List[str] = []
+    asyncio.run(
+        arun_graph(
+            DEPENDENCIES,
+            {i: arecording(log, i, 0.01) for i in DEPENDENCIES},
+            workers=1,
+        )
+    )
+
+    assert log == [f"{i} {j}" for i in "abcd" for j in ("started", "done")]
+
+
+def test_async_failure_stops_the_rest_and_is_raised():
+    log: List[str] = []
+    functions: Dict[str, Any] = {i: arecording(log, i) for i in DEPENDENCIES}
+    functions["c"] = arecording(log, "c", 0.1)
+
+    async def fail() -> None:
+        raise Failed("b")
+
+    functions["b"] = fail
+
+    with pytest.raises(Failed, match="b"):
+        asyncio.run(arun_graph(DEPENDENCIES, functions))
+    assert "c done" in log
+    assert "d started" not in log
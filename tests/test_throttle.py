@@ -0,0 +1,190 @@
+import email.utils
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import pytest
+import requests
+
+import throttle
+from throttle import MAX_BACKOFF, Throttle, TokenBucket, retry_after
+
+HOST: str = "http://api.example.com/policies"
+
+
+class FakeClock:
+    """time for the throttle, only moving when it sleeps"""
+
+    def __init__(self) -> None:
+        self.now: float = 1000.0
+        self.slept: List[float] = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    fake: FakeClock = FakeClock()
+    monkeypatch.setattr(throttle, "time", fake)
+    return fake
+
+
+def response(
+    status: int, headers: Optional[Dict[str, str]] = None
+) -> requests.Response:
+    result: requests.Response = requests.Response()
+    result.status_code = status
+    result.headers.update(headers or {})
+    return result
+
+
+def test_bucket_spends_its_burst_then_paces(clock):
+    bucket: TokenBucket = TokenBucket(rate=10, burst=2)
+
+    waits: List[float] = [bucket.reserve() for _ in range(4)]
+
+    assert waits == pytest.approx([0.0, 0.0, 0.1, 0.2])
+
+
+def test_bucket_refills_at_its_rate(clock):
+    bucket: TokenBucket = TokenBucket(rate=10, burst=2)
+    for _ in range(2):
+        bucket.reserve()
+
+    clock.now += 0.1
+    assert bucket.reserve() == 0.0
+    # never more than burst saved up
+    clock.now += 10
+    assert [bucket.reserve() for _ in range(3)] == pytest.approx([0.0, 0.0, 0.1])
+
+
+def test_acquire_sleeps_out_the_wait(clock):
+    bucket: TokenBucket = TokenBucket(rate=4, burst=1)
+
+    for _ in range(3):
+        bucket.acquire()
+
+    assert clock.slept == pytest.approx([0.25, 0.25])
+
+
+def test_no_rate_never_waits(clock):
+    bucket: TokenBucket = TokenBucket(rate=0)
+
+    assert [bucket.reserve() for _ in range(100)] == [0.0] * 100
+
+
+def test_pause_holds_and_slows_down(clock):
+    bucket: TokenBucket = TokenBucket(rate=16, burst=1)
+
+    bucket.pause(2.0)
+    assert bucket.reserve() == pytest.approx(2.0)
+    assert bucket.rate == 8
+    for _ in range(10):
+        bucket.pause(0.0)
+    # never below a sixteenth of the configured rate
+    assert bucket.rate == 1
+
+    for _ in range(30):
+        bucket.recover()
+    assert bucket.rate == 16
+
+
+def test_pause_holds_a_bucket_without_rate(clock):
+    bucket: TokenBucket = TokenBucket(rate=0)
+
+    bucket.pause(1.5)
+
+    assert bucket.reserve() == pytest.approx(1.5)
+    assert bucket.rate == 0
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("3", 3.0), (" 1.5 ", 1.5), ("-2", 0.0), ("soon", None), ("", None)],
+)
+def test_retry_after_in_seconds(value, expected):
+    headers: Dict[str, str] = {"Retry-After": value} if value else {}
+
+    assert retry_after(response(429, headers)) == expected
+
+
+def test_retry_after_as_an_http_date():
+    later: datetime = datetime.now(timezone.utc) + timedelta(seconds=30)
+    earlier: datetime = datetime.now(timezone.utc) - timedelta(seconds=30)
+
+    assert retry_after(
+        response(503, {"Retry-After": email.utils.format_datetime(later, True)})
+    ) == pytest.approx(30, abs=2)
+    assert (
+        retry_after(
+            response(503, {"Retry-After": email.utils.format_datetime(earlier, True)})
+        )
+        == 0.0
+    )
+
+
+def test_backoff_waits_for_retry_after(clock):
+    limiter: Throttle = Throttle(host_rate=0)
+
+    assert limiter.backoff(HOST, response(429, {"Retry-After": "5"}), 0)
+    assert limiter.host(HOST).reserve() == pytest.approx(5.0)
+    assert limiter.backoff(HOST, response(503, {"Retry-After": "600"}), 0)
+    assert limiter.host(HOST).reserve() == pytest.approx(MAX_BACKOFF)
+
+
+def test_backoff_doubles_without_retry_after(clock):
+    limiter: Throttle = Throttle(host_rate=0)
+
+    for attempt, delay in enumerate([0.5, 1.0, 2.0]):
+        assert limiter.backoff(HOST, response(429), attempt)
+        assert limiter.host(HOST).reserve() == pytest.approx(delay)
+    # out of retries
+    assert not limiter.backoff(HOST, response(429), 3)
+
+
+def test_backoff_ignores_other_statuses(clock):
+    limiter: Throttle = Throttle()
+
+    assert not limiter.backoff(HOST, response(500, {"Retry-After": "5"}), 0)
+    assert not limiter.backoff(HOST, response(200), 0)
+
+
+def test_disabled_only_waits_for_retry_after(clock):
+    limiter: Throttle = Throttle(rate=1, host_rate=1, enabled=False)
+
+    assert limiter.backoff(HOST, response(429), 0)
+    assert limiter.host(HOST).reserve() == 0.0
+    assert limiter.backoff(HOST, response(429, {"Retry-After": "2"}), 1)
+    assert limiter.host(HOST).reserve() == pytest.approx(2.0)
+
+
+def test_send_retries_while_asked_to_back_off(clock):
+    limiter: Throttle = Throttle(host_rate=0)
+    responses: List[requests.Response] = [
+        response(429, {"Retry-After": "1"}),
+        response(503, {"Retry-After": "2"}),
+        response(200),
+    ]
+
+    assert limiter.send(lambda: responses.pop(0), HOST).status_code == 200
+    assert clock.slept == pytest.approx([1.0, 2.0])
+    assert limiter.waited == pytest.approx(3.0)
+
+
+def test_send_gives_up_after_its_retries(clock):
+    limiter: Throttle = Throttle(host_rate=0, retries=2)
+    sent: List[int] = []
+
+    def send() -> requests.Response:
+        sent.append(1)
+        return response(429, {"Retry-After": "0"})
+
+    assert limiter.send(send, HOST).status_code == 429
+    assert len(sent) == 3